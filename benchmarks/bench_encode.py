@@ -0,0 +1,71 @@
+"""
+Micro-benchmark of PlantUML text encoding
+
+It checks that the output is byte-identical to the previous encoder and
+compares the time.
+
+Run from the top directory: python benchmarks/bench_encode.py
+"""
+import os
+import sys
+import zlib
+import base64
+import string
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from napkin.gen_plantuml_img import _encode_text_diagram, encode_many  # noqa
+
+_LEGACY_BASE64_TO_PLANTUML = {ord(b): b2.encode() for b, b2 in zip(
+    string.ascii_uppercase + string.ascii_lowercase + string.digits + '+/=',
+    string.digits + string.ascii_uppercase + string.ascii_lowercase + '-_=')}
+
+
+def legacy_encode_text_diagram(text_diagram):
+    """
+    Encoder before the rework, kept as the reference.
+    """
+    compressed = zlib.compress(text_diagram.encode('utf-8'))[2:-4]
+    b64_encoded = base64.b64encode(compressed)
+    return b''.join(_LEGACY_BASE64_TO_PLANTUML[b] for b in b64_encoded)
+
+
+def make_script(num_calls):
+    lines = ['@startuml']
+    lines += ['participant p{}'.format(i) for i in range(20)]
+    for i in range(num_calls):
+        lines.append('p{} -> p{} : func{}(arg{}, key=value)'.format(
+            i % 20, (i * 7) % 20, i, i % 13))
+        lines.append('activate p{}'.format((i * 7) % 20))
+        lines.append('deactivate p{}'.format((i * 7) % 20))
+    lines.append('@enduml\n')
+    return '\n'.join(lines)
+
+
+def main():
+    scripts = [make_script(n) for n in (0, 1, 10, 100, 1000, 4000)]
+    scripts.append('@startuml\nAlice -> Bob : こんにちは\n'
+                   '@enduml\n')
+    for script in scripts:
+        assert _encode_text_diagram(script) == (
+            legacy_encode_text_diagram(script)), 'Output differs'
+    assert encode_many(scripts) == [legacy_encode_text_diagram(s)
+                                    for s in scripts]
+    print('Output is byte-identical for {} scripts'.format(len(scripts)))
+
+    for script in scripts[2:6]:
+        number = max(1, 2000000 // len(script))
+        legacy = min(timeit.repeat(
+            lambda: legacy_encode_text_diagram(script),
+            number=number, repeat=3)) / number
+        new = min(timeit.repeat(
+            lambda: _encode_text_diagram(script),
+            number=number, repeat=3)) / number
+        print('{:8d} bytes: legacy {:9.1f} us, new {:9.1f} us, '
+              'x{:.1f}'.format(len(script), legacy * 1e6, new * 1e6,
+                               legacy / new))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Benchmark of PlantUML script generation throughput
+
+Run from the top directory: python benchmarks/bench_gen_script.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from napkin import sd  # noqa
+from napkin import gen_plantuml  # noqa
+
+
+def make_diagram(num_loops):
+    def f(c):
+        objs = [c.object('obj{}'.format(i)) for i in range(10)]
+        with objs[0]:
+            for i in range(num_loops):
+                with c.loop('i < {}'.format(i)):
+                    with objs[1].func(i, key='value'):
+                        objs[2].func2().ret('value')
+                        with objs[3].func3():
+                            objs[4].func4().note('callee', 'caller')
+                            c.ret('ret')
+                with c.alt():
+                    with c.choice('ok'):
+                        objs[5].func5()
+                    with c.choice('not ok'):
+                        objs[6].func6()
+                c.note('note')
+    return f
+
+
+def main():
+    context = sd.parse(make_diagram(10000))
+    num_actions = len(context._sequence)
+    gen_plantuml._generate_script(context, '')
+
+    elapsed = min(_time(lambda: gen_plantuml._generate_script(context, ''))
+                  for _ in range(5))
+    print('{} actions: {:.3f} s, {:,.0f} actions/s'.format(
+        num_actions, elapsed, num_actions / elapsed))
+
+
+def _time(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    main()
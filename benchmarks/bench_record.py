@@ -0,0 +1,39 @@
+"""
+Benchmark of recording calls in sd.Context
+
+Run from the top directory: python benchmarks/bench_record.py [NUM_CALLS]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from napkin import sd  # noqa
+
+
+def record(num_calls):
+    c = sd.Context()
+    objs = [c.object('obj{}'.format(i)) for i in range(10)]
+    with objs[0]:
+        for i in range(num_calls // 4):
+            objs[1].func(i)
+            objs[2].func2(key=i).ret('value')
+            with objs[3].func3():
+                c.object('obj4').func4()
+    return c
+
+
+def main():
+    num_calls = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    elapsed = []
+    for _ in range(3):
+        start = time.perf_counter()
+        record(num_calls)
+        elapsed.append(time.perf_counter() - start)
+    print('{:,} calls: {:.3f} s, {:,.0f} calls/s'.format(
+        num_calls, min(elapsed), num_calls / min(elapsed)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Benchmark of the overhead of napkin.tracer
+
+The workload makes many calls of untraced functions and a few calls of the
+traced class, which is the common case of tracing a part of a service.
+
+Run from the top directory: python benchmarks/bench_tracer.py [NUM_REQUESTS]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from napkin import tracer  # noqa
+
+
+def untraced(i):
+    return i * 2
+
+
+class Handler:
+    def handle(self, i):
+        total = 0
+        for j in range(100):
+            total += untraced(j)
+        return self.store(total)
+
+    def store(self, value):
+        return value
+
+
+def workload(num_requests):
+    handler = Handler()
+    for i in range(num_requests):
+        handler.handle(i)
+
+
+def _time(fn):
+    elapsed = []
+    for _ in range(3):
+        start = time.perf_counter()
+        fn()
+        elapsed.append(time.perf_counter() - start)
+    return min(elapsed)
+
+
+def main():
+    num_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    baseline = _time(lambda: workload(num_requests))
+    print('{:32}: {:.3f} s'.format('no tracer', baseline))
+
+    backends = ['profile'] + (['monitoring'] if hasattr(sys, 'monitoring')
+                              else [])
+    cases = [('Handler', dict(targets=[Handler])),
+             ('Handler, sample 1/10', dict(targets=[Handler],
+                                           sample_every=10)),
+             ('whole module', dict(targets=[__name__]))]
+    for backend in backends:
+        for name, kwargs in cases:
+            def traced():
+                with tracer.Tracer(backend=backend, **kwargs):
+                    workload(num_requests)
+            elapsed = _time(traced)
+            print('{:32}: {:.3f} s, {:.2f}x'.format(
+                '{} ({})'.format(name, backend), elapsed, elapsed / baseline))
+
+
+if __name__ == '__main__':
+    main()
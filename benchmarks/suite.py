@@ -0,0 +1,217 @@
+"""
+Benchmark suite timing each phase of generating synthetic diagrams
+
+The phases are parse by sd.parse(), script by gen_plantuml, encode of the
+script for the server and render by ServerRenderer against a local stub
+server, so it runs offline. Long scripts are rendered by POST without
+encoding as the default of ServerRenderer.
+
+Run from the top directory:
+  python benchmarks/suite.py run [--save FILE] [--case NAME ...]
+  python benchmarks/suite.py compare BASELINE [CURRENT] [--threshold 0.1]
+
+'compare' runs the suite if CURRENT is not given and exits with 1 if any
+phase is slower than the baseline beyond the threshold.
+"""
+import os
+import sys
+import json
+import timeit
+import argparse
+import platform
+import tempfile
+import threading
+import collections
+import http.server
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import napkin  # noqa
+from napkin import sd  # noqa
+from napkin import gen_plantuml  # noqa
+from napkin import gen_plantuml_img  # noqa
+from napkin import transport  # noqa
+import synth  # noqa
+
+CASES = collections.OrderedDict([
+    ('small', dict(num_calls=100)),
+    ('medium', dict(num_calls=2000)),
+    ('large', dict(num_calls=20000)),
+    ('deep', dict(num_calls=2000, depth=20, fanout=1)),
+    ('wide', dict(num_calls=2000, num_participants=100)),
+    ('frags', dict(num_calls=2000, frag_every=2)),
+    ('notes', dict(num_calls=2000, note_every=1)),
+])
+PHASES = ('parse', 'script', 'encode', 'render')
+
+_IMAGE = b'\x89PNG\r\n\x1a\n' + b'\0' * 1024
+
+
+class _StubHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Not to wait for delayed ACK of the headers before the body.
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.do_GET()
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(_IMAGE)))
+        self.end_headers()
+        self.wfile.write(_IMAGE)
+
+    def log_message(self, *args):
+        pass
+
+
+def _start_stub_server():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _time(fn, repeat):
+    """
+    Return the best time of a call in seconds.
+    """
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def run_case(params, repeat, renderer, image_path):
+    """
+    Return the time of each phase for the synthetic diagram of params.
+    """
+    sd_func = synth.make_diagram(**params)
+    context = sd.parse(sd_func)
+    script = gen_plantuml._generate_script(context, '')
+
+    result = collections.OrderedDict()
+    result['parse'] = _time(lambda: sd.parse(sd_func), repeat)
+    result['script'] = _time(
+        lambda: gen_plantuml._generate_script(context, ''), repeat)
+    result['encode'] = _time(
+        lambda: gen_plantuml_img._encode_text_diagram(script), repeat)
+    result['render'] = _time(
+        lambda: renderer.render_to_file(script, 'png', image_path), repeat)
+    return result
+
+
+def run(case_names, repeat):
+    server = _start_stub_server()
+    renderer = gen_plantuml_img.ServerRenderer(
+        server_url='http://127.0.0.1:{}'.format(server.server_address[1]),
+        transport=transport.HttpTransport())
+    results = collections.OrderedDict()
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for name in case_names:
+                results[name] = run_case(CASES[name], repeat, renderer,
+                                         os.path.join(tmp_dir, 'out.png'))
+                _print_result(name, results[name])
+    finally:
+        server.shutdown()
+        server.server_close()
+    return {'napkin': napkin.__version__,
+            'python': platform.python_version(),
+            'results': results}
+
+
+def _format_time(t):
+    if t is None:
+        return '{:>13}'.format('n/a')
+    return '{:>10.3f} ms'.format(t * 1000)
+
+
+def _print_result(name, result):
+    print('{:8}'.format(name) +
+          ''.join(' {:>6}:{}'.format(p, _format_time(result[p]))
+                  for p in PHASES))
+
+
+def compare(baseline, current, threshold):
+    """
+    Print the ratio of each phase and return the regressions beyond
+    threshold.
+    """
+    regressions = []
+    for name, result in current['results'].items():
+        base_result = baseline['results'].get(name)
+        if not base_result:
+            continue
+        cells = []
+        for phase in PHASES:
+            base, cur = base_result.get(phase), result.get(phase)
+            if not base or not cur:
+                cells.append(' {:>6}:{:>8}'.format(phase, 'n/a'))
+                continue
+            ratio = cur / base
+            regressed = ratio > 1 + threshold
+            if regressed:
+                regressions.append((name, phase, ratio))
+            cells.append(' {:>6}:{:>7.2f}x{}'.format(
+                phase, ratio, '!' if regressed else ' '))
+        print('{:8}'.format(name) + ''.join(cells))
+    return regressions
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description='Napkin benchmark suite')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    def add_run_arguments(p):
+        p.add_argument('--case', action='append', choices=CASES.keys(),
+                       help='case to run. All if not given')
+        p.add_argument('--repeat', type=int, default=5,
+                       help='number of repeats to take the best (default: 5)')
+
+    run_parser = subparsers.add_parser('run', help='run the suite')
+    add_run_arguments(run_parser)
+    run_parser.add_argument('--save', metavar='FILE',
+                            help='save the result as JSON')
+
+    compare_parser = subparsers.add_parser(
+        'compare', help='compare with the baseline')
+    compare_parser.add_argument('baseline', help='baseline JSON')
+    compare_parser.add_argument(
+        'current', nargs='?',
+        help='JSON to compare. The suite is run if not given')
+    compare_parser.add_argument(
+        '--threshold', type=float, default=0.1,
+        help='ratio of slowdown to be flagged (default: 0.1)')
+    add_run_arguments(compare_parser)
+    return parser.parse_args()
+
+
+def main():
+    args = _parse_args()
+    if args.command == 'run':
+        result = run(args.case or list(CASES), args.repeat)
+        if args.save:
+            with open(args.save, 'wt') as f:
+                json.dump(result, f, indent=1)
+        return
+
+    with open(args.baseline, 'rt') as f:
+        baseline = json.load(f)
+    if args.current:
+        with open(args.current, 'rt') as f:
+            current = json.load(f)
+    else:
+        current = run(args.case or [name for name in baseline['results']
+                                    if name in CASES], args.repeat)
+        print()
+    regressions = compare(baseline, current, args.threshold)
+    for name, phase, ratio in regressions:
+        print('Regression: {} {} is {:.2f}x slower'.format(name, phase, ratio))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Synthetic diagrams for benchmarks
+
+The diagrams are deterministic for the same parameters, so the results of
+different runs are comparable.
+"""
+import itertools
+
+_FRAGS = ('opt', 'loop', 'alt')
+
+
+def make_diagram(num_calls=1000, depth=3, num_participants=10,
+                 frag_every=10, note_every=10, fanout=3):
+    """
+    Return a diagram function making num_calls calls among num_participants
+    objects.
+
+    Each call at the levels below 'depth' contains up to 'fanout' nested
+    calls. Every 'frag_every'th call is put in a fragment, cycling opt, loop
+    and alt, and every 'note_every'th call has notes. 0 disables them.
+    """
+    def sd_synth(c):
+        objs = [c.object('p{}'.format(i)) for i in range(num_participants)]
+        counter = itertools.count()
+
+        def next_call(level):
+            n = next(counter)
+            if n >= num_calls:
+                return False
+            if frag_every and n % frag_every == 0:
+                frag_call(n, level)
+            else:
+                call(n, level)
+            return True
+
+        def nested_calls(level):
+            for _ in range(fanout):
+                if not next_call(level):
+                    return
+
+        def call(n, level):
+            callee = objs[(n * 7 + level) % num_participants]
+            method_call = getattr(callee, 'func{}'.format(n % 20))(
+                n, key='value')
+            if note_every and n % note_every == 0:
+                method_call.note('callee {}'.format(n), 'caller {}'.format(n))
+            if level < depth:
+                with method_call:
+                    nested_calls(level + 1)
+                    c.ret('ret{}'.format(n))
+            else:
+                method_call.ret('ret{}'.format(n))
+
+        def frag_call(n, level):
+            frag = _FRAGS[(n // frag_every) % len(_FRAGS)]
+            if frag == 'alt':
+                with c.alt():
+                    with c.choice('n == {}'.format(n)):
+                        call(n, level)
+                    with c.choice('else'):
+                        objs[0].fallback()
+            else:
+                with getattr(c, frag)('n == {}'.format(n)):
+                    call(n, level)
+
+        with objs[0]:
+            while next_call(1):
+                pass
+    return sd_synth
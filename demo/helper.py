@@ -12,7 +12,7 @@ Following examples are auto-generated by
 [demo/{src_file}](demo/{src_file})
 
 """.format(title=title, src_file=src_file)
-    for diagram in napkin._collected_seq_diagrams:
+    for diagram in napkin.default_registry:
         text += """## {name}
 ![UML result image](images/{image_file})
 ```python
@@ -1,7 +1,16 @@
 import os
 import importlib
+import contextlib
+import functools
 import collections
+import multiprocessing
+import concurrent.futures
 from . import sd
+from . import gen_plantuml
+from . import manifest
+from . import stats
+from . import output_sink
+from .registry import Registry
 
 __version__ = '0.6.9'
 
@@ -14,7 +23,11 @@ SUPPORTED_FORMATS['plantuml_svg'] = 'PlantUML script and SVG image'
 SUPPORTED_FORMATS['plantuml_txt'] = 'PlantUML script and ASCII art text'
 DEFAULT_FORAMT = 'plantuml'
 
-_collected_seq_diagrams = []
+# Registry of the diagrams decorated without a registry.
+default_registry = Registry()
+
+# Diagrams of the running generate(), which forked workers refer to.
+_diagrams_to_generate = []
 
 
 class seq_diagram:
@@ -24,6 +37,9 @@ class seq_diagram:
     'diagram_name' is the file name for the generated . The name of
     decorated function will be used if not specified.
 
+    The diagram is registered to 'registry', Registry, or default_registry
+    if not given, replacing the diagram of the same name.
+
     ex:
     @napkin.seq_diagram()
     def sd_simple(c):
@@ -33,28 +49,333 @@ class seq_diagram:
     def foo(c):
        ...
     """
-    def __init__(self, name=None):
+    def __init__(self, name=None, registry=None):
         self.name = name
+        self.registry = registry
 
     def __call__(self, wrapped_func):
         if not self.name:
             self.name = wrapped_func.__name__
         self.sd_func = wrapped_func
-        _collected_seq_diagrams.append(self)
+        registry = (default_registry if self.registry is None else
+                    self.registry)
+        registry.register(self)
+
+
+@contextlib.contextmanager
+def registry_scope(registry):
+    """
+    Register the diagrams decorated without a registry in the block to
+    'registry' instead of default_registry, e.g. while running a script.
+    """
+    global default_registry
+    old_registry = default_registry
+    default_registry = registry
+    try:
+        yield registry
+    finally:
+        default_registry = old_registry
+
+
+def _parse_formats(output_format):
+    """
+    Return the list of the formats given as a list or comma separated.
+    """
+    if isinstance(output_format, str):
+        output_format = output_format.split(',')
+    output_formats = list(collections.OrderedDict.fromkeys(
+        f.strip() for f in output_format if f.strip()))
+    for f in output_formats:
+        if f not in SUPPORTED_FORMATS:
+            raise ValueError('Unsupported format : {}'.format(f))
+    return output_formats
+
+
+def _generate_formats(diagram_name, output_dir, context, options,
+                      output_formats, sink=None, scripts=None):
+    """
+    Generate the diagram in the formats to output_dir or 'sink' if given.
+    PlantUML formats share the script, which is generated and encoded once.
+    'scripts' is the result of gen_plantuml.generate_scripts() if already
+    generated.
+    """
+    if len(output_formats) == 1:
+        gen_module = importlib.import_module('.gen_' + output_formats[0],
+                                             'napkin')
+        return gen_module.generate(diagram_name, output_dir, context, options,
+                                   sink=sink, scripts=scripts)
+
+    from . import gen_plantuml_img
+    return gen_plantuml_img.generate_many(
+        diagram_name, output_dir, context, options,
+        _image_types(output_formats), sink, scripts)
 
 
-def generate(output_format=DEFAULT_FORAMT, output_dir='.', options=None):
+def _image_types(output_formats):
+    return [importlib.import_module('.gen_' + f, 'napkin').IMAGE_TYPE
+            for f in output_formats if f != 'plantuml']
+
+
+def _registered_diagrams(registry):
+    return default_registry if registry is None else registry
+
+
+def _generate_diagram(index, old_fingerprint, output_formats, output_dir,
+                      options, incremental, bundled):
     """
-    Generate sequence diagrams from all the decorated functions.
+    Generate the diagram at the given index of the diagrams to generate.
+
+    The index is used instead of the diagram itself since the decorated
+    functions are not always picklable, e.g. when defined by exec() in cli.
+    Worker processes are forked, so they see the same collected diagrams.
+
+    Return the generated files, the fingerprint, which is None unless
+    incremental and DiagramStats, which is None unless stats are enabled. The
+    generated files are None if the fingerprint is the same as
+    old_fingerprint.
+
+    If 'bundled', the files are generated in memory and returned as ordered
+    dict from the name to the contents for the caller to write them to its
+    sink in the order of the diagrams.
     """
-    if not os.path.exists(output_dir):
+    d = _diagrams_to_generate[index]
+    with stats.diagram(d.name) as diagram_stats:
+        with stats.phase('parse'):
+            context = sd.parse(d.sd_func)
+        new_fingerprint = None
+        scripts = None
+        if incremental:
+            # The script is written as it is if changed.
+            with stats.phase('fingerprint'):
+                scripts = gen_plantuml.generate_scripts(context, options)
+                new_fingerprint = manifest.fingerprint(
+                    ''.join(scripts[0]), ','.join(output_formats), options)
+            if new_fingerprint == old_fingerprint:
+                return None, new_fingerprint, diagram_stats
+        if not bundled:
+            return (_generate_formats(d.name, output_dir, context, options,
+                                      output_formats, scripts=scripts),
+                    new_fingerprint, diagram_stats)
+        sink = output_sink.MemorySink()
+        _generate_formats(d.name, output_dir, context, options,
+                          output_formats, sink, scripts)
+        return sink.files, new_fingerprint, diagram_stats
+
+
+def _map_diagrams(fn, num_diagrams, jobs, *iterables):
+    if jobs is None or jobs == 0:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, num_diagrams)
+    if jobs <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        return map(fn, range(num_diagrams), *iterables)
+
+    executor = concurrent.futures.ProcessPoolExecutor(
+        max_workers=jobs, mp_context=multiprocessing.get_context('fork'))
+
+    def results():
+        with executor:
+            for result in executor.map(fn, range(num_diagrams), *iterables):
+                yield result
+    return results()
+
+
+def generate(output_format=DEFAULT_FORAMT, output_dir='.', options=None,
+             jobs=1, incremental=False, diagrams=None, sink=None,
+             registry=None):
+    """
+    Generate sequence diagrams from all the decorated functions in
+    'registry', Registry, or default_registry if not given.
+
+    'output_format' can be multiple formats as a list or comma separated,
+    e.g. 'plantuml_png,plantuml_svg'. The script is generated once for them.
+
+    'diagrams' is the subset of the decorated functions to generate. The files
+    of the others are kept even if incremental.
+
+    'jobs' is the number of worker processes to generate diagrams in
+    parallel. 0 or None means the number of CPUs. Generated files and the
+    report are the same as the serial run. The stats of the diagrams are
+    collected from the workers if enabled, see stats module.
+
+    If 'incremental' is true, the diagrams whose script and output options
+    are unchanged since the last incremental run are skipped, keeping their
+    files untouched. The files of the diagrams no longer existing are removed.
+    The state is kept in a manifest file in output_dir.
+
+    'sink' is output_sink.Sink to write the files to instead of output_dir,
+    e.g. output_sink.ZipSink to bundle all of them into a single archive.
+    The caller closes it. The files are written in the order of the diagrams
+    even with jobs. 'incremental' is only for output_dir.
+
+    ex)
+        with output_sink.open_bundle('diagrams.zip') as sink:
+            napkin.generate('plantuml_png', sink=sink)
+    """
+    output_formats = _parse_formats(output_format)
+    bundled = (sink is not None and
+               not isinstance(sink, output_sink.DirectorySink))
+    if bundled and incremental:
+        raise ValueError('Incremental is only for output directory')
+    if sink is not None and not bundled:
+        output_dir = sink.output_dir
+    if not bundled and not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    module_name = '.gen_' + output_format
-    gen_module = importlib.import_module(module_name, 'napkin')
+    generate_diagram = functools.partial(
+        _generate_diagram, output_formats=output_formats,
+        output_dir=output_dir,
+        options=options if options else {}, incremental=incremental,
+        bundled=bundled)
+
+    global _diagrams_to_generate
+    _diagrams_to_generate = list(_registered_diagrams(registry)
+                                 if diagrams is None else diagrams)
+    diagram_names = [d.name for d in _diagrams_to_generate]
+    run_manifest = manifest.Manifest(output_dir) if incremental else None
+    old_fingerprints = [run_manifest.fingerprint(name) if incremental else None
+                        for name in diagram_names]
+    num_generated = num_skipped = 0
+
+    try:
+        for name, (generated_files, fingerprint, diagram_stats) in zip(
+                diagram_names,
+                _map_diagrams(generate_diagram, len(diagram_names), jobs,
+                              old_fingerprints)):
+            if diagram_stats:
+                stats.add_diagram(diagram_stats)
+            if generated_files is None:
+                num_skipped += 1
+                print('File unchanged : {}'.format(
+                    ', '.join(run_manifest.files(name))))
+                continue
+            num_generated += 1
+            if bundled:
+                for file_name, data in generated_files.items():
+                    sink.write(file_name, data)
+                generated_files = [sink.location(file_name)
+                                   for file_name in generated_files]
+            print('File generated : {}'.format(', '.join(generated_files)))
+            if incremental:
+                run_manifest.update(name, fingerprint, generated_files)
+    finally:
+        # Not to keep the functions alive after the run.
+        _diagrams_to_generate = []
+
+    if incremental:
+        removed = (run_manifest.remove_orphans(set(diagram_names))
+                   if diagrams is None else [])
+        for files in removed:
+            print('File removed : {}'.format(', '.join(files)))
+        run_manifest.save()
+        print('Generated: {}, Skipped: {}, Removed: {}'.format(
+            num_generated, num_skipped, len(removed)))
+
+
+def render(sd_func, formats=DEFAULT_FORAMT, options=None):
+    """
+    Render the diagram function in memory without writing any file.
+
+    'formats' are as generate(). Return dict from each format to PlantUML
+    script as str for 'plantuml' or the image as bytes for the others. If the
+    options split the diagram into pages, each is the list of the pages. The
+    image types are rendered concurrently and the render cache is not used.
+
+    ex)
+        rendered = napkin.render(sd_hello, 'plantuml,plantuml_png')
+        png = rendered['plantuml_png']
+    """
+    output_formats = _parse_formats(formats)
+    options = options if options else {}
+    context = sd.parse(sd_func)
+    paged = gen_plantuml.is_paged(options)
+    pages = (gen_plantuml.generate_pages(context, options) if paged else
+             [gen_plantuml.generate_script(context, options)])
+
+    image_formats = [f for f in output_formats if f != 'plantuml']
+    page_images = []
+    if image_formats:
+        from . import gen_plantuml_img
+        image_types = _image_types(image_formats)
+        page_images = [gen_plantuml_img.render_many(page, image_types,
+                                                    options)
+                       for page in pages]
+
+    rendered = {}
+    for f in output_formats:
+        if f == 'plantuml':
+            values = pages
+        else:
+            index = image_formats.index(f)
+            values = [images[index] for images in page_images]
+        rendered[f] = values if paged else values[0]
+    return rendered
+
+
+async def agenerate(output_format=DEFAULT_FORAMT, output_dir='.', options=None,
+                    max_in_flight=8, timeout=None, request_timeout=None,
+                    diagrams=None, sink=None, registry=None):
+    """
+    Async version of generate() not to block the event loop.
+
+    The diagrams are parsed in the loop and at most 'max_in_flight' of them are
+    generated and rendered concurrently by worker threads. The images of a
+    diagram, e.g. of multiple formats or pages, are rendered one by one.
+    'request_timeout' is the deadline in seconds for each diagram from when
+    it is started and 'timeout' is for the whole run. asyncio.TimeoutError is
+    raised when either is exceeded and the pending diagrams are cancelled as
+    when the calling task is cancelled. The diagrams already being rendered
+    are finished before raising, so no file is written after it.
+    'diagrams' is the subset of the decorated functions to generate and
+    'registry' is as generate(). 'sink' is as generate() but the files are
+    written in the order of completion.
+
+    Return the list of generated files for each diagram.
+    """
+    # Imported here not to slow down the start of napkin_client.
+    import asyncio
+
+    output_formats = _parse_formats(output_format)
+    bundled = (sink is not None and
+               not isinstance(sink, output_sink.DirectorySink))
+    if sink is not None and not bundled:
+        output_dir = sink.output_dir
+    if not bundled and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    # At most max_in_flight requests by rendering serially in the workers.
+    options = dict(options if options else {}, render_workers=1)
+    executor = concurrent.futures.ThreadPoolExecutor(max_in_flight)
+    # Not to start the deadline of the diagrams waiting for a worker.
+    semaphore = asyncio.Semaphore(max_in_flight)
+
+    # Submitted to the executor, which cannot be cancelled once running.
+    futures = []
+
+    async def generate_diagram(d):
+        async with semaphore:
+            context = sd.parse(d.sd_func)
+            future = executor.submit(_generate_formats, d.name, output_dir,
+                                     context, options, output_formats, sink)
+            futures.append(future)
+            return await asyncio.wait_for(asyncio.wrap_future(future),
+                                          request_timeout)
+
+    tasks = [asyncio.ensure_future(generate_diagram(d))
+             for d in (_registered_diagrams(registry) if diagrams is None
+                       else diagrams)]
+    try:
+        all_generated_files = await asyncio.wait_for(asyncio.gather(*tasks),
+                                                     timeout)
+    finally:
+        # Cancel the rest on error, timeout or cancellation and wait for the
+        # running ones not to write files after returning.
+        for task in tasks:
+            task.cancel()
+        running = [asyncio.wrap_future(f) for f in futures if not f.done()]
+        if running:
+            await asyncio.wait(running)
+        executor.shutdown(wait=False)
 
-    for d in _collected_seq_diagrams:
-        context = sd.parse(d.sd_func)
-        generated_files = gen_module.generate(d.name, output_dir, context,
-                                              options if options else {})
+    for generated_files in all_generated_files:
         print('File generated : {}'.format(', '.join(generated_files)))
+    return all_generated_files
@@ -1,3 +1,4 @@
 if __name__ == '__main__':
+    import sys
     from .cli import main
-    main()
+    sys.exit(main())
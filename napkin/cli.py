@@ -1,9 +1,12 @@
 """
 Command line interface to generate sequence diagrams.
 """
-import os
 import argparse
-import re
+import napkin
+from . import discovery
+from . import watch
+from . import stats
+from . import output_sink
 from . import generate, SUPPORTED_FORMATS, DEFAULT_FORAMT, __version__
 
 _DESCRIPTION = 'Generate UML sequence diagram from Python code'
@@ -12,21 +15,95 @@ Supported output formats:
 """ + '\n'.join('  {:16} : {}'.format(k, v)
                 for k, v in SUPPORTED_FORMATS.items())
 
+_BUNDLE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz')
 
-def _parse_args():
+
+def _output_format(value):
+    try:
+        napkin._parse_formats(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return value
+
+
+def _bundle(value):
+    if not value.endswith(_BUNDLE_EXTENSIONS):
+        raise argparse.ArgumentTypeError(
+            'Unsupported bundle : {}'.format(value))
+    return value
+
+
+def _parse_args(argv=None):
     parser = argparse.ArgumentParser(
         formatter_class=argparse.RawDescriptionHelpFormatter,
         description=_DESCRIPTION,
         epilog=_EPILOG)
 
     parser.add_argument(
-        '--output-format', '-f',
-        default=DEFAULT_FORAMT, choices=SUPPORTED_FORMATS.keys()),
+        '--output-format', '-f', type=_output_format,
+        default=DEFAULT_FORAMT, metavar='FORMAT[,FORMAT...]',
+        help=('one or more of {} separated by comma. The script is '
+              'generated once for all of them'.format(
+                  ', '.join(SUPPORTED_FORMATS)))),
     parser.add_argument(
         '--output-dir', '-o', default='.', metavar='DIR')
+    parser.add_argument(
+        '--bundle', type=_bundle, metavar='FILE',
+        help=('write all the files into a single archive, FILE of {} '
+              'instead of the output directory'.format(
+                  ', '.join(_BUNDLE_EXTENSIONS))))
+    parser.add_argument(
+        '--jobs', '-j', type=int, default=1, metavar='N',
+        help=('number of processes to generate diagrams in parallel. '
+              '0 means the number of CPUs'))
+    parser.add_argument(
+        '--incremental', action='store_true',
+        help=('skip the diagrams unchanged since the last incremental run '
+              'and remove the files of the deleted ones'))
     parser.add_argument(
         'srcs', nargs='+',
         help='Python file or directory containing diagram functions')
+    parser.add_argument(
+        '--ignore', action='append', default=[], metavar='PATTERN',
+        help=('glob pattern of files and directories to skip in srcs. '
+              'It can be given multiple times'))
+    parser.add_argument(
+        '--no-default-ignores', action='store_true',
+        help=('do not skip VCS, virtualenv, node_modules and cache '
+              'directories'))
+    parser.add_argument(
+        '--scan-index', metavar='FILE',
+        help=('file to keep the scan result, so only the changed files are '
+              'read in the next run'))
+    parser.add_argument(
+        '--list', action='store_true',
+        help=('list the diagrams found in srcs without running the scripts '
+              'and exit'))
+    parser.add_argument(
+        '--only', action='append', default=[], metavar='PATTERN',
+        help=('glob pattern of the diagram names to generate. Only the '
+              'scripts defining them are run. It can be given multiple '
+              'times'))
+    parser.add_argument(
+        '--exclude', action='append', default=[], metavar='PATTERN',
+        help=('glob pattern of the diagram names not to generate. '
+              'It can be given multiple times'))
+    parser.add_argument(
+        '--watch', action='store_true',
+        help=('keep running and regenerate the diagrams of the changed '
+              'scripts'))
+    parser.add_argument(
+        '--debounce', type=float, default=watch.DEFAULT_DEBOUNCE,
+        metavar='SEC',
+        help=('(only for --watch) seconds to wait for more changes before '
+              'regenerating (default: {})'.format(watch.DEFAULT_DEBOUNCE)))
+    parser.add_argument(
+        '--stats', action='store_true',
+        help=('print the time and peak traced memory of each phase and the '
+              'slowest diagrams'))
+    parser.add_argument(
+        '--stats-json', metavar='FILE',
+        help='write the stats of the run and each diagram as JSON')
     parser.add_argument(
         '--version', action='version', version=__version__)
 
@@ -40,35 +117,185 @@ def _parse_args():
               'It is mainly for changing styles.'))
 
     parser.add_argument(
-        '--server-url', default=argparse.SUPPRESS, metavar='URL',
+        '--page-size', type=int, default=argparse.SUPPRESS, metavar='N',
+        help=('(only for plantuml formats) '
+              'split diagrams into pages of about N actions'))
+    parser.add_argument(
+        '--page-at-divide', action='store_true', default=argparse.SUPPRESS,
+        help=('(only for plantuml formats) '
+              'split diagrams into pages at divides'))
+    parser.add_argument(
+        '--page-mode', choices=('files', 'newpage'),
+        default=argparse.SUPPRESS,
+        help=('write each page to <name>_<page>.puml or all to a single '
+              'file as newpage sections. Images are rendered per page '
+              'concurrently either way (default: files)'))
+
+    parser.add_argument(
+        '--server-url', default=argparse.SUPPRESS, metavar='URL[,URL...]',
         help=('(only for plantuml_png/svg/txt format) '
-              'Default is the public server'))
+              'Default is the public server. Renders are spread over '
+              'multiple servers by the latency and errors'))
+    parser.add_argument(
+        '--hedge-after', type=float, default=argparse.SUPPRESS,
+        metavar='SEC',
+        help=('(only for multiple servers) '
+              'send the request also to the next server if no response '
+              'in SEC'))
 
-    return parser.parse_args()
+    parser.add_argument(
+        '--renderer', choices=('server', 'local'), default=argparse.SUPPRESS,
+        help=('(only for plantuml_png/svg/txt format) '
+              'render images by the server or a local command '
+              '(default: server)'))
+    parser.add_argument(
+        '--local-command', default=argparse.SUPPRESS, metavar='CMD',
+        help=('command for the local renderer. {type} and {delimiter} are '
+              'replaced (default: "plantuml -pipe -pipedelimitor {delimiter} '
+              '-t{type}")'))
+    parser.add_argument(
+        '--local-workers', type=int, default=argparse.SUPPRESS, metavar='N',
+        help='number of processes kept by the local renderer (default: 2)')
+    parser.add_argument(
+        '--compression-level', type=int, choices=range(-1, 10),
+        default=argparse.SUPPRESS, metavar='0-9',
+        help=('(only for plantuml_png/svg/txt format) '
+              'zlib compression level of the script sent to the server'))
+    parser.add_argument(
+        '--http-method', choices=('auto', 'get', 'post'),
+        default=argparse.SUPPRESS,
+        help=('(only for plantuml_png/svg/txt format) '
+              'send the script to the server encoded in the URL by GET or '
+              'in the body by POST. auto uses POST for long scripts '
+              '(default: auto)'))
+    parser.add_argument(
+        '--post-threshold', type=int, default=argparse.SUPPRESS,
+        metavar='CHARS',
+        help='length of the script to use POST for auto (default: 4096)')
+    parser.add_argument(
+        '--timeout', type=float, default=argparse.SUPPRESS, metavar='SEC',
+        help=('(only for plantuml_png/svg/txt format) '
+              'timeout to wait for the server (default: 60)'))
+    parser.add_argument(
+        '--retries', type=int, default=argparse.SUPPRESS, metavar='N',
+        help=('(only for plantuml_png/svg/txt format) '
+              'number of retries with backoff on failure (default: 3). '
+              'Multiple servers fail over to the next one instead'))
+    parser.add_argument(
+        '--cache-dir', default=argparse.SUPPRESS, metavar='DIR',
+        help=('(only for plantuml_png/svg/txt format) '
+              'directory to cache rendered images. '
+              'The server is not asked for the cached ones'))
+    parser.add_argument(
+        '--cache-max-size', type=float, default=argparse.SUPPRESS,
+        metavar='MB', help='maximum size of the cache (default: 256)')
+    parser.add_argument(
+        '--cache-max-age', type=float, default=argparse.SUPPRESS,
+        metavar='DAYS', help='maximum age of cached images (default: 30)')
+    parser.add_argument(
+        '--cache-link', action='store_true', default=argparse.SUPPRESS,
+        help='hard-link cached images instead of copying')
+
+    args = parser.parse_args(argv)
+    if args.bundle and (args.incremental or args.watch):
+        parser.error('--bundle cannot be used with --incremental or --watch')
+    return args
 
 
 def _import_script(fname):
     with open(fname, 'rt') as f:
         file_contents = f.read()
-        if '@napkin.seq_diagram' in file_contents:
+        if discovery.DIAGRAM_MARKER in file_contents:
             print('Load file : {}'.format(fname))
             exec(compile(file_contents, fname, 'exec'), globals(), locals())
 
 
-def _collect_py_files(srcs):
-    collected = []
-    for src in srcs:
-        if os.path.isdir(src):
-            for root, dirs, files in os.walk(src):
-                collected += [os.path.join(root, f)
-                              for f in files if re.match(r'\w*\.py$', f)]
-        else:
-            collected.append(src)
-    return collected
+def _list_diagrams(listed):
+    for fname, names in listed:
+        for name in names:
+            print('{} : {}'.format(fname, name if name else '<dynamic>'))
+
+
+def _is_selected_func(args):
+    if not (args.only or args.exclude):
+        return None
+
+    def is_selected(name):
+        return discovery.is_selected(name, args.only, args.exclude)
+    return is_selected
+
+
+def _run(args, import_script=_import_script):
+    """
+    Run the parsed command line and return the exit code.
+
+    'import_script' is called with each script to run.
+    """
+    is_selected = _is_selected_func(args)
+    if args.watch and not args.list:
+        watch.Watch(args.srcs, import_script, args.output_format,
+                    args.output_dir, options=vars(args), jobs=args.jobs,
+                    ignores=args.ignore,
+                    default_ignores=not args.no_default_ignores,
+                    is_selected=is_selected, debounce=args.debounce).run()
+        return 0
+
+    if not (args.stats or args.stats_json):
+        return _generate(args, import_script, is_selected)
+
+    run_stats = stats.enable()
+    try:
+        _generate(args, import_script, is_selected)
+    finally:
+        stats.disable()
+    if args.stats:
+        print(run_stats.report())
+    if args.stats_json:
+        run_stats.save(args.stats_json)
+    return 0
+
+
+def _generate(args, import_script, is_selected):
+    with stats.phase('discover'):
+        index = (discovery.ScanIndex(args.scan_index) if args.scan_index else
+                 None)
+        fnames = discovery.find_scripts(
+            args.srcs, args.ignore,
+            default_ignores=not args.no_default_ignores, index=index)
+        if args.list:
+            _list_diagrams(discovery.list_diagrams(fnames, index))
+            return 0
+
+        if is_selected:
+            # Run the scripts which may define any of the selected diagrams.
+            fnames = [fname for fname, names in discovery.list_diagrams(
+                fnames, index)
+                if any(n is None or is_selected(n) for n in names)]
+
+    # The diagrams of the scripts are registered only for this run.
+    with stats.phase('exec'), napkin.registry_scope(napkin.Registry()) as \
+            registry:
+        for fname in fnames:
+            import_script(fname)
+
+    diagrams = None
+
+    if is_selected:
+        diagrams = [d for d in registry if is_selected(d.name)]
+    if not args.bundle:
+        generate(args.output_format, args.output_dir, options=vars(args),
+                 jobs=args.jobs, incremental=args.incremental,
+                 diagrams=diagrams, registry=registry)
+        return 0
+
+    with output_sink.open_bundle(args.bundle) as sink:
+        generate(args.output_format, options=vars(args), jobs=args.jobs,
+                 diagrams=diagrams, sink=sink, registry=registry)
+    return 0
 
 
-def main():
-    args = _parse_args()
-    for fname in _collect_py_files(args.srcs):
-        _import_script(fname)
-    generate(args.output_format, args.output_dir, options=vars(args))
+def main(argv=None):
+    """
+    Run the command line and return the exit code.
+    """
+    return _run(_parse_args(argv))
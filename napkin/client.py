@@ -0,0 +1,57 @@
+"""
+Thin client running napkin command lines by the daemon
+"""
+import os
+import sys
+import json
+import socket
+import tempfile
+
+SOCKET_ENV = 'NAPKIN_SOCKET'
+
+
+def default_socket_path():
+    """
+    Return the socket path given by NAPKIN_SOCKET or the one per user.
+    """
+    if os.environ.get(SOCKET_ENV):
+        return os.environ[SOCKET_ENV]
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    return os.path.join(runtime_dir, 'napkin-{}.sock'.format(os.getuid()))
+
+
+def run(argv, socket_path=None, stdout=None, stderr=None):
+    """
+    Run the napkin command line by the daemon and return the exit code.
+
+    The output of the daemon is written to stdout and stderr as it comes.
+    OSError is raised if the daemon is not running.
+    """
+    streams = {'stdout': stdout if stdout else sys.stdout,
+               'stderr': stderr if stderr else sys.stderr}
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path if socket_path else default_socket_path())
+        request = {'argv': list(argv), 'cwd': os.getcwd()}
+        sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        for line in sock.makefile('rb'):
+            message = json.loads(line.decode('utf-8'))
+            if 'exit' in message:
+                return message['exit']
+            stream = streams[message['stream']]
+            stream.write(message['data'])
+            stream.flush()
+    finally:
+        sock.close()
+    raise ConnectionError('Daemon closed the connection')
+
+
+def main():
+    argv = sys.argv[1:]
+    try:
+        code = run(argv)
+    except (FileNotFoundError, ConnectionRefusedError):
+        # No daemon is running, so run it in this process.
+        from . import cli
+        code = cli.main(argv)
+    sys.exit(code)
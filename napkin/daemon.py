@@ -0,0 +1,155 @@
+"""
+Resident process running napkin command lines for the client
+"""
+import os
+import sys
+import json
+import socket
+import argparse
+import importlib
+import traceback
+import contextlib
+import socketserver
+
+import napkin
+from . import cli
+from . import client
+
+
+class _StreamWriter:
+    """
+    File-like object sending each write to the client as a message.
+    """
+    def __init__(self, wfile, name):
+        self.wfile = wfile
+        self.name = name
+
+    def write(self, data):
+        if data:
+            message = {'stream': self.name, 'data': data}
+            self.wfile.write(json.dumps(message).encode('utf-8') + b'\n')
+        return len(data)
+
+    def flush(self):
+        self.wfile.flush()
+
+
+class _ScriptCache:
+    """
+    Diagrams defined by each script, which is not run again unless its size or
+    mtime changes.
+    """
+    def __init__(self):
+        self.entries = {}
+
+    def import_script(self, fname):
+        st = os.stat(fname)
+        path = os.path.abspath(fname)
+        # Registry of the running command line.
+        registry = napkin.default_registry
+        entry = self.entries.get(path)
+        if entry and entry[0] == (st.st_size, st.st_mtime_ns):
+            print('Load file : {}'.format(fname))
+        else:
+            with napkin.registry_scope(napkin.Registry()) as script_registry:
+                cli._import_script(fname)
+            entry = self.entries[path] = ((st.st_size, st.st_mtime_ns),
+                                          list(script_registry))
+        for d in entry[1]:
+            registry.register(d)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        request = json.loads(self.rfile.readline().decode('utf-8'))
+        try:
+            code = self.server.run(request['argv'], request['cwd'],
+                                   _StreamWriter(self.wfile, 'stdout'),
+                                   _StreamWriter(self.wfile, 'stderr'))
+            self.wfile.write(json.dumps({'exit': code}).encode('utf-8') +
+                             b'\n')
+        except ConnectionError:
+            pass
+
+
+class Daemon(socketserver.UnixStreamServer):
+    """
+    Server running the command lines one by one in the same process.
+
+    The scripts, the imported modules and the connections to the server are
+    kept warm between the runs. Modules imported by the scripts are not
+    reloaded when they change.
+    """
+    def __init__(self, socket_path):
+        # Only the user can connect as the scripts are run by the request.
+        old_umask = os.umask(0o077)
+        try:
+            super().__init__(socket_path, _Handler)
+        finally:
+            os.umask(old_umask)
+        self.scripts = _ScriptCache()
+        for output_format in napkin.SUPPORTED_FORMATS:
+            importlib.import_module('.gen_' + output_format, 'napkin')
+
+    def run(self, argv, cwd, stdout, stderr):
+        """
+        Run the command line in cwd and return the exit code.
+        """
+        old_cwd = os.getcwd()
+        try:
+            os.chdir(cwd)
+            with contextlib.redirect_stdout(stdout), \
+                    contextlib.redirect_stderr(stderr):
+                return self._run(argv)
+        finally:
+            os.chdir(old_cwd)
+
+    def _run(self, argv):
+        try:
+            args = cli._parse_args(argv)
+            if args.watch:
+                print('--watch is not supported by the daemon',
+                      file=sys.stderr)
+                return 2
+            return cli._run(args, import_script=self.scripts.import_script)
+        except SystemExit as e:
+            return e.code if isinstance(e.code, int) else int(bool(e.code))
+        except Exception:
+            traceback.print_exc()
+            return 1
+
+
+def _is_running(socket_path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Keep napkin running to serve napkin_client')
+    parser.add_argument(
+        '--socket', default=client.default_socket_path(), metavar='PATH',
+        help=('Unix socket to listen on (default: ${} or one per user in '
+              'the runtime directory)'.format(client.SOCKET_ENV)))
+    args = parser.parse_args()
+
+    if os.path.exists(args.socket):
+        if _is_running(args.socket):
+            sys.exit('Daemon is already running on {}'.format(args.socket))
+        os.remove(args.socket)
+
+    server = Daemon(args.socket)
+    print('Listening on {}'.format(args.socket))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(args.socket)
@@ -0,0 +1,231 @@
+"""
+Discovery of Python scripts containing diagram functions
+"""
+import os
+import re
+import ast
+import json
+import fnmatch
+import concurrent.futures
+
+from . import util
+
+DIAGRAM_MARKER = '@napkin.seq_diagram'
+
+# Directories never containing diagram scripts of the project.
+DEFAULT_IGNORES = ('.git', '.hg', '.svn', '__pycache__', 'node_modules',
+                   '.tox', '.nox', '.venv', 'venv', '.eggs', '*.egg-info',
+                   '.mypy_cache', '.pytest_cache')
+
+_PY_FILE_RE = re.compile(r'\w*\.py$')
+
+
+def _is_ignored(name, rel_path, ignores):
+    return any(fnmatch.fnmatch(name, p) or fnmatch.fnmatch(rel_path, p)
+               for p in ignores)
+
+
+def walk(srcs, ignores=(), default_ignores=True):
+    """
+    Yield the directories looked into and the Python files in each of them.
+
+    Directories and files matching any of glob patterns in 'ignores' by the
+    name or the path relative to the source directory are skipped as well as
+    DEFAULT_IGNORES and virtualenvs if 'default_ignores' is true. Files given
+    directly in srcs are always yielded with their directories.
+    """
+    ignores = tuple(ignores) + (DEFAULT_IGNORES if default_ignores else ())
+    for src in srcs:
+        if not os.path.isdir(src):
+            yield os.path.dirname(src) or os.curdir, [src]
+            continue
+        for root, dirs, files in os.walk(src):
+            rel_root = os.path.relpath(root, src)
+
+            def rel_path(name):
+                return os.path.normpath(os.path.join(rel_root, name))
+
+            dirs[:] = [d for d in dirs
+                       if not _is_ignored(d, rel_path(d), ignores) and
+                       not (default_ignores and os.path.exists(
+                           os.path.join(root, d, 'pyvenv.cfg')))]
+            yield root, [os.path.join(root, f) for f in files
+                         if _PY_FILE_RE.match(f) and
+                         not _is_ignored(f, rel_path(f), ignores)]
+
+
+def collect_py_files(srcs, ignores=(), default_ignores=True):
+    """
+    Collect Python files from files and directories in srcs.
+
+    See walk() for the files skipped.
+    """
+    return [f for _, files in walk(srcs, ignores, default_ignores)
+            for f in files]
+
+
+def _has_marker(path):
+    with open(path, 'rb') as f:
+        return DIAGRAM_MARKER.encode() in f.read()
+
+
+def _literal_str(node):
+    try:
+        value = ast.literal_eval(node)
+    except ValueError:
+        return None
+    return value if isinstance(value, str) else None
+
+
+def _diagram_name(func, decorator):
+    """
+    Return the name of diagram if it is seq_diagram decorator, '' if not and
+    None if the name is unknown without running.
+    """
+    if not isinstance(decorator, ast.Call):
+        return ''
+    target = decorator.func
+    if not (isinstance(target, ast.Attribute) and
+            target.attr == 'seq_diagram' or
+            isinstance(target, ast.Name) and target.id == 'seq_diagram'):
+        return ''
+
+    name_nodes = decorator.args[:1] + [k.value for k in decorator.keywords
+                                       if k.arg == 'name']
+    if not name_nodes:
+        return func.name
+    return _literal_str(name_nodes[0]) or None
+
+
+def find_diagrams(path):
+    """
+    Return the names of the diagrams defined in the file without running it.
+
+    The name is None if it is not known statically, e.g. given by a variable.
+    If the file cannot be parsed, [None] is returned.
+    """
+    with open(path, 'rb') as f:
+        source = f.read()
+    try:
+        tree = ast.parse(source, path)
+    except (SyntaxError, ValueError):
+        return [None]
+
+    names = []
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            for decorator in node.decorator_list:
+                name = _diagram_name(node, decorator)
+                if name != '':
+                    names.append(name)
+    return names
+
+
+def is_selected(diagram_name, only=(), exclude=()):
+    """
+    Check the diagram name against glob patterns, 'only' and 'exclude'.
+    """
+    return ((not only or any(fnmatch.fnmatch(diagram_name, p)
+                             for p in only)) and
+            not any(fnmatch.fnmatch(diagram_name, p) for p in exclude))
+
+
+class ScanIndex:
+    """
+    Persistent result of scanning keyed on the path, size and mtime of files.
+    """
+    def __init__(self, index_file):
+        self.index_file = index_file
+        try:
+            with open(index_file, 'rt') as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+
+    def _entry(self, path, st):
+        entry = self.entries.get(os.path.abspath(path))
+        if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            return entry
+        return None
+
+    def lookup(self, path, st):
+        """
+        Return whether the file has the marker or None if unknown.
+        """
+        entry = self._entry(path, st)
+        return entry[2] if entry else None
+
+    def update(self, path, st, has_marker):
+        self.entries[os.path.abspath(path)] = [st.st_size, st.st_mtime_ns,
+                                               has_marker, None]
+
+    def lookup_diagrams(self, path, st):
+        """
+        Return the names of the diagrams or None if unknown.
+        """
+        entry = self._entry(path, st)
+        return entry[3] if entry else None
+
+    def update_diagrams(self, path, st, names):
+        self.entries[os.path.abspath(path)] = [st.st_size, st.st_mtime_ns,
+                                               True, names]
+
+    def save(self):
+        with util.open_atomic(self.index_file, 'wt') as f:
+            json.dump(self.entries, f)
+
+
+def scan(paths, index=None, max_workers=None):
+    """
+    Return the paths of the files containing the marker keeping the order.
+
+    The files are read concurrently and only the ones changed since the scan
+    recorded in the index, ScanIndex are read if given.
+    """
+    def check(path):
+        if index is None:
+            return _has_marker(path)
+        st = os.stat(path)
+        has_marker = index.lookup(path, st)
+        if has_marker is None:
+            has_marker = _has_marker(path)
+            index.update(path, st, has_marker)
+        return has_marker
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        results = list(executor.map(check, paths))
+    if index is not None:
+        index.save()
+    return [p for p, has_marker in zip(paths, results) if has_marker]
+
+
+def find_scripts(srcs, ignores=(), default_ignores=True, index=None):
+    """
+    Find the scripts containing diagram functions from srcs.
+
+    See collect_py_files() and scan().
+    """
+    paths = collect_py_files(srcs, ignores, default_ignores)
+    return scan(paths, index)
+
+
+def list_diagrams(paths, index=None):
+    """
+    Return the list of (path, names of diagrams) by find_diagrams().
+
+    The names are kept in the index, ScanIndex if given.
+    """
+    listed = []
+    for path in paths:
+        if index is None:
+            listed.append((path, find_diagrams(path)))
+            continue
+        st = os.stat(path)
+        names = index.lookup_diagrams(path, st)
+        if names is None:
+            names = find_diagrams(path)
+            index.update_diagrams(path, st, names)
+        listed.append((path, names))
+    if index is not None:
+        index.save()
+    return listed
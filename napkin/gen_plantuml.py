@@ -3,24 +3,28 @@ PlanUML format sequence diagram generation
 """
 
 import re
-import os
+import functools
+from . import sd
 from . import sd_action
 from . import util
+from . import stats
+from . import output_sink
+
+
+def _participant(obj):
+    stereotype = ' <<{}>>'.format(obj.stereotype) if obj.stereotype else ''
+    return ('participant "{name:s}:{cls:s}" as {name:s}{stereotype}'.format(
+        name=obj.name, cls=obj.cls, stereotype=stereotype)
+        if obj.cls else
+        'participant {name:s}{stereotype}'.format(
+            name=obj.name, stereotype=stereotype))
 
 
 def _output_participants(sd_context):
     """
     Generate a string containing participants in order of the occurrence.
     """
-    output = []
-    for o in sd_context._objects.values():
-        stereotype = ' <<{}>>'.format(o.stereotype) if o.stereotype else ''
-        output.append(
-            'participant "{name:s}:{cls:s}" as {name:s}{stereotype}'.format(
-                name=o.name, cls=o.cls, stereotype=stereotype)
-            if o.cls else
-            'participant {name:s}{stereotype}'.format(
-                name=o.name, stereotype=stereotype))
+    output = [_participant(o) for o in sd_context._objects.values()]
     output.append('')
     return output
 
@@ -42,127 +46,478 @@ def _generate_note(output, direction, obj, text):
         output.append('{} : {}'.format(header, text))
 
 
-def _get_object_name_for_call(obj):
-    name = obj.name
+@functools.lru_cache(maxsize=4096)
+def _get_call_name(name):
     if name.startswith('<<outside'):
         return ']' if ':right>>' in name else '['
     else:
         return name + ' '
 
 
-def _generate_script(sd_context, raw_header):
+def _get_object_name_for_call(obj):
+    return _get_call_name(obj.name)
+
+
+@functools.lru_cache(maxsize=4096)
+def _is_stereotype_method(method_name, _match=re.compile(r'<<\w+>>').match):
     """
-    Generate a string containing PlanUML script.
+    Check if it is such as <<create>> or <<destroy>>.
     """
-    call_stack = []
-    current_call = None
+    return _match(method_name) is not None
 
-    output = []
-    output.append('@startuml')
+
+_CREATE = 'create {}'.format
+_STEREOTYPE_CALL = '{} -> {} : {}'.format
+_CALL = '{}-> {} : {}({})'.format
+_ACTIVATE = 'activate {}'.format
+_DEACTIVATE = 'deactivate {}'.format
+_DESTROY = 'destroy {}'.format
+_RETURN = '{}<-- {}'.format
+_RETURN_WITH_PARAMS = '{}<-- {}: {}'.format
+_DELAY = '... {} ...'.format
+_DIVIDE = '== {} =='.format
+
+
+class _ScriptEmitter:
+    """
+    Convert each action into the lines of PlantUML script keeping the state
+    of the nested calls and fragments.
+    """
+    def __init__(self):
+        self.call_stack = []
+        self.current_call = None
+        self.is_alt_waiting_for_first_choice = False
+        self.frag_stack = []
+
+    def emit(self, output, p_action, action, n_action):
+        """
+        Append the lines for the action to output.
+        """
+        _EMITTERS[action.__class__](self, output, p_action, action, n_action)
+
+    def _call(self, output, p_action, action, n_action):
+        callee = action.callee.name
+        if 'c' in action.flags:
+            output.append(_CREATE(callee))
+
+        if _is_stereotype_method(action.method_name):
+            output.append(_STEREOTYPE_CALL(action.caller.name, callee,
+                                           action.method_name))
+        else:
+            output.append(_CALL(_get_object_name_for_call(action.caller),
+                                callee, action.method_name, action.params))
+
+        note_callee, note_caller = action.notes
+        if note_callee or note_caller:
+            caller_side, callee_side = (
+                ('left', 'right')
+                if _is_caller_left_side(action.caller, action.callee) else
+                ('right', 'left'))
+            if note_callee:
+                _generate_note(output, callee_side, obj=None,
+                               text=note_callee)
+            if note_caller:
+                _generate_note(output, caller_side, obj=None,
+                               text=note_caller)
+
+        if n_action.__class__ is not sd_action.ImplicitReturn:
+            output.append(_ACTIVATE(callee))
+        self.call_stack.append(self.current_call)
+        self.current_call = action
+
+    def _implicit_return(self, output, p_action, action, n_action):
+        current_call = self.current_call
+        if p_action.__class__ is not sd_action.Call:
+            output.append(_DEACTIVATE(current_call.callee.name))
+
+        if 'd' in current_call.flags:
+            output.append(_DESTROY(current_call.callee.name))
+
+        self.current_call = self.call_stack.pop()
+
+    def _return(self, output, p_action, action, n_action):
+        current_call = self.current_call
+        caller = _get_object_name_for_call(current_call.caller)
+        callee = current_call.callee.name
+        params = str(action.params)
+        output.append(_RETURN_WITH_PARAMS(caller, callee, params)
+                      if params else _RETURN(caller, callee))
+        output.append(_DEACTIVATE(callee))
+        self.current_call = self.call_stack.pop()
+
+    def _frag_begin(self, output, p_action, action, n_action):
+        self.frag_stack.append(action)
+        op_name = action.op_name
+        if op_name == 'alt':
+            self.is_alt_waiting_for_first_choice = True
+            return
+
+        if op_name == 'choice':
+            if self.is_alt_waiting_for_first_choice:
+                self.is_alt_waiting_for_first_choice = False
+                s = 'alt'
+            else:
+                s = 'else'
+        else:
+            s = op_name
+
+        if action.condition:
+            s += ' %s' % action.condition
+        output.append(s)
+
+    def _frag_end(self, output, p_action, action, n_action):
+        self.frag_stack.pop()
+        if action.op_name != 'choice':
+            output.append('end')
+
+    def _note(self, output, p_action, action, n_action):
+        _generate_note(output, None, action.obj, action.text)
+
+    def _delay(self, output, p_action, action, n_action):
+        output.append(_DELAY(action.text) if action.text else '...')
+
+    def _divide(self, output, p_action, action, n_action):
+        output.append(_DIVIDE(action.text) if action.text else '====')
+
+    def can_break(self, p_action, action):
+        """
+        Check if a page can end before the action.
+
+        Only before the action drawing something, so no page is left with
+        empty fragments, and not between the choices of alt.
+        """
+        if action.__class__ not in _PAGE_STARTS:
+            return False
+        if self.frag_stack and self.frag_stack[-1].op_name == 'alt':
+            return False
+        return p_action.__class__ is not sd_action.FragBegin
+
+    def close_page(self, output):
+        """
+        Append the lines closing the open fragments.
+        """
+        output += ['end' for frag in self.frag_stack
+                   if frag.op_name != 'choice']
+
+    def reopen_page(self, output):
+        """
+        Append the lines opening again the fragments and activations open at
+        the end of the previous page.
+        """
+        for frag in self.frag_stack:
+            if frag.op_name == 'alt':
+                continue
+            s = 'alt' if frag.op_name == 'choice' else frag.op_name
+            if frag.condition:
+                s += ' %s' % frag.condition
+            output.append(s)
+        output += [_ACTIVATE(call.callee.name)
+                   for call in self.call_stack + [self.current_call]
+                   if call is not None]
+
+
+_EMITTERS = {
+    sd_action.Call: _ScriptEmitter._call,
+    sd_action.ImplicitReturn: _ScriptEmitter._implicit_return,
+    sd_action.Return: _ScriptEmitter._return,
+    sd_action.FragBegin: _ScriptEmitter._frag_begin,
+    sd_action.FragEnd: _ScriptEmitter._frag_end,
+    sd_action.Note: _ScriptEmitter._note,
+    sd_action.Delay: _ScriptEmitter._delay,
+    sd_action.Divide: _ScriptEmitter._divide,
+}
+
+_LINES_PER_CHUNK = 1024
+
+# Actions a page can start with.
+_PAGE_STARTS = (sd_action.Call, sd_action.FragBegin, sd_action.Note,
+                sd_action.Delay, sd_action.Divide)
+
+
+def _script_header(sd_context, raw_header):
+    output = ['@startuml']
 
     if raw_header:
         output.append(raw_header)
     output += sd_context._raw_headers
 
     output += _output_participants(sd_context)
+    return output
+
+
+def _iter_script(sd_context, raw_header):
+    """
+    Generate the lines of PlanUML script in chunks of lists.
+    """
+    output = _script_header(sd_context, raw_header)
 
+    emitter = _ScriptEmitter()
+    emitters = _EMITTERS
     for p_action, action, n_action in util.neighbour(sd_context._sequence):
-        if isinstance(action, sd_action.Call):
-            if 'c' in action.flags:
-                output.append('create %(callee)s' % action.__dict__)
-
-            if re.match(r'<<\w+>>', action.method_name):
-                # such as <<create>> or <<destroy>>
-                output.append('%(caller)s -> %(callee)s : '
-                              '%(method_name)s' % action.__dict__)
-            else:
-                output.append(_get_object_name_for_call(action.caller) +
-                              '-> %(callee)s : %(method_name)s(%(params)s)' %
-                              action.__dict__)
-            if action.notes != [None, None]:
-                caller_side, callee_side = (
-                    ('left', 'right')
-                    if _is_caller_left_side(action.caller, action.callee) else
-                    ('right', 'left'))
-                note_callee, note_caller = action.notes
-                if note_callee:
-                    _generate_note(output, callee_side, obj=None,
-                                   text=note_callee)
-                if note_caller:
-                    _generate_note(output, caller_side, obj=None,
-                                   text=note_caller)
-
-            if not isinstance(n_action, sd_action.ImplicitReturn):
-                output.append('activate %s' % action.callee)
-            call_stack.append(current_call)
-            current_call = action
-
-        elif isinstance(action, sd_action.ImplicitReturn):
-            if not isinstance(p_action, sd_action.Call):
-                output.append('deactivate %s' % current_call.callee)
-
-            if 'd' in current_call.flags:
-                output.append('destroy %s' % current_call.callee)
-
-            current_call = call_stack.pop()
-
-        elif isinstance(action, sd_action.Return):
-            s = _get_object_name_for_call(current_call.caller)
-            s += '<-- %s' % current_call.callee
-            params = str(action.params)
-            if params:
-                s += ': %s' % action.params
-            output.append(s)
-            output.append('deactivate %s' % current_call.callee)
-            current_call = call_stack.pop()
+        emitters[action.__class__](emitter, output, p_action, action,
+                                   n_action)
+        if len(output) >= _LINES_PER_CHUNK:
+            yield output
+            output = []
 
-        elif isinstance(action, sd_action.FragBegin):
-            if action.op_name == 'alt':
-                is_alt_waiting_for_first_choice = True
-            else:
-                if action.op_name == 'choice':
-                    if is_alt_waiting_for_first_choice:
-                        is_alt_waiting_for_first_choice = False
-                        s = 'alt'
-                    else:
-                        s = 'else'
-                else:
-                    s = '%s' % (action.op_name)
-
-                if action.condition:
-                    s += ' %s' % action.condition
-                output.append(s)
-
-        elif isinstance(action, sd_action.FragEnd):
-            if action.op_name == 'choice':
-                pass
-            else:
-                output.append('end')
+    output.append('@enduml')
+    yield output
 
-        elif isinstance(action, sd_action.Note):
-            _generate_note(output, None, action.obj, action.text)
 
-        elif isinstance(action, sd_action.Delay):
-            if action.text:
-                output.append('... {} ...'.format(action.text))
-            else:
-                output.append('...')
+def _iter_pages(sd_context, page_size=None, page_at_divide=False):
+    """
+    Generate the lines of each page without the header and @enduml.
 
-        elif isinstance(action, sd_action.Divide):
-            if action.text:
-                output.append('== {} =='.format(action.text))
-            else:
-                output.append('====')
+    A page ends once it has 'page_size' actions or before a divide if
+    'page_at_divide' as soon as it can. The next page opens again the
+    fragments and activations.
+    """
+    emitter = _ScriptEmitter()
+    emitters = _EMITTERS
+    output = []
+    num_actions = 0
+    for p_action, action, n_action in util.neighbour(sd_context._sequence):
+        if num_actions and (
+                (page_size and num_actions >= page_size) or
+                (page_at_divide and action.__class__ is sd_action.Divide)) \
+                and emitter.can_break(p_action, action):
+            emitter.close_page(output)
+            yield output
+            output = []
+            emitter.reopen_page(output)
+            num_actions = 0
+        emitters[action.__class__](emitter, output, p_action, action,
+                                   n_action)
+        num_actions += 1
+    yield output
+
+
+def _generate_script(sd_context, raw_header):
+    """
+    Generate a string containing PlanUML script.
+    """
+    return '\n'.join(['\n'.join(chunk) for chunk in
+                      _iter_script(sd_context, raw_header)]) + '\n'
 
-    output.append('@enduml\n')
-    return '\n'.join(output)
 
+def _write_chunks(f, chunks):
+    """
+    Write the chunks of lines to the file-like object f.
+    """
+    for chunk in chunks:
+        chunk.append('')
+        f.write('\n'.join(chunk))
+
+
+class ScriptSink:
+    """
+    Action sink writing PlantUML script to the file-like object while the
+    diagram function runs, so the actions are never kept.
+
+    The diagram function should be called with 'sd_context' and then close()
+    to finish the script. The script is the same as generate_script() as long
+    as the objects and the raw headers are defined before the first action.
+    Otherwise, the objects are declared right before the next action.
+    """
+    def __init__(self, f, raw_header=''):
+        self.sd_context = sd.Context(sink=self)
+        self._f = f
+        self._raw_header = raw_header
+        self._emitter = _ScriptEmitter()
+        self._output = []
+        self._num_participants = None
+        self._p_action = None
+        self._action = None
+
+    def append(self, action):
+        if self._action is not None:
+            self._emit(action)
+        self._p_action, self._action = self._action, action
 
-def generate(diagram_name, output_dir, sd_context, options=None):
+    def _output_participants(self, output):
+        objects = self.sd_context._objects
+        if self._num_participants is None:
+            output.append('@startuml')
+            if self._raw_header:
+                output.append(self._raw_header)
+            output += self.sd_context._raw_headers
+            output += _output_participants(self.sd_context)
+        elif len(objects) > self._num_participants:
+            output += [_participant(o) for o in
+                       list(objects.values())[self._num_participants:]]
+        self._num_participants = len(objects)
+
+    def _emit(self, n_action):
+        output = self._output
+        self._output_participants(output)
+        self._emitter.emit(output, self._p_action, self._action, n_action)
+        _write_chunks(self._f, [output])
+        output.clear()
+
+    def close(self):
+        if self._action is not None:
+            self._emit(None)
+            self._action = None
+        else:
+            self._output_participants(self._output)
+        self._output.append('@enduml')
+        _write_chunks(self._f, [self._output])
+        self._output.clear()
+
+
+def _read_raw_header(options):
     header_file = options and options.get('raw_header_file')
-    header = open(header_file).read() if header_file else ''
-    script = _generate_script(sd_context, header)
-    output_path = os.path.join(output_dir, diagram_name + '.puml')
-    with open(output_path, 'wt') as f:
-        f.write(script)
-    return [output_path]
+    return open(header_file).read() if header_file else ''
+
+
+def generate_script(sd_context, options=None):
+    """
+    Generate PlantUML script as it is written to the file.
+    """
+    return _generate_script(sd_context, _read_raw_header(options))
+
+
+def write_script(sd_context, f, options=None):
+    """
+    Write PlantUML script to the file-like object f while generating it.
+    """
+    _write_chunks(f, _iter_script(sd_context, _read_raw_header(options)))
+
+
+def _page_options(options):
+    options = options if options else {}
+    return options.get('page_size'), bool(options.get('page_at_divide'))
+
+
+def is_paged(options):
+    """
+    Check if the options split diagrams into pages.
+    """
+    page_size, page_at_divide = _page_options(options)
+    return bool(page_size) or page_at_divide
+
+
+def generate_pages(sd_context, options=None):
+    """
+    Generate the PlantUML script of each page as list.
+
+    The diagram is split every 'page_size' actions or at divides if
+    'page_at_divide' in the options. Each page declares all the participants.
+    """
+    return generate_paged_scripts(sd_context, options)[1]
+
+
+def page_name(diagram_name, page_index, num_pages, ext):
+    """
+    Return the file name of the page, <name>_<page number><ext> unless a
+    single page.
+    """
+    if num_pages == 1:
+        return diagram_name + ext
+    return '{}_{}{}'.format(diagram_name, page_index + 1, ext)
+
+
+def write_scripts(diagram_name, sink, scripts):
+    """
+    Write the script of each page to the sink as page_name() and return the
+    locations of the written files.
+    """
+    locations = []
+    for i, script in enumerate(scripts):
+        name = page_name(diagram_name, i, len(scripts), '.puml')
+        sink.write(name, script)
+        locations.append(sink.location(name))
+    stats.add_size('script_bytes', sum(len(s) for s in scripts))
+    return locations
+
+
+def generate_paged_scripts(sd_context, options=None):
+    """
+    Return the scripts to write and the script of each page.
+
+    They are the same unless the pages are 'newpage' sections of a single
+    script by 'page_mode' option.
+    """
+    options = options if options else {}
+    header = _script_header(sd_context, _read_raw_header(options))
+    bodies = list(_iter_pages(sd_context, *_page_options(options)))
+    pages = ['\n'.join(header + body + ['@enduml']) + '\n'
+             for body in bodies]
+    if len(pages) == 1 or options.get('page_mode') != 'newpage':
+        return pages, pages
+
+    lines = list(header)
+    for i, body in enumerate(bodies):
+        if i:
+            lines.append('newpage')
+        lines += body
+    lines.append('@enduml')
+    return ['\n'.join(lines) + '\n'], pages
+
+
+def generate_scripts(sd_context, options=None):
+    """
+    Return the scripts to write and the script of each page as
+    generate_paged_scripts(), which are the whole script if not paged.
+
+    The result can be given to generate() of the gen_* modules not to
+    generate the script again.
+    """
+    if is_paged(options):
+        return generate_paged_scripts(sd_context, options)
+    script = generate_script(sd_context, options)
+    return [script], [script]
+
+
+def write_pages(diagram_name, sink, sd_context, options=None):
+    """
+    Write the script split into pages to the sink and return the locations of
+    the written files and the script of each page.
+
+    Each page is written to a file as page_name() or all to a single file as
+    'newpage' sections if 'page_mode' option is 'newpage'.
+    """
+    with stats.phase('script'):
+        scripts, pages = generate_paged_scripts(sd_context, options)
+        return write_scripts(diagram_name, sink, scripts), pages
+
+
+def generate(diagram_name, output_dir, sd_context, options=None, sink=None,
+             scripts=None):
+    """
+    Generate PlantUML file to output_dir or 'sink', output_sink.Sink if
+    given.
+
+    'scripts' is the result of generate_scripts() if already generated.
+    """
+    if sink is None:
+        sink = output_sink.DirectorySink(output_dir)
+    if scripts is not None:
+        with stats.phase('script'):
+            return write_scripts(diagram_name, sink, scripts[0])
+    if is_paged(options):
+        return write_pages(diagram_name, sink, sd_context, options)[0]
+    name = diagram_name + '.puml'
+    with stats.phase('script'):
+        with sink.open(name) as f:
+            write_script(sd_context, f, options)
+            if stats.enabled():
+                stats.add_size('script_bytes', f.tell())
+    return [sink.location(name)]
+
+
+def generate_streaming(diagram_name, output_dir, sd_func, options=None,
+                       sink=None):
+    """
+    Generate PlantUML file to output_dir or 'sink', output_sink.Sink if given
+    while calling the diagram function, sd_func without keeping all the
+    actions in memory. See ScriptSink.
+    """
+    if sink is None:
+        sink = output_sink.DirectorySink(output_dir)
+    name = diagram_name + '.puml'
+    with sink.open(name) as f:
+        script_sink = ScriptSink(f, _read_raw_header(options))
+        sd_func(script_sink.sd_context)
+        script_sink.close()
+    return [sink.location(name)]
@@ -5,18 +5,38 @@ import os
 import string
 import base64
 import zlib
-import requests
+import asyncio
+import functools
+import threading
+import concurrent.futures
 
 from . import gen_plantuml
+from . import stats
+from . import render_cache
+from . import output_sink
+from . import local_renderer
+from . import server_pool
+from . import transport as http_transport
 
 DEFAULT_SERVER_URL = 'http://www.plantuml.com/plantuml'
 
-_BASE64_TO_PLANTUML = {ord(b): b2.encode() for b, b2 in zip(
-    string.ascii_uppercase + string.ascii_lowercase + string.digits + '+/=',
-    string.digits + string.ascii_uppercase + string.ascii_lowercase + '-_=')}
+# Number of images of a diagram, pages or types, rendered concurrently.
+DEFAULT_RENDER_WORKERS = 4
 
+# Scripts longer than this in characters are sent by POST in 'auto' method.
+DEFAULT_POST_THRESHOLD = 4096
 
-def _encode_text_diagram(text_diagram):
+# Default of zlib, which is 6 currently.
+DEFAULT_COMPRESSION_LEVEL = -1
+
+_BASE64_TO_PLANTUML = bytes.maketrans(
+    (string.ascii_uppercase + string.ascii_lowercase + string.digits +
+     '+/').encode(),
+    (string.digits + string.ascii_uppercase + string.ascii_lowercase +
+     '-_').encode())
+
+
+def _encode_text_diagram(text_diagram, level=DEFAULT_COMPRESSION_LEVEL):
     """
     Encode text diagram with zlib/plantuml specific b64 encoding.
 
@@ -27,14 +47,20 @@ def _encode_text_diagram(text_diagram):
 
     See https://plantuml.com/text-encoding:
     """
-    utf_encoded = text_diagram.encode('utf-8')
-    compressed = zlib.compress(utf_encoded)
-    # Remove zlib header CMF/CM[2 bytes] and CRC[4 bytes] (RFC1950). Note that
-    # Python zlib retains those but Java.util.zip.Inflater from PlantUML server
-    # does not expect them.
-    compressed = compressed[2:-4]
-    b64_encoded = base64.b64encode(compressed)
-    return b''.join(_BASE64_TO_PLANTUML[b] for b in b64_encoded)
+    # Raw deflate without zlib header and checksum(RFC1950), which
+    # Java.util.zip.Inflater from PlantUML server does not expect.
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    compressed = (compressor.compress(text_diagram.encode('utf-8')) +
+                  compressor.flush())
+    return base64.b64encode(compressed).translate(_BASE64_TO_PLANTUML)
+
+
+def encode_many(text_diagrams, level=DEFAULT_COMPRESSION_LEVEL):
+    """
+    Encode text diagrams as _encode_text_diagram() and return them as list.
+    """
+    encode = _encode_text_diagram
+    return [encode(t, level) for t in text_diagrams]
 
 
 def _get_image_type(output_image_file_name):
@@ -49,40 +75,375 @@ def _get_server_url(server_url):
     return server_url[:-1] if server_url.endswith('/') else server_url
 
 
-def generate_image(plantuml_file_path, image_file_path, server_url=None):
+def _get_server_urls(server_url):
+    """
+    Return the list of server URLs given as a list or comma separated.
+    """
+    if isinstance(server_url, str):
+        server_url = server_url.split(',')
+    urls = [_get_server_url(u.strip()) for u in server_url or [] if u.strip()]
+    return urls if urls else [DEFAULT_SERVER_URL]
+
+
+# Small diagram rendered to check the health of servers.
+_PROBE_DIAGRAM = '@startuml\na -> b\n@enduml\n'
+
+
+def _probe(transport, server_url):
+    return transport.probe('{}/txt/{}'.format(
+        server_url, _encode_text_diagram(_PROBE_DIAGRAM).decode('utf-8')))
+
+
+class ServerRenderer:
+    """
+    Renderer asking PlantUML server with the script.
+
+    The script is encoded in the URL of GET or sent as the body of POST by
+    'http_method', 'get' or 'post'. 'auto' sends the scripts longer than
+    'post_threshold' characters by POST, which avoids the limit of URL length
+    and the encoding.
+
+    'compression_level' is of zlib, which trades the URL length for time.
+
+    'server_url' can be multiple servers as a list or comma separated, which
+    are chosen by 'pool', ServerPool. The one shared for the servers by
+    get_server_pool() is used if not given. The default transport does not
+    retry with a pool as get_transport().
+    """
+    def __init__(self, server_url=None, transport=None,
+                 compression_level=DEFAULT_COMPRESSION_LEVEL,
+                 http_method='auto', post_threshold=DEFAULT_POST_THRESHOLD,
+                 pool=None):
+        urls = _get_server_urls(server_url)
+        self.server_url = urls[0]
+        if pool is None and len(urls) > 1:
+            pool = get_server_pool({'server_url': urls})
+        self.pool = pool
+        self.transport = (transport if transport else
+                          get_transport({}, pooled=pool is not None))
+        self.compression_level = compression_level
+        self.http_method = http_method
+        self.post_threshold = post_threshold
+
+    def prepare(self, text_diagram):
+        """
+        Return render(image_type, image_file_path=None) for the script, which
+        writes the image and returns the number of bytes written or returns
+        the image as bytes if no path. The script is encoded once on the first
+        call and shared by all the image types.
+        """
+        return _Request(self, text_diagram)
+
+    def render(self, text_diagram, image_type):
+        """
+        Return the image of the script as bytes.
+        """
+        return self.prepare(text_diagram)(image_type)
+
+    def render_to_file(self, text_diagram, image_type, image_file_path):
+        """
+        Write the image of the script and return the number of bytes written.
+        """
+        return self.prepare(text_diagram)(image_type, image_file_path)
+
+
+class _Request:
+    def __init__(self, renderer, text_diagram):
+        self.renderer = renderer
+        self.text_diagram = text_diagram
+        self._lock = threading.Lock()
+        self._data = None
+        self._encoded = None
+
+    def _prepare(self):
+        renderer = self.renderer
+        if renderer.http_method == 'post' or (
+                renderer.http_method == 'auto' and
+                len(self.text_diagram) > renderer.post_threshold):
+            self._data = self.text_diagram.encode('utf-8')
+        else:
+            with stats.phase('encode'):
+                self._encoded = _encode_text_diagram(
+                    self.text_diagram,
+                    renderer.compression_level).decode('utf-8')
+
+    def __call__(self, image_type, image_file_path=None):
+        with self._lock:
+            if self._data is None and self._encoded is None:
+                self._prepare()
+        renderer = self.renderer
+        transport = renderer.transport
+        if self._data is not None:
+            data = self._data
+            stats.add_size('post_bytes', len(data))
+
+            def send(server_url, output_file_path):
+                return transport.post(server_url + '/' + image_type, data,
+                                      output_file_path)
+        else:
+            path = "/" + image_type + "/" + self._encoded
+            stats.add_size('url_length', len(renderer.server_url) + len(path))
+
+            def send(server_url, output_file_path):
+                return transport.fetch(server_url + path, output_file_path)
+
+        with stats.phase('render'):
+            if renderer.pool is None:
+                return send(renderer.server_url, image_file_path)
+            return renderer.pool.request(send, image_file_path)
+
+
+def generate_image(plantuml_file_path, image_file_path, server_url=None,
+                   cache=None, transport=None, renderer=None):
     """
     Generate image file from plantuml text file using server.
 
     The type of image is determined by the extension name of image_file_path.
     Default public PlantUML server is used if server_url is None.
+    If cache, RenderCache object is given, the server is asked only when the
+    image is not found in the cache.
+    The shared default HttpTransport is used if transport is None.
+    'renderer' can be given to use other than the server, e.g. LocalRenderer.
     """
     with open(plantuml_file_path, 'rt') as input_file:
         text_diagram = input_file.read()
+    if not renderer:
+        renderer = ServerRenderer(server_url, transport)
+    _render_cached(text_diagram, image_file_path, cache,
+                   functools.partial(renderer.render_to_file, text_diagram))
 
-    encoded_diagram = _encode_text_diagram(text_diagram)
-    diagram_url = encoded_diagram.decode('utf-8')
 
+def _render_cached(text_diagram, image_file_path, cache, render):
+    """
+    Place the image from the cache or by render(image_type, image_file_path).
+    """
     image_type = _get_image_type(image_file_path)
-    server_url = _get_server_url(server_url)
-    url = server_url + "/" + image_type + "/" + diagram_url
-    response = requests.get(url)
+    if cache:
+        with stats.phase('cache'):
+            cached = cache.get(text_diagram, image_type, image_file_path)
+        if cached:
+            stats.add_size('cached_images', 1)
+            return
 
-    if response.status_code == 200:
-        with open(image_file_path, 'wb') as output_file:
-            output_file.write(response.content)
-    else:
-        response.raise_for_status()
+    size = render(image_type, image_file_path)
+    stats.add_size('rendered_bytes', size)
+
+    if cache:
+        with stats.phase('cache'):
+            cache.put(text_diagram, image_type, image_file_path)
+
+
+async def agenerate_image(plantuml_file_path, image_file_path,
+                          server_url=None, cache=None, transport=None,
+                          renderer=None, executor=None):
+    """
+    Async version of generate_image() not to block the event loop.
+
+    The blocking part is run by 'executor' or the default executor of the
+    loop if None.
+    """
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(executor, functools.partial(
+        generate_image, plantuml_file_path, image_file_path, server_url,
+        cache, transport, renderer))
+
+
+_transports = {}
+
+
+def get_transport(options, pooled=False):
+    """
+    Return HttpTransport shared for the same transport options.
+
+    If 'pooled', the transport is for ServerPool and does not retry, since
+    the pool sends the failed requests to the next server and counts every
+    failure. Connections are not shared with forked processes.
+    """
+    timeout = options.get('timeout')
+    retries = 0 if pooled else options.get('retries')
+    config = (http_transport.DEFAULT_TIMEOUT if timeout is None else timeout,
+              http_transport.DEFAULT_RETRIES if retries is None else retries)
+    key = (os.getpid(),) + config
+    if key not in _transports:
+        _transports[key] = http_transport.HttpTransport(
+            timeout=config[0], retries=config[1])
+    return _transports[key]
+
+
+_server_pools = {}
+
+
+def get_server_pool(options):
+    """
+    Return ServerPool shared for the same servers and 'hedge_after' option or
+    None if a single server.
+
+    The observed latency and errors are not shared with forked processes.
+    """
+    urls = tuple(_get_server_urls(options.get('server_url')))
+    if len(urls) == 1:
+        return None
+    key = (os.getpid(), urls, options.get('hedge_after'))
+    if key not in _server_pools:
+        _server_pools[key] = server_pool.ServerPool(
+            urls, functools.partial(_probe, get_transport(options, True)),
+            hedge_after=options.get('hedge_after'))
+    return _server_pools[key]
+
+
+_local_renderers = {}
 
 
-def generate(diagram_name, output_dir, sd_context, options, image_type):
+def get_renderer(options):
+    """
+    Return the renderer selected by 'renderer' option, 'server' or 'local'.
+
+    LocalRenderer is shared for the same options except with forked processes.
+    """
+    if options.get('renderer', 'server') == 'server':
+        level = options.get('compression_level')
+        post_threshold = options.get('post_threshold')
+        pool = get_server_pool(options)
+        return ServerRenderer(
+            options.get('server_url'),
+            get_transport(options, pooled=pool is not None),
+            DEFAULT_COMPRESSION_LEVEL if level is None else level,
+            options.get('http_method') or 'auto',
+            (DEFAULT_POST_THRESHOLD if post_threshold is None else
+             post_threshold),
+            pool=pool)
+
+    command = options.get('local_command')
+    num_workers = options.get('local_workers')
+    config = (local_renderer.DEFAULT_COMMAND if command is None else command,
+              (local_renderer.DEFAULT_NUM_WORKERS if num_workers is None else
+               num_workers))
+    key = (os.getpid(),) + config
+    if key not in _local_renderers:
+        _local_renderers[key] = local_renderer.LocalRenderer(*config)
+    return _local_renderers[key]
+
+
+_render_caches = {}
+
+
+def get_render_cache(options):
+    """
+    Return RenderCache shared for the same cache options or None if disabled.
+
+    As in the command line, 'cache_max_size' is in MB and 'cache_max_age' is
+    in days.
+    """
+    cache_dir = options.get('cache_dir')
+    if not cache_dir:
+        return None
+    max_size = options.get('cache_max_size')
+    max_age = options.get('cache_max_age')
+    config = (cache_dir,
+              (render_cache.DEFAULT_MAX_SIZE if max_size is None else
+               int(max_size * 1024 * 1024)),
+              (render_cache.DEFAULT_MAX_AGE if max_age is None else
+               max_age * 24 * 60 * 60),
+              bool(options.get('cache_link')))
+    if config not in _render_caches:
+        _render_caches[config] = render_cache.RenderCache(*config)
+    return _render_caches[config]
+
+
+def generate(diagram_name, output_dir, sd_context, options, image_type,
+             sink=None, scripts=None):
     """
     Generate both plantuml file and image file.
     """
-    generated_files = gen_plantuml.generate(diagram_name,
-                                            output_dir, sd_context, options)
-    plantuml_file_path = generated_files[0]
-    image_path = os.path.join(output_dir, diagram_name + '.' + image_type)
-    generate_image(plantuml_file_path, image_path, options.get('server_url'))
+    return generate_many(diagram_name, output_dir, sd_context, options,
+                         [image_type], sink, scripts)
+
+
+def generate_many(diagram_name, output_dir, sd_context, options, image_types,
+                  sink=None, scripts=None):
+    """
+    Generate plantuml file once and the image of each type from it to
+    output_dir or 'sink', output_sink.Sink if given. 'scripts' is the result
+    of gen_plantuml.generate_scripts() if already generated.
+
+    The script is encoded once for all the types and the images, including
+    the ones of the pages, are rendered concurrently.
+    """
+    options = options if options else {}
+    if sink is None:
+        sink = output_sink.DirectorySink(output_dir)
+    with stats.phase('script'):
+        if scripts is None:
+            scripts = gen_plantuml.generate_scripts(sd_context, options)
+        generated_files = gen_plantuml.write_scripts(diagram_name, sink,
+                                                     scripts[0])
+    pages = scripts[1]
+
+    cache = get_render_cache(options)
+    renderer = get_renderer(options)
+    renders = []
+    for i, page in enumerate(pages):
+        render = renderer.prepare(page)
+        for image_type in image_types:
+            name = gen_plantuml.page_name(diagram_name, i, len(pages),
+                                          '.' + image_type)
+            renders.append(functools.partial(_render_to_sink, page, name,
+                                             sink, cache, render))
+    return generated_files + _call_all(renders, options)
+
+
+def _render_to_sink(text_diagram, name, sink, cache, render):
+    """
+    Write the image to the sink and return the location.
+    """
+    path = sink.path(name)
+    if path is not None:
+        _render_cached(text_diagram, path, cache, render)
+        return sink.location(name)
+
+    image_type = _get_image_type(name)
+    image = None
+    if cache:
+        with stats.phase('cache'):
+            image = cache.load(text_diagram, image_type)
+    if image is not None:
+        stats.add_size('cached_images', 1)
+    else:
+        image = render(image_type)
+        stats.add_size('rendered_bytes', len(image))
+        if cache:
+            with stats.phase('cache'):
+                cache.store(text_diagram, image_type, image)
+    sink.write(name, image)
+    return sink.location(name)
+
+
+def _call_all(calls, options):
+    """
+    Call the functions concurrently and return the results in order. The
+    stats are recorded to the diagram of the caller.
+    """
+    num_workers = options.get('render_workers') or DEFAULT_RENDER_WORKERS
+    if len(calls) == 1 or num_workers == 1:
+        return [call() for call in calls]
+    with concurrent.futures.ThreadPoolExecutor(
+            min(num_workers, len(calls))) as executor:
+        futures = [executor.submit(stats.bind(call)) for call in calls]
+        return [future.result() for future in futures]
+
+
+def render_many(text_diagram, image_types, options=None):
+    """
+    Return the image of each type for the script as bytes without writing any
+    file. The renderer is chosen by the options as generate() and the images
+    are rendered concurrently.
+    """
+    options = options if options else {}
+    render = get_renderer(options).prepare(text_diagram)
 
-    generated_files.append(image_path)
-    return generated_files
+    def render_image(image_type):
+        image = render(image_type)
+        stats.add_size('rendered_bytes', len(image))
+        return image
+    return _call_all([functools.partial(render_image, t)
+                      for t in image_types], options)
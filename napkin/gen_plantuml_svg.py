@@ -3,7 +3,10 @@ Generate PlantUML script and PNG file
 """
 from . import gen_plantuml_img
 
+IMAGE_TYPE = 'svg'
 
-def generate(diagram_name, output_dir, sd_context, options=None):
+
+def generate(diagram_name, output_dir, sd_context, options=None, sink=None,
+             scripts=None):
     return gen_plantuml_img.generate(diagram_name, output_dir, sd_context,
-                                     options, 'svg')
+                                     options, IMAGE_TYPE, sink, scripts)
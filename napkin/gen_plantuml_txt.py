@@ -3,7 +3,10 @@ Generate PlantUML script and ascii art TXT file
 """
 from . import gen_plantuml_img
 
+IMAGE_TYPE = 'txt'
 
-def generate(diagram_name, output_dir, sd_context, options=None):
+
+def generate(diagram_name, output_dir, sd_context, options=None, sink=None,
+             scripts=None):
     return gen_plantuml_img.generate(diagram_name, output_dir, sd_context,
-                                     options, 'txt')
+                                     options, IMAGE_TYPE, sink, scripts)
@@ -0,0 +1,160 @@
+"""
+Local renderer using PlantUML command in pipe mode
+"""
+import os
+import shlex
+import atexit
+import threading
+import subprocess
+
+from . import util
+from . import stats
+
+DELIMITER = '__NAPKIN_END_OF_IMAGE__'
+DEFAULT_COMMAND = 'plantuml -pipe -pipedelimitor {delimiter} -t{type}'
+DEFAULT_NUM_WORKERS = 2
+
+_READ_SIZE = 64 * 1024
+
+
+class RendererError(Exception):
+    pass
+
+
+class _Worker:
+    """
+    Long-lived process reading scripts from stdin and writing images to
+    stdout, each followed by the delimiter line.
+    """
+    def __init__(self, args):
+        self.process = subprocess.Popen(args, stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE)
+        self._buffer = b''
+
+    def render(self, text_diagram):
+        if not text_diagram.endswith('\n'):
+            text_diagram += '\n'
+        self.process.stdin.write(text_diagram.encode('utf-8'))
+        self.process.stdin.flush()
+
+        delimiter = DELIMITER.encode()
+        fd = self.process.stdout.fileno()
+        searched = 0
+        while True:
+            index = self._buffer.find(delimiter, searched)
+            if index >= 0:
+                break
+            searched = max(0, len(self._buffer) - len(delimiter))
+            data = os.read(fd, _READ_SIZE)
+            if not data:
+                raise RendererError(
+                    'Renderer exited with {}'.format(self.process.wait()))
+            self._buffer += data
+
+        image = self._buffer[:index]
+        rest = self._buffer[index + len(delimiter):]
+        self._buffer = rest[2:] if rest.startswith(b'\r\n') else (
+            rest[1:] if rest.startswith(b'\n') else rest)
+        return image
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+            self.process.wait(5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+
+
+class LocalRenderer:
+    """
+    Pool of warm renderer processes per image type.
+
+    'command' is the renderer command line. '{type}' and '{delimiter}' in it
+    are replaced with the image type and DELIMITER, which the command should
+    write after each image. At most 'num_workers' processes are started for
+    each image type and they are kept until close().
+    """
+    def __init__(self, command=DEFAULT_COMMAND,
+                 num_workers=DEFAULT_NUM_WORKERS):
+        self.command = command
+        self.num_workers = num_workers
+        self._idle_workers = {}
+        self._num_started = {}
+        self._condition = threading.Condition()
+        atexit.register(self.close)
+
+    def _acquire(self, image_type):
+        with self._condition:
+            idle_workers = self._idle_workers.setdefault(image_type, [])
+            while (not idle_workers and
+                   self._num_started.get(image_type, 0) >= self.num_workers):
+                self._condition.wait()
+            if idle_workers:
+                return idle_workers.pop()
+            self._num_started[image_type] = (
+                self._num_started.get(image_type, 0) + 1)
+
+        args = [a.format(type=image_type, delimiter=DELIMITER)
+                for a in shlex.split(self.command)]
+        try:
+            return _Worker(args)
+        except BaseException:
+            self._release(image_type, None)
+            raise
+
+    def _release(self, image_type, worker):
+        with self._condition:
+            if worker:
+                self._idle_workers.setdefault(image_type, []).append(worker)
+            else:
+                self._num_started[image_type] = (
+                    self._num_started.get(image_type, 1) - 1)
+            self._condition.notify()
+
+    def render(self, text_diagram, image_type):
+        """
+        Return the image of the script as bytes.
+        """
+        worker = self._acquire(image_type)
+        try:
+            image = worker.render(text_diagram)
+        except BaseException:
+            # The state of the worker is unknown.
+            worker.close()
+            self._release(image_type, None)
+            raise
+        self._release(image_type, worker)
+        return image
+
+    def prepare(self, text_diagram):
+        """
+        Return render(image_type, image_file_path=None) for the script as
+        ServerRenderer.
+        """
+        def render(image_type, image_file_path=None):
+            if image_file_path is not None:
+                return self.render_to_file(text_diagram, image_type,
+                                           image_file_path)
+            with stats.phase('render'):
+                return self.render(text_diagram, image_type)
+        return render
+
+    def render_to_file(self, text_diagram, image_type, image_file_path):
+        """
+        Write the image of the script and return the number of bytes written.
+        """
+        with stats.phase('render'):
+            image = self.render(text_diagram, image_type)
+            with util.open_atomic(image_file_path) as f:
+                f.write(image)
+        return len(image)
+
+    def close(self):
+        with self._condition:
+            workers = [w for idle in self._idle_workers.values()
+                       for w in idle]
+            self._idle_workers.clear()
+            self._num_started.clear()
+        for worker in workers:
+            worker.close()
@@ -0,0 +1,102 @@
+"""
+Manifest of generated diagrams for incremental generation
+"""
+import os
+import json
+import hashlib
+
+from . import util
+
+MANIFEST_FILE_NAME = '.napkin_manifest.json'
+
+# Options affecting the generated files except the script itself.
+_OUTPUT_OPTIONS = ('server_url', 'renderer', 'local_command', 'page_size',
+                   'page_at_divide', 'page_mode')
+
+
+def fingerprint(script, output_format, options):
+    """
+    Return the fingerprint of the generated files of a diagram.
+    """
+    h = hashlib.sha256()
+    h.update(output_format.encode('utf-8') + b'\0')
+    for name in _OUTPUT_OPTIONS:
+        h.update('{}={}\0'.format(name, options.get(name)).encode('utf-8'))
+    h.update(script.encode('utf-8'))
+    return h.hexdigest()
+
+
+class Manifest:
+    """
+    Fingerprint and generated files of each diagram in the output directory.
+
+    The file paths are kept relative to the output directory.
+    """
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, MANIFEST_FILE_NAME)
+        try:
+            with open(self.path, 'rt') as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+
+    def _abs_path(self, rel_path):
+        return os.path.join(self.output_dir, rel_path)
+
+    def files(self, diagram_name):
+        entry = self.entries.get(diagram_name)
+        return [self._abs_path(f) for f in entry['files']] if entry else []
+
+    def fingerprint(self, diagram_name):
+        """
+        Return the recorded fingerprint or None if any file is missing.
+        """
+        entry = self.entries.get(diagram_name)
+        if not entry:
+            return None
+        if not all(os.path.exists(f) for f in self.files(diagram_name)):
+            return None
+        return entry['fingerprint']
+
+    def update(self, diagram_name, fingerprint, generated_files):
+        """
+        Record the newly generated files and remove the stale ones.
+        """
+        old_files = set(self.files(diagram_name))
+        for f in old_files - set(generated_files):
+            _remove_file(f)
+        self.entries[diagram_name] = {
+            'fingerprint': fingerprint,
+            'files': [os.path.relpath(f, self.output_dir)
+                      for f in generated_files]}
+
+    def remove(self, diagram_name):
+        """
+        Remove the generated files of the diagram and return them.
+        """
+        files = self.files(diagram_name)
+        for f in files:
+            _remove_file(f)
+        del self.entries[diagram_name]
+        return files
+
+    def remove_orphans(self, diagram_names):
+        """
+        Remove the diagrams not in diagram_names and return the removed files.
+        """
+        removed = []
+        for name in [n for n in self.entries if n not in diagram_names]:
+            removed.append(self.remove(name))
+        return removed
+
+    def save(self):
+        with util.open_atomic(self.path, 'wt') as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,190 @@
+"""
+Output sinks the generated files are written to
+"""
+import io
+import os
+import time
+import threading
+import contextlib
+import collections
+
+from . import util
+
+
+class Sink:
+    """
+    Destination of the generated files, which are given by the names
+    relative to the output.
+
+    A sink is closed to finish the output, which is done by the with
+    statement. The output is discarded if the block raises.
+    """
+    def path(self, name):
+        """
+        Return the file system path to write the file directly or None if
+        it should be given by write().
+        """
+        return None
+
+    def location(self, name):
+        """
+        Return the location of the file to report.
+        """
+        return name
+
+    def write(self, name, data):
+        """
+        Write the file of data, bytes or str encoded in UTF-8.
+        """
+        raise NotImplementedError
+
+    @contextlib.contextmanager
+    def open(self, name):
+        """
+        Open the text file to write, which is written when closed.
+        """
+        f = io.StringIO()
+        yield f
+        self.write(name, f.getvalue())
+
+    def close(self):
+        pass
+
+    def abort(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def _to_bytes(data):
+    return data.encode('utf-8') if isinstance(data, str) else data
+
+
+class DirectorySink(Sink):
+    """
+    Files in the directory, each of which is replaced atomically.
+    """
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+
+    def path(self, name):
+        return os.path.join(self.output_dir, name)
+
+    def location(self, name):
+        return self.path(name)
+
+    def write(self, name, data):
+        with util.open_atomic(self.path(name)) as f:
+            f.write(_to_bytes(data))
+
+    def open(self, name):
+        return util.open_atomic(self.path(name), 'wt')
+
+
+class MemorySink(Sink):
+    """
+    Files kept in 'files', ordered dict from the name to the bytes.
+    """
+    def __init__(self):
+        self.files = collections.OrderedDict()
+
+    def write(self, name, data):
+        self.files[name] = _to_bytes(data)
+
+
+class _ArchiveSink(Sink):
+    """
+    Archive written to a temporary file, which is renamed to 'path' when
+    closed, so readers never see a partial archive.
+    """
+    def __init__(self, path):
+        self.archive_path = path
+        self._lock = threading.Lock()
+        fd, self._tmp_path = util.create_temp_file(path)
+        os.close(fd)
+        self._archive = self._open_archive(self._tmp_path)
+
+    def location(self, name):
+        return '{}:{}'.format(self.archive_path, name)
+
+    def close(self):
+        if self._archive is None:
+            return
+        self._archive.close()
+        self._archive = None
+        os.replace(self._tmp_path, self.archive_path)
+
+    def abort(self):
+        if self._archive is None:
+            return
+        self._archive.close()
+        self._archive = None
+        os.remove(self._tmp_path)
+
+
+class ZipSink(_ArchiveSink):
+    """
+    Zip archive, compressed by 'compression', ZIP_DEFLATED as default.
+    """
+    def __init__(self, path, compression=None):
+        # Imported here not to slow down the start of napkin_client.
+        import zipfile
+        self._zipfile = zipfile
+        self.compression = (zipfile.ZIP_DEFLATED if compression is None else
+                            compression)
+        super().__init__(path)
+
+    def _open_archive(self, path):
+        return self._zipfile.ZipFile(path, 'w', self.compression)
+
+    def write(self, name, data):
+        info = self._zipfile.ZipInfo(name, time.localtime()[:6])
+        info.compress_type = self.compression
+        info.external_attr = 0o644 << 16
+        with self._lock:
+            self._archive.writestr(info, _to_bytes(data))
+
+
+class TarSink(_ArchiveSink):
+    """
+    Tar archive, compressed by gzip if 'compression' is 'gz'.
+    """
+    def __init__(self, path, compression=''):
+        # Imported here not to slow down the start of napkin_client.
+        import tarfile
+        self._tarfile = tarfile
+        self.compression = compression
+        super().__init__(path)
+
+    def _open_archive(self, path):
+        return self._tarfile.open(path, 'w:' + self.compression)
+
+    def write(self, name, data):
+        data = _to_bytes(data)
+        info = self._tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = time.time()
+        info.mode = 0o644
+        with self._lock:
+            self._archive.addfile(info, io.BytesIO(data))
+
+
+def open_bundle(path):
+    """
+    Return the archive sink for the extension of path, .zip, .tar, .tar.gz or
+    .tgz.
+    """
+    if path.endswith('.zip'):
+        return ZipSink(path)
+    if path.endswith(('.tar.gz', '.tgz')):
+        return TarSink(path, 'gz')
+    if path.endswith('.tar'):
+        return TarSink(path)
+    raise ValueError('Unsupported bundle : {}'.format(path))
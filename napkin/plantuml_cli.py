@@ -1,10 +1,11 @@
 import os
 import argparse
 
-from .gen_plantuml_img import generate_image
+from .gen_plantuml_img import (generate_image, get_render_cache,
+                               get_renderer)
 
 _DESCRIPTION = ('Simple tool to convert PlantUML text file into image file '
-                'using server.')
+                'using server or local command.')
 
 
 def _parse_args():
@@ -12,7 +13,34 @@ def _parse_args():
         formatter_class=argparse.RawDescriptionHelpFormatter,
         description=_DESCRIPTION)
 
-    parser.add_argument('--server-url', help='Default is the public server')
+    parser.add_argument('--server-url', metavar='URL[,URL...]',
+                        help=('Default is the public server. Renders are '
+                              'spread over multiple servers'))
+    parser.add_argument('--hedge-after', type=float, metavar='SEC',
+                        help=('send the request also to the next server if '
+                              'no response in SEC'))
+    parser.add_argument('--renderer', choices=('server', 'local'),
+                        default='server',
+                        help='render by the server or a local command')
+    parser.add_argument('--local-command', metavar='CMD',
+                        help=('command for the local renderer. {type} and '
+                              '{delimiter} are replaced'))
+    parser.add_argument('--local-workers', type=int, metavar='N',
+                        help='number of processes of the local renderer')
+    parser.add_argument('--http-method', choices=('auto', 'get', 'post'),
+                        default='auto',
+                        help=('send the script by GET or POST. auto uses '
+                              'POST for long scripts'))
+    parser.add_argument('--post-threshold', type=int, metavar='CHARS',
+                        help=('length of the script to use POST for auto '
+                              '(default: 4096)'))
+    parser.add_argument('--timeout', type=float, metavar='SEC',
+                        help='timeout to wait for the server (default: 60)')
+    parser.add_argument('--retries', type=int, metavar='N',
+                        help=('number of retries on failure (default: 3). '
+                              'Multiple servers fail over instead'))
+    parser.add_argument('--cache-dir', metavar='DIR',
+                        help='directory to cache rendered images')
     parser.add_argument('input_file', help='PlantUML text file ')
     parser.add_argument(
         'output_file',
@@ -24,4 +52,6 @@ def _parse_args():
 def main():
     args = _parse_args()
     _, image_type = os.path.splitext(args.output_file)
-    generate_image(args.input_file, args.output_file, args.server_url)
+    generate_image(args.input_file, args.output_file,
+                   cache=get_render_cache(vars(args)),
+                   renderer=get_renderer(vars(args)))
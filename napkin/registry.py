@@ -0,0 +1,66 @@
+"""
+Registry of the sequence diagrams to generate
+"""
+import collections
+
+
+class Registry:
+    """
+    Sequence diagrams registered by seq_diagram, one for each name in the
+    order of registration.
+
+    Registering a diagram of the name already registered replaces the old one
+    in its place. Running the same script again, e.g. in a notebook or a
+    watch loop, does not add duplicates and does not keep the old functions
+    and their module globals alive.
+
+    ex)
+        registry = napkin.Registry()
+
+        @napkin.seq_diagram(registry=registry)
+        def sd_simple(c):
+            ...
+
+        napkin.generate(registry=registry)
+    """
+    def __init__(self, diagrams=()):
+        self._diagrams = collections.OrderedDict()
+        for d in diagrams:
+            self.register(d)
+
+    def register(self, diagram):
+        """
+        Register the diagram replacing the one of the same name.
+        """
+        self._diagrams[diagram.name] = diagram
+
+    def unregister(self, diagram):
+        """
+        Unregister the diagram given by itself or the name and return it.
+
+        A diagram given by itself is not unregistered if another diagram of
+        the name replaced it. None is returned if nothing is unregistered.
+        """
+        if isinstance(diagram, str):
+            return self._diagrams.pop(diagram, None)
+        if self._diagrams.get(diagram.name) is not diagram:
+            return None
+        return self._diagrams.pop(diagram.name)
+
+    def clear(self):
+        self._diagrams.clear()
+
+    def get(self, name):
+        """
+        Return the diagram of the name or None if not registered.
+        """
+        return self._diagrams.get(name)
+
+    def __contains__(self, name):
+        return name in self._diagrams
+
+    def __iter__(self):
+        return iter(list(self._diagrams.values()))
+
+    def __len__(self):
+        return len(self._diagrams)
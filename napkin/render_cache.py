@@ -0,0 +1,201 @@
+"""
+Content-addressed on-disk cache of rendered images
+"""
+import os
+import time
+import shutil
+import hashlib
+import threading
+import collections
+
+from . import util
+
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60
+
+
+class RenderCache:
+    """
+    Persistent cache of images keyed on the hash of script text and image type.
+
+    Entries are plain files under cache_dir. The mtime of an entry is
+    refreshed on every hit, so the least recently used entries are evicted
+    first once the total size exceeds max_size(bytes). Entries older than
+    max_age(seconds) are never used and evicted.
+
+    On a hit, the entry is copied into place or hard-linked if 'link' is true.
+
+    Processes sharing cache_dir evict entries on their own, so an entry
+    removed by another one at any point is taken as a miss.
+    """
+    def __init__(self, cache_dir, max_size=DEFAULT_MAX_SIZE,
+                 max_age=DEFAULT_MAX_AGE, link=False):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.max_age = max_age
+        self.link = link
+
+        # Entry path -> [size, mtime] from the least recently used one,
+        # which is loaded lazily.
+        self._entries = None
+        self._total_size = 0
+        # Pages of a diagram are rendered by threads sharing the cache.
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(text_diagram, image_type):
+        h = hashlib.sha256()
+        h.update(image_type.encode('utf-8') + b'\0')
+        h.update(text_diagram.encode('utf-8'))
+        return h.hexdigest()
+
+    def _entry_path(self, text_diagram, image_type):
+        key = self.key(text_diagram, image_type)
+        return os.path.join(self.cache_dir, key[:2], key + '.' + image_type)
+
+    def get(self, text_diagram, image_type, image_file_path):
+        """
+        Place the cached image to image_file_path.
+
+        Return false if there is no valid entry.
+        """
+        path = self._entry_path(text_diagram, image_type)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return False
+
+        now = time.time()
+        if now - st.st_mtime > self.max_age:
+            with self._lock:
+                self._remove(path)
+            return False
+
+        _remove_file(image_file_path)
+        try:
+            if self.link:
+                try:
+                    os.link(path, image_file_path)
+                except OSError:
+                    shutil.copyfile(path, image_file_path)
+            else:
+                shutil.copyfile(path, image_file_path)
+        except FileNotFoundError:
+            with self._lock:
+                self._remove(path)
+            return False
+
+        self._touch(path, st.st_size)
+        return True
+
+    def load(self, text_diagram, image_type):
+        """
+        Return the cached image as bytes or None if there is no valid entry.
+        """
+        path = self._entry_path(text_diagram, image_type)
+        try:
+            with open(path, 'rb') as f:
+                st = os.fstat(f.fileno())
+                if time.time() - st.st_mtime <= self.max_age:
+                    image = f.read()
+                else:
+                    image = None
+        except FileNotFoundError:
+            return None
+        if image is None:
+            with self._lock:
+                self._remove(path)
+            return None
+        self._touch(path, len(image))
+        return image
+
+    def store(self, text_diagram, image_type, image):
+        """
+        Store the image, bytes and evict old entries if necessary.
+        """
+        path = self._entry_path(text_diagram, image_type)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with util.open_atomic(path) as f:
+            f.write(image)
+        self._added(path, len(image))
+
+    def _touch(self, path, size):
+        now = time.time()
+        try:
+            os.utime(path, (now, now))
+        except FileNotFoundError:
+            # Evicted by another process after being read.
+            with self._lock:
+                self._remove(path)
+            return
+        with self._lock:
+            self._load()
+            self._add_entry(path, size, now)
+
+    def _added(self, path, size):
+        with self._lock:
+            self._load()
+            self._add_entry(path, size, time.time())
+            self._evict()
+
+    def put(self, text_diagram, image_type, image_file_path):
+        """
+        Store a copy of image_file_path and evict old entries if necessary.
+        """
+        path = self._entry_path(text_diagram, image_type)
+        entry_dir = os.path.dirname(path)
+        os.makedirs(entry_dir, exist_ok=True)
+
+        with open(image_file_path, 'rb') as src, \
+                util.open_atomic(path) as dst:
+            shutil.copyfileobj(src, dst)
+            size = src.tell()
+
+        # Not stat again as another process may have evicted it already.
+        self._added(path, size)
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        self._entries = collections.OrderedDict()
+        self._total_size = 0
+        now = time.time()
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for f in files:
+                path = os.path.join(root, f)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if now - st.st_mtime > self.max_age:
+                    self._remove(path)
+                else:
+                    entries.append((st.st_mtime, path, st.st_size))
+        # Sorted only once, then kept in the order of use.
+        for mtime, path, size in sorted(entries):
+            self._add_entry(path, size, mtime)
+
+    def _add_entry(self, path, size, mtime):
+        old = self._entries.get(path)
+        if old:
+            self._total_size -= old[0]
+            self._entries.move_to_end(path)
+        self._entries[path] = [size, mtime]
+        self._total_size += size
+
+    def _remove(self, path):
+        _remove_file(path)
+        if self._entries and path in self._entries:
+            self._total_size -= self._entries.pop(path)[0]
+
+    def _evict(self):
+        while self._total_size > self.max_size and self._entries:
+            self._remove(next(iter(self._entries)))
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
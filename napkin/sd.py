@@ -2,6 +2,7 @@
 Sequence diagram elements and API
 """
 
+import sys
 import collections
 from . import sd_action
 
@@ -35,12 +36,20 @@ class DestroyError(ContextError):
 
 
 class Params:
+    __slots__ = ('args', 'kargs')
+
     def __init__(self, args=None, kargs=None):
         self.args = args if args else None
         self.kargs = kargs if kargs else None
 
     def __eq__(self, other):
-        return self.__dict__ == other.__dict__
+        return self.args == other.args and self.kargs == other.kargs
+
+    def __hash__(self):
+        # Arguments can be unhashable, so only what must be equal for the
+        # equal ones is used.
+        return hash((len(self.args) if self.args else 0,
+                     tuple(sorted(self.kargs)) if self.kargs else ()))
 
     def __str__(self):
         s = ''
@@ -53,20 +62,28 @@ class Params:
         return s
 
 
+# Shared by the calls without any argument.
+_NO_PARAMS = Params()
+
+
 class MethodCall:
+    __slots__ = ('obj', 'method', 'params', 'ret_params', 'notes',
+                 'entered')
+
     def __init__(self, obj, method, args, kargs):
         self.obj = obj
         self.method = method
-        self.params = Params(args, kargs)
+        self.params = Params(args, kargs) if args or kargs else _NO_PARAMS
 
         #
         # ret_params can be Params object to specify explicit return value.
         # None means implicit return
         #
         self.ret_params = None
-        self.args = args
-        self.kargs = kargs
-        self.notes = [None, None]
+
+        # (callee, caller) if specified.
+        self.notes = None
+        self.entered = False
 
     def __enter__(self):
         self.obj.enter_call(self)
@@ -87,9 +104,14 @@ class MethodCall:
     def note(self, callee=None, caller=None):
         """
         Specify note for caller/callee side.
+
+        It must be specified before entering the call with 'with', where the
+        call is added with the notes.
         """
         assert callee or caller, 'At least one argument necessary'
-        self.notes[:] = (callee, caller)
+        if self.entered:
+            raise CallError('Note must be specified before entering the call')
+        self.notes = (callee, caller)
         return self
 
     def specify_return_params(self, params):
@@ -106,7 +128,7 @@ class Method:
 
     def __call__(self, *args, **kargs):
         call = MethodCall(self.obj, self, args, kargs)
-        self.obj.invoke_call(call)
+        self.obj.sd.invoke_call(call)
         return call
 
     def __str__(self):
@@ -137,7 +159,7 @@ class Outside(object):
 class Object(object):
     def __init__(self, sd, name, cls=None, stereotype=None, instance_id=None):
         self.sd = sd
-        self.name = name
+        self.name = sys.intern(name) if type(name) is str else name
         self.cls = cls
         self.methods = {}
         self.stereotype = stereotype
@@ -149,10 +171,15 @@ class Object(object):
         self.instance_id = instance_id
 
     def __getattr__(self, name):
-        return self.create_method(name)
+        method = self.create_method(name)
+        # Keep it as an attribute, so the next lookup does not come here.
+        self.__dict__[name] = method
+        return method
 
     def create_method(self, name):
-        method = self.methods.setdefault(name, Method(self, name))
+        method = self.methods.get(name)
+        if method is None:
+            method = self.methods[name] = Method(self, name)
         return method
 
     def __enter__(self):
@@ -201,13 +228,17 @@ class Context(object):
     """
     Context to give API to the user diagram function and it also captures the
     diagram representation.
+
+    'sink' is an object having append() to receive the actions instead of
+    keeping all of them in the list.
     """
-    def __init__(self):
+    def __init__(self, sink=None):
         # Objects used in the diagram.
         self._objects = collections.OrderedDict()
 
         # Capture the sequence of the actions
-        self._sequence = []
+        self._sequence = [] if sink is None else sink
+        self._last_action = None
 
         self._call_stack = []
         self._current_call = None
@@ -237,13 +268,18 @@ class Context(object):
     def object(self, name, cls=None, stereotype=None):
         """Create an object
         """
-        obj = self._objects.setdefault(name,
-                                       Object(self, name, cls=cls,
-                                              stereotype=stereotype,
-                                              instance_id=self._num_objects))
+        obj = self._objects.get(name)
+        if obj is None:
+            obj = self._objects[name] = Object(self, name, cls=cls,
+                                               stereotype=stereotype,
+                                               instance_id=self._num_objects)
         self._num_objects += 1
         return obj
 
+    def _add_action(self, action):
+        self._sequence.append(action)
+        self._last_action = action
+
     def enter_top_object(self, obj):
         if self._call_stack:
             raise TopLevelCallerError('Top level caller cannot be set again')
@@ -279,20 +315,24 @@ class Context(object):
     def return_any_pending_call(self):
         pending_call = self._pending_call
         if pending_call:
-            caller = self._current_call.obj
-            call_action = sd_action.Call(caller,
-                                         pending_call.obj,
-                                         pending_call.method.name,
-                                         pending_call.params,
-                                         pending_call.method.flags,
-                                         pending_call.notes)
-            self._sequence.append(call_action)
-
-            ret_params = self._pending_call.ret_params
+            method = pending_call.method
+            self._sequence.append(sd_action.Call(self._current_call.obj,
+                                                 pending_call.obj,
+                                                 method.name,
+                                                 pending_call.params,
+                                                 method.flags,
+                                                 pending_call.notes))
+
+            ret_params = pending_call.ret_params
             ret_action = (sd_action.Return(ret_params)
                           if ret_params else
                           sd_action.ImplicitReturn())
-            self._add_return_action(self._pending_call, ret_action)
+            if 'd' in method.flags:
+                # Make it invalid to use the object after the destructor
+                # returns.
+                pending_call.obj.valid = False
+            self._sequence.append(ret_action)
+            self._last_action = ret_action
             self._pending_call = None
 
     def _add_return_action(self, call, ret_action):
@@ -301,7 +341,7 @@ class Context(object):
             # Make it invalid to use the object after the destructor returns.
             call.obj.valid = False
 
-        self._sequence.append(ret_action)
+        self._add_action(ret_action)
 
     def enter_call(self, call):
         caller = self._current_call.obj
@@ -309,7 +349,8 @@ class Context(object):
                                 call.method.name, call.params,
                                 call.method.flags, call.notes)
 
-        self._sequence.append(action)
+        self._add_action(action)
+        call.entered = True
 
         self._call_stack.append(self._current_call)
         self._current_call = call
@@ -383,18 +424,17 @@ class Context(object):
 
         self._frag_stack.append(self._current_frag)
         self._current_frag = frag
-        self._sequence.append(
+        self._add_action(
             sd_action.FragBegin(frag.op_name, frag.condition))
 
     def exit_frag(self):
         self.return_any_pending_call()
 
         # Check if there is no action inside frag
-        last_sequence = self._sequence[-1]
-        if isinstance(last_sequence, sd_action.FragBegin):
+        if isinstance(self._last_action, sd_action.FragBegin):
             raise FragError('Empty fragment')
 
-        self._sequence.append(sd_action.FragEnd(self._current_frag.op_name))
+        self._add_action(sd_action.FragEnd(self._current_frag.op_name))
         self._current_frag = self._frag_stack.pop()
 
     def create(self, obj_or_call):
@@ -461,15 +501,15 @@ class Context(object):
 
     def note_over(self, obj, text):
         self.return_any_pending_call()
-        self._sequence.append(sd_action.Note(text, obj=obj))
+        self._add_action(sd_action.Note(text, obj=obj))
 
     def delay(self, text=None):
         self.return_any_pending_call()
-        self._sequence.append(sd_action.Delay(text))
+        self._add_action(sd_action.Delay(text))
 
     def divide(self, text=None):
         self.return_any_pending_call()
-        self._sequence.append(sd_action.Divide(text))
+        self._add_action(sd_action.Divide(text))
 
     def outside(self, from_right=False):
         return Outside(self, from_right)
@@ -1,22 +1,46 @@
 """
 Actions to be captured as sequence.
+
+Actions are compact records with __slots__ and they are not changed once
+created, so they can be compared and hashed by their fields.
 """
+import sys
+
+
+_intern_str = sys.intern
+
+
+def _intern(s):
+    return _intern_str(s) if s.__class__ is str else s
 
 
 class _Action(object):
+    __slots__ = ()
+
+    def _fields(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
     def __eq__(self, other):
-        return self.__dict__ == other.__dict__
+        return (self.__class__ is other.__class__ and
+                self._fields() == other._fields())
+
+    def __hash__(self):
+        return hash((self.__class__,) + self._fields())
 
 
 class Call(_Action):
+    __slots__ = ('caller', 'callee', 'method_name', 'params', 'flags',
+                 'notes')
+
     def __init__(self, caller, callee, method_name, params,
                  flags='', notes=None):
         self.caller = caller
         self.callee = callee
-        self.method_name = method_name
+        self.method_name = (_intern_str(method_name)
+                            if method_name.__class__ is str else method_name)
         self.params = params
         self.flags = flags
-        self.notes = notes if notes else [None, None]
+        self.notes = tuple(notes) if notes else (None, None)
 
     def __repr__(self):
         return 'call from %s to %s::%s(%s) [%s%s]' % (
@@ -25,42 +49,40 @@ class Call(_Action):
             self.method_name,
             self.params,
             self.flags,
-            self.notes)
-
-    def __eq__(self, other):
-        return (self.caller is other.caller and
-                self.caller is other.caller and
-                self.method_name == other.method_name and
-                self.params == other.params and
-                self.flags == other.flags,
-                self.notes == other.notes)
+            list(self.notes))
 
 
 class Return(_Action):
+    __slots__ = ('params',)
+
     def __init__(self, params):
         self.params = params
 
     def __repr__(self):
         return 'return (%s)' % (self.params)
 
-    def __eq__(self, other):
-        return self.params == other.params
-
 
 class ImplicitReturn(_Action):
-    def __init__(self):
-        pass
+    """
+    Stateless, so all of them are the same instance.
+    """
+    __slots__ = ()
+    _instance = None
 
-    def __eq__(self, other):
-        return self.__class__ is other.__class__
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(ImplicitReturn, cls).__new__(cls)
+        return cls._instance
 
     def __repr__(self):
         return 'implicit return'
 
 
 class FragBegin(_Action):
+    __slots__ = ('op_name', 'condition')
+
     def __init__(self, op_name, condition=None):
-        self.op_name = op_name
+        self.op_name = _intern(op_name)
         self.condition = condition
 
     def __repr__(self):
@@ -69,24 +91,20 @@ class FragBegin(_Action):
             s += ' [%s]' % self.condition
         return s
 
-    def __eq__(self, other):
-        return (self.__class__ is other.__class__ and
-                self.__dict__ == other.__dict__)
-
 
 class FragEnd(_Action):
+    __slots__ = ('op_name',)
+
     def __init__(self, op_name):
-        self.op_name = op_name
+        self.op_name = _intern(op_name)
 
     def __repr__(self):
         return '%s end' % self.op_name
 
-    def __eq__(self, other):
-        return (self.__class__ is other.__class__ and
-                self.__dict__ == other.__dict__)
-
 
 class Note(_Action):
+    __slots__ = ('text', 'obj')
+
     def __init__(self, text, obj=None):
         self.text = text
         self.obj = obj
@@ -94,30 +112,22 @@ class Note(_Action):
     def __repr__(self):
         return 'note over %s : %s' % (self.obj, self.text)
 
-    def __eq__(self, other):
-        return (self.__class__ is other.__class__ and
-                self.__dict__ == other.__dict__)
-
 
 class Delay(_Action):
+    __slots__ = ('text',)
+
     def __init__(self, text):
         self.text = text
 
     def __repr__(self):
         return 'delay' + ('({})'.format(self.text) if self.text else '')
 
-    def __eq__(self, other):
-        return (self.__class__ is other.__class__ and
-                self.text == other.text)
-
 
 class Divide(_Action):
+    __slots__ = ('text',)
+
     def __init__(self, text):
         self.text = text
 
     def __repr__(self):
         return 'divide' + ('({})'.format(self.text) if self.text else '')
-
-    def __eq__(self, other):
-        return (self.__class__ is other.__class__ and
-                self.text == other.text)
@@ -0,0 +1,220 @@
+"""
+Spreading renders over multiple PlantUML servers
+"""
+import os
+import time
+import tempfile
+import threading
+import concurrent.futures
+
+DEFAULT_MAX_FAILURES = 3
+DEFAULT_EJECT_TIME = 5.0
+DEFAULT_MAX_EJECT_TIME = 60.0
+
+# Weight of the newest sample in the moving averages.
+_DECAY = 0.3
+_MIN_SUCCESS_RATE = 0.05
+
+
+class _Server:
+    def __init__(self, url):
+        self.url = url
+        self.latency = 0.0
+        self.error_rate = 0.0
+        self.in_flight = 0
+        self.failures = 0
+        self.eject_time = 0.0
+        self.ejected_until = None
+        self.probing = False
+
+    def score(self):
+        # Not measured servers are 0 to be tried first.
+        return ((self.in_flight + 1) * self.latency /
+                max(_MIN_SUCCESS_RATE, 1 - self.error_rate))
+
+
+class ServerPool:
+    """
+    Servers chosen for each request by the observed latency, error rate and
+    the number of requests in flight.
+
+    A server failing 'max_failures' times in a row is ejected for
+    'eject_time' seconds, doubled up to 'max_eject_time' for every failed
+    health probe. Once the time passes, probe(url) is called in background
+    and the server is chosen again only if it returns true.
+
+    If 'hedge_after' seconds is given, the request is also sent to the next
+    server when no response is received by then and the first response is
+    taken. Failed requests are sent to the next server anyway.
+    """
+    def __init__(self, urls, probe, max_failures=DEFAULT_MAX_FAILURES,
+                 eject_time=DEFAULT_EJECT_TIME,
+                 max_eject_time=DEFAULT_MAX_EJECT_TIME, hedge_after=None):
+        self.servers = [_Server(url) for url in urls]
+        self.probe = probe
+        self.max_failures = max_failures
+        self.eject_time = eject_time
+        self.max_eject_time = max_eject_time
+        self.hedge_after = hedge_after
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _start_probe(self, server):
+        server.probing = True
+
+        def probe():
+            try:
+                healthy = self.probe(server.url)
+            except Exception:
+                healthy = False
+            with self._lock:
+                server.probing = False
+                if healthy:
+                    server.ejected_until = None
+                    server.failures = 0
+                    server.error_rate = 0.0
+                    server.eject_time = 0.0
+                else:
+                    self._eject(server)
+        threading.Thread(target=probe, daemon=True).start()
+
+    def _eject(self, server):
+        server.eject_time = min(self.max_eject_time, max(
+            self.eject_time, server.eject_time * 2))
+        server.ejected_until = time.monotonic() + server.eject_time
+
+    def choose(self, exclude=()):
+        """
+        Return the best server not in exclude or None if no more.
+
+        If all of them are ejected, the one to be back first is returned.
+        """
+        with self._lock:
+            now = time.monotonic()
+            candidates = [s for s in self.servers if s not in exclude]
+            healthy = []
+            for s in candidates:
+                if s.ejected_until is None:
+                    healthy.append(s)
+                elif now >= s.ejected_until and not s.probing:
+                    self._start_probe(s)
+            if healthy:
+                server = min(healthy, key=_Server.score)
+            elif candidates:
+                server = min(candidates, key=lambda s: s.ejected_until)
+            else:
+                return None
+            server.in_flight += 1
+            return server
+
+    def _record(self, server, latency, ok):
+        with self._lock:
+            server.in_flight -= 1
+            server.error_rate += _DECAY * ((0.0 if ok else 1.0) -
+                                           server.error_rate)
+            if ok:
+                server.latency = (latency if not server.latency else
+                                  server.latency +
+                                  _DECAY * (latency - server.latency))
+                server.failures = 0
+                return
+            server.failures += 1
+            if (server.failures >= self.max_failures and
+                    server.ejected_until is None):
+                self._eject(server)
+
+    def _attempt(self, server, send, output_file_path):
+        start = time.monotonic()
+        try:
+            size = send(server.url, output_file_path)
+        except Exception:
+            self._record(server, 0, False)
+            raise
+        self._record(server, time.monotonic() - start, True)
+        return size
+
+    def request(self, send, output_file_path=None):
+        """
+        Call send(server_url, output_file_path) with the chosen servers and
+        return its result, the number of bytes written or the image as bytes
+        if output_file_path is None.
+        """
+        if self.hedge_after is None:
+            return self._request_with_failover(send, output_file_path)
+        return self._request_hedged(send, output_file_path)
+
+    def _request_with_failover(self, send, output_file_path):
+        tried = []
+        while True:
+            server = self.choose(tried)
+            tried.append(server)
+            try:
+                return self._attempt(server, send, output_file_path)
+            except Exception:
+                if len(tried) == len(self.servers):
+                    raise
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    4 * len(self.servers))
+            return self._executor
+
+    def _request_hedged(self, send, output_file_path):
+        executor = self._get_executor()
+        tried = []
+        pending = {}
+
+        def submit():
+            server = self.choose(tried)
+            if server is None:
+                return
+            tried.append(server)
+            path = None
+            if output_file_path is not None:
+                output_dir, output_name = os.path.split(output_file_path)
+                fd, path = tempfile.mkstemp(dir=output_dir or None,
+                                            prefix=output_name + '.')
+                os.close(fd)
+            pending[executor.submit(self._attempt, server, send,
+                                    path)] = path
+
+        submit()
+        error = None
+        try:
+            while pending:
+                can_hedge = len(tried) < len(self.servers)
+                done, _ = concurrent.futures.wait(
+                    pending, self.hedge_after if can_hedge else None,
+                    concurrent.futures.FIRST_COMPLETED)
+                if not done:
+                    submit()
+                    continue
+                for future in done:
+                    path = pending.pop(future)
+                    try:
+                        size = future.result()
+                    except Exception as e:
+                        error = e
+                        _remove_file(path)
+                        continue
+                    if path is not None:
+                        os.replace(path, output_file_path)
+                    return size
+                submit()
+            raise error
+        finally:
+            # The slower ones are left running and clean up after.
+            for future, path in pending.items():
+                future.add_done_callback(
+                    lambda f, path=path: _remove_file(path))
+
+
+def _remove_file(path):
+    if path is None:
+        return
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,287 @@
+"""
+Time and memory spent in each phase of a run
+
+Recording is off unless enable() is called, so the phases cost nothing in
+normal runs. The phases of a diagram are recorded in DiagramStats, which is
+returned from worker processes and added to RunStats by add_diagram().
+
+Phases are:
+- discover : finding scripts
+- exec : running scripts
+- parse : calling diagram functions by sd.parse()
+- fingerprint : generating script for incremental run
+- script : generating and writing PlantUML script
+- cache : looking up and storing rendered images
+- encode : encoding script for the server
+- render : rendering and writing images
+
+Peak memory is of the whole process, so it is measured only for the phases
+not overlapping any phase of another thread. The peak of a nested phase is
+not measured either but included in the outer one.
+"""
+import time
+import json
+import threading
+import contextlib
+import tracemalloc
+
+_run = None
+_local = threading.local()
+# The phases of a diagram are also recorded by the threads rendering it.
+_lock = threading.Lock()
+# The number of the running phases and the one measuring the peak memory.
+_num_running = 0
+_measuring = None
+
+
+class _PhaseStats:
+    """
+    Wall time, CPU time of the thread and peak of traced memory increase of
+    the ones measured. See the module docstring.
+    """
+    def __init__(self):
+        self.count = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak = 0
+
+    def add(self, wall, cpu, peak):
+        self.count += 1
+        self.wall += wall
+        self.cpu += cpu
+        if peak is not None:
+            self.peak = max(self.peak, peak)
+
+    def merge(self, other):
+        self.count += other.count
+        self.wall += other.wall
+        self.cpu += other.cpu
+        self.peak = max(self.peak, other.peak)
+
+    def to_dict(self):
+        return {'count': self.count, 'wall': self.wall, 'cpu': self.cpu,
+                'peak': self.peak}
+
+
+class _Stats:
+    def __init__(self):
+        self.phases = {}
+        self.sizes = {}
+
+    def add_phase(self, phase_name, wall, cpu, peak):
+        with _lock:
+            self.phases.setdefault(phase_name, _PhaseStats()).add(wall, cpu,
+                                                                  peak)
+
+    def add_size(self, key, value):
+        with _lock:
+            self.sizes[key] = self.sizes.get(key, 0) + value
+
+
+class DiagramStats(_Stats):
+    """
+    Phases of a diagram. 'wall' is from the start of the first phase to the
+    end of the last one, which is less than the sum of the phases if they
+    ran concurrently.
+    """
+    def __init__(self, name):
+        super().__init__()
+        self.name = name
+        self.wall = 0.0
+        self._start = None
+        self._end = None
+
+    def add_span(self, start, end):
+        with _lock:
+            if self._start is None or start < self._start:
+                self._start = start
+            if self._end is None or end > self._end:
+                self._end = end
+            self.wall = self._end - self._start
+
+    def to_dict(self):
+        return {'name': self.name,
+                'wall': self.wall,
+                'phases': {k: v.to_dict() for k, v in self.phases.items()},
+                'sizes': dict(self.sizes)}
+
+
+class RunStats(_Stats):
+    """
+    Phases of the run itself and the stats of each diagram.
+    """
+    def __init__(self):
+        super().__init__()
+        self.diagrams = []
+
+    def total_phases(self):
+        phases = {}
+        for stats in [self] + self.diagrams:
+            for name, phase_stats in stats.phases.items():
+                phases.setdefault(name, _PhaseStats()).merge(phase_stats)
+        return phases
+
+    def total_sizes(self):
+        sizes = dict(self.sizes)
+        for d in self.diagrams:
+            for key, value in d.sizes.items():
+                sizes[key] = sizes.get(key, 0) + value
+        return sizes
+
+    def to_dict(self):
+        return {'phases': {k: v.to_dict()
+                           for k, v in self.total_phases().items()},
+                'sizes': self.total_sizes(),
+                'diagrams': [d.to_dict() for d in self.diagrams]}
+
+    def report(self, num_slowest=5):
+        lines = ['{:12} {:>6} {:>10} {:>10} {:>10}'.format(
+            'Phase', 'Count', 'Wall(s)', 'CPU(s)', 'Peak(MB)')]
+        for name, p in sorted(self.total_phases().items(),
+                              key=lambda item: -item[1].wall):
+            lines.append('{:12} {:>6} {:>10.3f} {:>10.3f} {:>10.2f}'.format(
+                name, p.count, p.wall, p.cpu, p.peak / (1024 * 1024)))
+        sizes = self.total_sizes()
+        lines.append('Diagrams: {}, Script: {} bytes, URL: {} chars, '
+                     'POST: {} bytes, Rendered: {} bytes'.format(
+                         len(self.diagrams), sizes.get('script_bytes', 0),
+                         sizes.get('url_length', 0),
+                         sizes.get('post_bytes', 0),
+                         sizes.get('rendered_bytes', 0)))
+        slowest = sorted(self.diagrams, key=lambda d: -d.wall)[:num_slowest]
+        if slowest:
+            lines.append('Slowest diagrams:')
+            lines += ['  {:>10.3f} s : {}'.format(d.wall, d.name)
+                      for d in slowest]
+        return '\n'.join(lines)
+
+    def save(self, path):
+        with open(path, 'wt') as f:
+            json.dump(self.to_dict(), f, indent=1)
+
+
+def enable():
+    """
+    Start recording and return RunStats to be filled.
+
+    Memory is traced by tracemalloc, which slows down the run.
+    """
+    global _run, _num_running, _measuring
+    _run = RunStats()
+    _num_running = 0
+    _measuring = None
+    tracemalloc.start()
+    return _run
+
+
+def disable():
+    global _run
+    _run = None
+    tracemalloc.stop()
+
+
+def enabled():
+    return _run is not None
+
+
+def add_diagram(diagram_stats):
+    _run.diagrams.append(diagram_stats)
+
+
+def _current():
+    return getattr(_local, 'diagram', None) or _run
+
+
+@contextlib.contextmanager
+def diagram(name):
+    """
+    Record the phases in the block to DiagramStats, which is given as the
+    target or None if not enabled.
+    """
+    if _run is None:
+        yield None
+        return
+    diagram_stats = DiagramStats(name)
+    outer = getattr(_local, 'diagram', None)
+    _local.diagram = diagram_stats
+    try:
+        yield diagram_stats
+    finally:
+        _local.diagram = outer
+
+
+def bind(fn):
+    """
+    Return the function recording to the DiagramStats of the caller, e.g. to
+    be called by another thread.
+    """
+    diagram_stats = getattr(_local, 'diagram', None)
+    if diagram_stats is None:
+        return fn
+
+    def bound(*args, **kwargs):
+        outer = getattr(_local, 'diagram', None)
+        _local.diagram = diagram_stats
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.diagram = outer
+    return bound
+
+
+class _Phase:
+    def __init__(self, name):
+        self.name = name
+        self.thread = threading.get_ident()
+        # Whether a phase of another thread ran while measuring.
+        self.overlapped = False
+
+    def __enter__(self):
+        global _num_running, _measuring
+        with _lock:
+            if _num_running == 0 and hasattr(tracemalloc, 'reset_peak'):
+                _measuring = self
+                self.memory = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+            elif _measuring is not None and _measuring.thread != self.thread:
+                _measuring.overlapped = True
+            _num_running += 1
+        self.cpu = time.thread_time()
+        self.wall = time.perf_counter()
+
+    def __exit__(self, *exc_args):
+        global _num_running, _measuring
+        end = time.perf_counter()
+        cpu = time.thread_time() - self.cpu
+        peak = None
+        with _lock:
+            _num_running -= 1
+            if _measuring is self:
+                _measuring = None
+                if not self.overlapped:
+                    peak = max(0, tracemalloc.get_traced_memory()[1] -
+                               self.memory)
+        target = _current()
+        target.add_phase(self.name, end - self.wall, cpu, peak)
+        if isinstance(target, DiagramStats):
+            target.add_span(self.wall, end)
+
+
+_NO_PHASE = contextlib.nullcontext() if hasattr(
+    contextlib, 'nullcontext') else contextlib.suppress()
+
+
+def phase(name):
+    """
+    Return the context manager recording the block as the phase.
+    """
+    return _Phase(name) if _run is not None else _NO_PHASE
+
+
+def add_size(key, value):
+    """
+    Add the size, e.g. script_bytes, url_length, post_bytes or
+    rendered_bytes.
+    """
+    if _run is not None:
+        _current().add_size(key, value)
@@ -0,0 +1,331 @@
+"""
+Tracer recording real Python calls to generate sequence diagrams
+
+ex)
+    tracer = napkin.tracer.Tracer(['myapp.service', MyClass])
+    with tracer:
+        run_something()
+
+    napkin.seq_diagram('sd_traced')(tracer.replay)
+"""
+import re
+import sys
+import types
+import threading
+import collections
+
+from . import sd
+
+DEFAULT_MAX_EVENTS = 100000
+
+_CALL = 0
+_RETURN = 1
+_METHOD = object()
+_NOT_NAME_RE = re.compile(r'\W')
+
+
+class TracerError(Exception):
+    pass
+
+
+def _class_codes(cls):
+    codes = set()
+    for value in vars(cls).values():
+        if isinstance(value, (staticmethod, classmethod)):
+            value = value.__func__
+        elif isinstance(value, property):
+            codes.update(f.__code__ for f in (value.fget, value.fset,
+                                              value.fdel) if f)
+            continue
+        if isinstance(value, types.FunctionType):
+            codes.add(value.__code__)
+    return codes
+
+
+class Tracer:
+    """
+    Record the calls of the functions in the targets into a ring buffer.
+
+    'targets' are modules, module names, classes or functions. Functions
+    defined in the modules, including their submodules, methods of the
+    classes and the functions are selected. The decision is made once per
+    code object and where sys.monitoring is available, Python 3.12 or later,
+    the other code is not called back again. Otherwise, sys.setprofile() is
+    used, which calls back for every call. 'backend' can be 'monitoring' or
+    'profile' to choose one.
+
+    At most 'max_events' calls and returns are kept dropping the oldest ones.
+    Only every 'sample_every'th outermost call of the selected functions is
+    recorded with the calls inside it, and the calls nested deeper than
+    'max_depth' are not recorded. Only the thread starting the tracer is
+    traced.
+
+    The participant of a method is its instance or class and the one of a
+    function is its module. The instances are kept alive while any recorded
+    event refers to them, so a new object reusing the id of a freed one is
+    not taken as the same participant.
+    """
+    def __init__(self, targets, max_events=DEFAULT_MAX_EVENTS,
+                 sample_every=1, max_depth=None, backend=None):
+        self.module_names = tuple(
+            t if isinstance(t, str) else t.__name__ for t in targets
+            if isinstance(t, (str, types.ModuleType)))
+        self.codes = set()
+        for t in targets:
+            if isinstance(t, type):
+                self.codes |= _class_codes(t)
+            elif isinstance(t, types.FunctionType):
+                self.codes.add(t.__code__)
+        self.events = collections.deque(maxlen=max_events)
+        self.sample_every = sample_every
+        self.max_depth = max_depth
+        if backend is None:
+            backend = ('monitoring' if hasattr(sys, 'monitoring') else
+                       'profile')
+        self.backend = backend
+
+        self._selected = {}
+        self._participants = {}
+        # (id, class) -> [object, participant, number of events].
+        self._instances = {}
+        self._num_instances = collections.Counter()
+        self._depth = 0
+        self._num_outermost = 0
+        self._recording = True
+        self._running = False
+        self._thread_id = None
+
+    def _is_selected(self, code, frame):
+        if code in self.codes:
+            return True
+        module_name = frame.f_globals.get('__name__', '')
+        return any(module_name == m or module_name.startswith(m + '.')
+                   for m in self.module_names)
+
+    def _decide(self, code, frame):
+        """
+        Return False if not selected, _METHOD if the participant is the
+        instance or class, or the participant of the function.
+        """
+        if not self._is_selected(code, frame):
+            return False
+        if code.co_argcount and code.co_varnames[0] in ('self', 'cls'):
+            return _METHOD
+        return self._module_participant(frame)
+
+    def _select(self, code, frame):
+        selected = self._selected.get(code)
+        if selected is None:
+            selected = self._selected[code] = self._decide(code, frame)
+        return selected
+
+    def _module_participant(self, frame):
+        module_name = frame.f_globals.get('__name__', '?')
+        participant = self._participants.get(module_name)
+        if participant is None:
+            participant = self._participants[module_name] = (
+                _NOT_NAME_RE.sub('_', module_name), None)
+        return participant
+
+    def _instance_participant(self, frame):
+        """
+        Return the participant of the instance or class and the key of it in
+        _instances, which is None for the module.
+        """
+        obj = frame.f_locals.get(frame.f_code.co_varnames[0])
+        if obj is None:
+            return self._module_participant(frame), None
+        cls = obj if isinstance(obj, type) else type(obj)
+        key = (id(obj), cls)
+        instance = self._instances.get(key)
+        if instance is None:
+            self._num_instances[cls] += 1
+            num = self._num_instances[cls]
+            name = cls.__name__[:1].lower() + cls.__name__[1:]
+            instance = self._instances[key] = [
+                obj, (name if num == 1 else '{}_{}'.format(name, num),
+                      cls.__name__), 0]
+        instance[2] += 1
+        return instance[1], key
+
+    def _append(self, event):
+        events = self.events
+        if len(events) == events.maxlen:
+            # Release the instance of the oldest one to be dropped.
+            oldest = events[0]
+            if oldest[0] == _CALL and oldest[4] is not None:
+                instance = self._instances[oldest[4]]
+                instance[2] -= 1
+                if not instance[2]:
+                    del self._instances[oldest[4]]
+        events.append(event)
+
+    def _enter(self, code, frame, selected):
+        depth = self._depth
+        self._depth = depth + 1
+        if depth == 0:
+            self._num_outermost += 1
+            self._recording = (
+                (self._num_outermost - 1) % self.sample_every == 0)
+        if self._recording and (self.max_depth is None or
+                                depth < self.max_depth):
+            if selected is _METHOD:
+                participant, key = self._instance_participant(frame)
+            else:
+                participant, key = selected, None
+            self._append((_CALL, depth, participant, code.co_name, key))
+
+    def _exit(self):
+        if not self._depth:
+            # Started inside the traced function.
+            return
+        self._depth -= 1
+        depth = self._depth
+        if self._recording and (self.max_depth is None or
+                                depth < self.max_depth):
+            self._append((_RETURN, depth))
+
+    #
+    # sys.setprofile
+    #
+    def _make_profile(self):
+        # Bound to local names as it is called for every call and return.
+        get_selected = self._selected.get
+        select = self._select
+        enter = self._enter
+        exit_ = self._exit
+
+        def profile(frame, event, arg):
+            if event == 'call':
+                code = frame.f_code
+                selected = get_selected(code)
+                if selected is None:
+                    selected = select(code, frame)
+                if selected:
+                    enter(code, frame, selected)
+            elif event == 'return':
+                if get_selected(frame.f_code):
+                    exit_()
+        return profile
+
+    #
+    # sys.monitoring
+    #
+    # The events are of all the threads unlike sys.setprofile(), so the ones
+    # of the other threads are ignored.
+    def _on_start(self, code, offset):
+        frame = sys._getframe(1)
+        selected = self._select(code, frame)
+        if not selected:
+            return sys.monitoring.DISABLE
+        if threading.get_ident() == self._thread_id:
+            self._enter(code, frame, selected)
+
+    def _on_return(self, code, offset, retval):
+        if not self._select(code, sys._getframe(1)):
+            return sys.monitoring.DISABLE
+        if threading.get_ident() == self._thread_id:
+            self._exit()
+
+    def _on_unwind(self, code, offset, exception):
+        if (self._selected.get(code) and
+                threading.get_ident() == self._thread_id):
+            self._exit()
+
+    def _start_monitoring(self):
+        monitoring = sys.monitoring
+        tool_id = monitoring.PROFILER_ID
+        try:
+            monitoring.use_tool_id(tool_id, 'napkin')
+        except ValueError as e:
+            raise TracerError(str(e))
+        events = monitoring.events
+        monitoring.register_callback(tool_id, events.PY_START, self._on_start)
+        monitoring.register_callback(tool_id, events.PY_RESUME,
+                                     self._on_start)
+        monitoring.register_callback(tool_id, events.PY_RETURN,
+                                     self._on_return)
+        monitoring.register_callback(tool_id, events.PY_YIELD,
+                                     self._on_return)
+        monitoring.register_callback(tool_id, events.PY_UNWIND,
+                                     self._on_unwind)
+        # Enable again the code disabled by the previous tracer.
+        monitoring.restart_events()
+        monitoring.set_events(
+            tool_id, events.PY_START | events.PY_RESUME | events.PY_RETURN |
+            events.PY_YIELD | events.PY_UNWIND)
+
+    def _stop_monitoring(self):
+        monitoring = sys.monitoring
+        tool_id = monitoring.PROFILER_ID
+        monitoring.set_events(tool_id, 0)
+        for event in (monitoring.events.PY_START,
+                      monitoring.events.PY_RESUME,
+                      monitoring.events.PY_RETURN,
+                      monitoring.events.PY_YIELD,
+                      monitoring.events.PY_UNWIND):
+            monitoring.register_callback(tool_id, event, None)
+        monitoring.free_tool_id(tool_id)
+
+    def start(self):
+        if self._running:
+            raise TracerError('Tracer is already running')
+        self._running = True
+        self._thread_id = threading.get_ident()
+        if self.backend == 'monitoring':
+            self._start_monitoring()
+        else:
+            sys.setprofile(self._make_profile())
+
+    def stop(self):
+        if not self._running:
+            return
+        self._running = False
+        if self.backend == 'monitoring':
+            self._stop_monitoring()
+        else:
+            sys.setprofile(None)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_args):
+        self.stop()
+
+    def replay(self, c):
+        """
+        Add the recorded calls to the context, sd.Context.
+
+        The outermost calls are made from the outside. It can be used as a
+        diagram function. The calls whose callers were dropped from the ring
+        buffer are also made from the outside.
+        """
+        # (depth, call) of the calls not returned yet.
+        stack = []
+
+        def return_to(depth):
+            while stack and stack[-1][0] >= depth:
+                stack.pop()[1].__exit__(None, None, None)
+
+        with c.outside():
+            for event in self.events:
+                if event[0] == _RETURN:
+                    return_to(event[1])
+                    continue
+                _, depth, (name, cls), method_name, _ = event
+                return_to(depth)
+                obj = c.object(name, cls=cls)
+                if method_name == '__init__' and not obj.methods and stack:
+                    call = c.create(obj)
+                else:
+                    call = obj.create_method(method_name)()
+                call.__enter__()
+                stack.append((depth, call))
+            return_to(0)
+
+    def to_context(self):
+        """
+        Return sd.Context of the recorded calls.
+        """
+        return sd.parse(self.replay)
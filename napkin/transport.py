@@ -0,0 +1,102 @@
+"""
+HTTP transport to PlantUML server
+"""
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import util
+
+DEFAULT_TIMEOUT = 60
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+DEFAULT_POOL_SIZE = 10
+
+_RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Rendering has no side effect, so POST is retried as well. The names
+# changed in urllib3 1.26.
+if hasattr(Retry, 'DEFAULT_ALLOWED_METHODS'):
+    _RETRY_METHODS = {'allowed_methods':
+                      Retry.DEFAULT_ALLOWED_METHODS | {'POST'}}
+else:
+    _RETRY_METHODS = {'method_whitelist':
+                      Retry.DEFAULT_METHOD_WHITELIST | {'POST'}}
+_CHUNK_SIZE = 64 * 1024
+_POST_HEADERS = {'Content-Type': 'text/plain; charset=utf-8'}
+
+
+class HttpTransport:
+    """
+    Keep-alive HTTP connections to be shared by all the rendering of a run.
+
+    'timeout' is the read timeout in seconds. Failed connections and the
+    responses with transient error status are retried 'retries' times with
+    exponential backoff, backoff_factor * (2 ** retry_count) seconds.
+    'pool_size' is the number of connections kept per server.
+    """
+    def __init__(self, timeout=DEFAULT_TIMEOUT,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 retries=DEFAULT_RETRIES,
+                 backoff_factor=DEFAULT_BACKOFF_FACTOR,
+                 pool_size=DEFAULT_POOL_SIZE):
+        self.timeout = (connect_timeout, timeout)
+        retry = Retry(total=retries,
+                      backoff_factor=backoff_factor,
+                      status_forcelist=_RETRY_STATUSES,
+                      raise_on_status=False,
+                      **_RETRY_METHODS)
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size,
+                              max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def fetch(self, url, output_file_path=None):
+        """
+        Stream the response body of GET url to output_file_path.
+
+        Return the number of bytes written or the body as bytes if
+        output_file_path is None.
+        """
+        with self.session.get(url, timeout=self.timeout,
+                              stream=True) as response:
+            return _write_response(response, output_file_path)
+
+    def post(self, url, data, output_file_path=None):
+        """
+        Stream the response body of POST url with data, bytes to
+        output_file_path as fetch().
+        """
+        with self.session.post(url, data=data, timeout=self.timeout,
+                               headers=_POST_HEADERS,
+                               stream=True) as response:
+            return _write_response(response, output_file_path)
+
+    def probe(self, url):
+        """
+        Check if GET url responds with 200.
+        """
+        try:
+            with self.session.get(url, timeout=self.timeout, stream=True,
+                                  allow_redirects=False) as response:
+                return response.status_code == 200
+        except requests.RequestException:
+            return False
+
+    def close(self):
+        self.session.close()
+
+
+def _write_response(response, output_file_path):
+    if response.status_code != 200:
+        response.raise_for_status()
+    if output_file_path is None:
+        return response.content
+    size = 0
+    with util.open_atomic(output_file_path) as f:
+        for chunk in response.iter_content(_CHUNK_SIZE):
+            f.write(chunk)
+            size += len(chunk)
+    return size
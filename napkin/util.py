@@ -1,15 +1,55 @@
-import itertools
+import os
+import contextlib
 
 
 def neighbour(seq):
     """
     Generate sequence of adjacent items.
     For example, [1, 2] -> (None, 1, 2), (1, 2, None)
+
+    The sequence is iterated only once, so it can be an iterator.
     """
+    prev = None
     it = iter(seq)
-    it_next = itertools.islice(itertools.chain(iter(seq), [None]), 1, None)
+    for curr in it:
+        break
+    else:
+        return
+    for next in it:
+        yield (prev, curr, next)
+        prev, curr = curr, next
+    yield (prev, curr, None)
 
-    prev = None
-    for curr, next in zip(it, it_next):
-        yield(prev, curr, next)
-        prev = curr
+
+def create_temp_file(path):
+    """
+    Create a temporary file next to path and return its fd and path.
+
+    Unlike tempfile.mkstemp(), the file has the default permissions as the
+    file created by open(), since it is renamed to path.
+    """
+    while True:
+        tmp_path = '{}.{}.tmp'.format(path, os.urandom(4).hex())
+        try:
+            return os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL,
+                           0o666), tmp_path
+        except FileExistsError:
+            continue
+
+
+@contextlib.contextmanager
+def open_atomic(path, mode='wb'):
+    """
+    Open a temporary file which is renamed to path when closed without error.
+
+    An existing file is replaced rather than being overwritten in place, so
+    readers never see a partially written file.
+    """
+    fd, tmp_path = create_temp_file(path)
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
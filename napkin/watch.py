@@ -0,0 +1,251 @@
+"""
+Watch mode regenerating the diagrams of changed scripts
+"""
+import os
+import sys
+import time
+import errno
+import select
+import ctypes
+import ctypes.util
+import traceback
+
+import napkin
+from . import discovery
+from . import manifest
+
+DEFAULT_DEBOUNCE = 0.2
+DEFAULT_POLL_INTERVAL = 1.0
+
+_IN_MODIFY = 0x2
+_IN_ATTRIB = 0x4
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_EVENTS = (_IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM |
+              _IN_MOVED_TO | _IN_CREATE | _IN_DELETE)
+
+
+class _PollingWaiter:
+    def __init__(self, interval):
+        self.interval = interval
+
+    def watch(self, dirs):
+        pass
+
+    def wait(self, timeout=None):
+        """
+        Return whether any event is seen, which is never for polling.
+        """
+        time.sleep(self.interval if timeout is None else timeout)
+        return False
+
+    def close(self):
+        pass
+
+
+class _InotifyWaiter:
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p,
+                                    ctypes.c_uint32)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+    def watch(self, dirs):
+        # Watching the same directory again just returns the same watch.
+        for d in dirs:
+            if self._add_watch(self.fd, os.fsencode(d), _IN_EVENTS) < 0:
+                error = ctypes.get_errno()
+                # Removed since listed, which is seen by the next snapshot.
+                if error != errno.ENOENT:
+                    raise OSError(error, os.strerror(error), d)
+
+    def wait(self, timeout=None):
+        """
+        Return whether any event is seen within timeout.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        try:
+            while os.read(self.fd, 64 * 1024):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _make_waiter(poll_interval):
+    try:
+        return _InotifyWaiter()
+    except (OSError, AttributeError):
+        return _PollingWaiter(poll_interval)
+
+
+class Watch:
+    """
+    Regenerate the diagrams whenever the scripts in srcs change.
+
+    Changes are detected by inotify, or by polling every 'poll_interval'
+    seconds where it is not available, and handled together once no more
+    change is seen for 'debounce' seconds. Only the changed scripts are run
+    again and only the diagrams defined by them are generated incrementally,
+    so the ones whose script is the same are not rendered again. The files of
+    the diagrams no longer defined are removed. Modules imported by the
+    scripts are not reloaded.
+
+    Polling is used instead once inotify fails to watch a directory, e.g.
+    when the limit of the watches is reached.
+
+    'import_script' is called with each script to run, e.g.
+    cli._import_script. 'is_selected' filters the diagrams to generate by the
+    name. The diagrams defined by the scripts are kept in 'registry',
+    Registry, and the ones of the scripts run again replace the old ones.
+    """
+    def __init__(self, srcs, import_script,
+                 output_format=napkin.DEFAULT_FORAMT,
+                 output_dir='.', options=None, jobs=1, ignores=(),
+                 default_ignores=True, is_selected=None,
+                 debounce=DEFAULT_DEBOUNCE,
+                 poll_interval=DEFAULT_POLL_INTERVAL):
+        self.srcs = srcs
+        self.import_script = import_script
+        self.output_format = output_format
+        self.output_dir = output_dir
+        self.options = options
+        self.jobs = jobs
+        self.ignores = ignores
+        self.default_ignores = default_ignores
+        self.is_selected = is_selected if is_selected else (lambda name: True)
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self._waiter = _make_waiter(poll_interval)
+        self._files = {}
+        self._diagrams = {}
+        self.registry = napkin.Registry()
+
+    def _snapshot(self):
+        files = {}
+        dirs = []
+        for root, fnames in discovery.walk(self.srcs, self.ignores,
+                                           self.default_ignores):
+            dirs.append(root)
+            for fname in fnames:
+                try:
+                    st = os.stat(fname)
+                except FileNotFoundError:
+                    continue
+                files[fname] = (st.st_size, st.st_mtime_ns)
+        try:
+            self._waiter.watch(dirs)
+        except OSError as e:
+            print('Cannot watch by inotify, polling instead : {}'.format(e),
+                  file=sys.stderr)
+            self._waiter.close()
+            self._waiter = _PollingWaiter(self.poll_interval)
+        return files
+
+    def _load(self, fname, old_diagrams):
+        """
+        Run the script keeping the old diagrams if it fails.
+        """
+        try:
+            with napkin.registry_scope(napkin.Registry()) as registry:
+                self.import_script(fname)
+            diagrams = list(registry)
+        except Exception:
+            traceback.print_exc()
+            diagrams = old_diagrams
+        for d in diagrams:
+            self.registry.register(d)
+        if diagrams:
+            self._diagrams[fname] = diagrams
+
+    def _unload(self, fname):
+        diagrams = self._diagrams.pop(fname, [])
+        for d in diagrams:
+            self.registry.unregister(d)
+        return diagrams
+
+    def _names(self):
+        return set(d.name for diagrams in self._diagrams.values()
+                   for d in diagrams)
+
+    def _remove_diagrams(self, diagram_names):
+        run_manifest = manifest.Manifest(self.output_dir)
+        for name in diagram_names:
+            if name in run_manifest.entries:
+                print('File removed : {}'.format(
+                    ', '.join(run_manifest.remove(name))))
+        run_manifest.save()
+
+    def refresh(self):
+        """
+        Handle the scripts changed since the last call and return them.
+        """
+        files = self._snapshot()
+        changed = [f for f in files if files[f] != self._files.get(f)]
+        removed = [f for f in self._files if f not in files]
+        self._files = files
+        if not changed and not removed:
+            return []
+
+        old_names = self._names()
+        for fname in removed:
+            self._unload(fname)
+        for fname in changed:
+            self._load(fname, self._unload(fname))
+
+        vanished = old_names - self._names()
+        if vanished and os.path.exists(self.output_dir):
+            self._remove_diagrams(vanished)
+
+        diagrams = [d for fname in changed
+                    for d in self._diagrams.get(fname, [])
+                    if self.is_selected(d.name)]
+        if diagrams:
+            try:
+                napkin.generate(self.output_format, self.output_dir,
+                                options=self.options, jobs=self.jobs,
+                                incremental=True, diagrams=diagrams)
+            except Exception:
+                traceback.print_exc()
+        return changed + removed
+
+    def _wait_for_change(self):
+        snapshot = self._files
+        while snapshot == self._files:
+            self._waiter.wait()
+            snapshot = self._snapshot()
+
+        # Wait until a burst of saves settles.
+        while True:
+            seen = self._waiter.wait(self.debounce)
+            settled = self._snapshot()
+            if not seen and settled == snapshot:
+                return
+            snapshot = settled
+
+    def run(self):
+        """
+        Generate the diagrams and keep regenerating until interrupted.
+        """
+        try:
+            self.refresh()
+            print('Watching for changes. Press Ctrl-C to stop.')
+            while True:
+                self._wait_for_change()
+                self.refresh()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._waiter.close()
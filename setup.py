@@ -36,6 +36,8 @@ setuptools.setup(
         'console_scripts': [
             'napkin = napkin.cli:main',
             'napkin_plantuml = napkin.plantuml_cli:main',
+            'napkin_daemon = napkin.daemon:main',
+            'napkin_client = napkin.client:main',
         ],
     },
 )
@@ -0,0 +1,22 @@
+import pytest
+import napkin
+
+
+@pytest.fixture
+def diagrams(request, monkeypatch, tmpdir):
+    """
+    Register diagrams, sd_0, sd_1, ... to the empty default registry and
+    return tmpdir for the output.
+
+    The number of diagrams is 5 unless given by indirect parametrization,
+    e.g. @pytest.mark.parametrize('diagrams', [3], indirect=True).
+    """
+    monkeypatch.setattr(napkin, 'default_registry', napkin.Registry())
+    for i in range(getattr(request, 'param', 5)):
+        def f(c, i=i):
+            foo = c.object('foo')
+            bar = c.object('bar')
+            with foo:
+                bar.func(i)
+        napkin.seq_diagram('sd_{}'.format(i))(f)
+    return str(tmpdir)
@@ -1,15 +1,109 @@
+import io
+import time
+import threading
+import http.server
 import pytest
+import napkin
 from napkin import gen_plantuml
-from napkin import sd
 
 
 @pytest.fixture
-def check_puml(tmpdir):
+def check_puml():
     def fn(sd_func, exp_lines):
         exp_lines = '@startuml' + exp_lines + '@enduml\n'
-        sd_context = sd.parse(sd_func)
-        puml_file = gen_plantuml.generate(str(tmpdir), 'test', sd_context)[0]
-        with open(puml_file, 'rt') as f:
-            lines = f.read()
-        assert lines == exp_lines
+        assert napkin.render(sd_func)['plantuml'] == exp_lines
+
+        # Streaming the script while parsing generates the same.
+        f = io.StringIO()
+        sink = gen_plantuml.ScriptSink(f)
+        sd_func(sink.sd_context)
+        sink.close()
+        assert f.getvalue() == exp_lines
     return fn
+
+
+class StubServer(http.server.ThreadingHTTPServer):
+    """
+    Stub PlantUML server responding with the request path as an image.
+
+    Responds with 'fail_status' for the first 'num_failures' requests and
+    each response is delayed by 'delay' seconds. The bodies of POST requests
+    are kept in 'bodies'.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _StubHandler)
+        self.url = 'http://127.0.0.1:{}/plantuml'.format(self.server_port)
+        self.requests = []
+        self.bodies = []
+        self.clients = set()
+        self.num_failures = 0
+        self.fail_status = 503
+        self.delay = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+
+class _StubHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        with self.server.lock:
+            self.server.bodies.append(body)
+        self._handle('POST')
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def _handle(self, method):
+        server = self.server
+        with server.lock:
+            server.requests.append((method, self.path))
+            server.clients.add(self.client_address)
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight,
+                                       server.in_flight)
+        try:
+            time.sleep(server.delay)
+            self._respond()
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def _respond(self):
+        server = self.server
+        if server.num_failures > 0:
+            server.num_failures -= 1
+            self.send_response(server.fail_status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = ('IMAGE:' + self.path).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _serve(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def stub_server():
+    yield from _serve(StubServer())
+
+
+@pytest.fixture
+def another_stub_server():
+    yield from _serve(StubServer())
@@ -0,0 +1,84 @@
+import os
+import time
+import asyncio
+import pytest
+import napkin
+from napkin import gen_plantuml_img
+
+# More diagrams than the workers.
+six_diagrams = pytest.mark.parametrize('diagrams', [6], indirect=True)
+
+
+@six_diagrams
+def test_agenerate(diagrams, stub_server):
+    stub_server.delay = 0.1
+    all_generated_files = asyncio.run(napkin.agenerate(
+        'plantuml_png', diagrams, {'server_url': stub_server.url},
+        max_in_flight=3))
+
+    assert all_generated_files == [
+        [os.path.join(diagrams, 'sd_{}.{}'.format(i, ext))
+         for ext in ('puml', 'png')]
+        for i in range(6)]
+    assert len(stub_server.requests) == 6
+    assert stub_server.max_in_flight == 3
+
+
+def test_agenerate_formats_in_flight(diagrams, stub_server):
+    stub_server.delay = 0.05
+    asyncio.run(napkin.agenerate(
+        'plantuml_png,plantuml_svg,plantuml_txt', diagrams,
+        {'server_url': stub_server.url}, max_in_flight=2))
+    assert len(stub_server.requests) == 15
+    assert stub_server.max_in_flight == 2
+
+
+def test_agenerate_request_timeout(diagrams, stub_server):
+    stub_server.delay = 0.5
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(napkin.agenerate(
+            'plantuml_png', diagrams, {'server_url': stub_server.url},
+            request_timeout=0.1))
+
+
+def test_agenerate_no_output_after_timeout(diagrams, stub_server):
+    stub_server.delay = 0.5
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(napkin.agenerate(
+            'plantuml_png', diagrams, {'server_url': stub_server.url},
+            max_in_flight=2, timeout=0.1))
+    files = sorted(os.listdir(diagrams))
+    time.sleep(0.7)
+    assert sorted(os.listdir(diagrams)) == files
+
+
+@six_diagrams
+def test_agenerate_request_timeout_from_start(diagrams, stub_server):
+    # The diagrams waiting for a worker are not timed out.
+    stub_server.delay = 0.3
+    all_generated_files = asyncio.run(napkin.agenerate(
+        'plantuml_png', diagrams, {'server_url': stub_server.url},
+        max_in_flight=2, request_timeout=0.5))
+    assert len(all_generated_files) == 6
+    assert stub_server.max_in_flight == 2
+
+
+@six_diagrams
+def test_agenerate_timeout(diagrams, stub_server):
+    stub_server.delay = 0.2
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(napkin.agenerate(
+            'plantuml_png', diagrams, {'server_url': stub_server.url},
+            max_in_flight=1, timeout=0.3))
+    # Pending ones are cancelled.
+    assert len(stub_server.requests) < 6
+
+
+def test_agenerate_image(tmpdir, stub_server):
+    puml = str(tmpdir.join('sd.puml'))
+    with open(puml, 'wt') as f:
+        f.write('@startuml\nBob -> Alice : hello\n@enduml\n')
+    image = str(tmpdir.join('sd.svg'))
+    asyncio.run(gen_plantuml_img.agenerate_image(puml, image,
+                                                 stub_server.url))
+    assert os.path.exists(image)
@@ -0,0 +1,60 @@
+import os
+import pytest
+import napkin
+from napkin import gen_plantuml_img
+
+
+@pytest.fixture
+def sd_simple(monkeypatch):
+    monkeypatch.setattr(napkin, 'default_registry', napkin.Registry())
+
+    @napkin.seq_diagram()
+    def sd_simple(c):
+        foo = c.object('foo')
+        bar = c.object('bar')
+        with foo:
+            bar.func()
+
+
+def test_parse_formats():
+    assert napkin._parse_formats('plantuml_png, plantuml_svg,plantuml_png') \
+        == ['plantuml_png', 'plantuml_svg']
+    assert napkin._parse_formats(['plantuml']) == ['plantuml']
+    with pytest.raises(ValueError):
+        napkin._parse_formats('plantuml,png')
+
+
+def test_multiple_formats(monkeypatch, tmpdir, stub_server, sd_simple):
+    encoded = []
+    encode = gen_plantuml_img._encode_text_diagram
+
+    def encode_text_diagram(*args):
+        encoded.append(args[0])
+        return encode(*args)
+    monkeypatch.setattr(gen_plantuml_img, '_encode_text_diagram',
+                        encode_text_diagram)
+
+    output_dir = str(tmpdir)
+    napkin.generate('plantuml,plantuml_png,plantuml_svg,plantuml_txt',
+                    output_dir, {'server_url': stub_server.url})
+    assert sorted(os.listdir(output_dir)) == [
+        'sd_simple.png', 'sd_simple.puml', 'sd_simple.svg', 'sd_simple.txt']
+    assert len(encoded) == 1
+
+    paths = sorted(path for _, path in stub_server.requests)
+    assert [p.split('/')[2] for p in paths] == ['png', 'svg', 'txt']
+    assert len(set(p.split('/')[3] for p in paths)) == 1
+
+
+def test_multiple_formats_incremental(tmpdir, stub_server, sd_simple):
+    output_dir = str(tmpdir)
+    options = {'server_url': stub_server.url}
+    napkin.generate('plantuml_png,plantuml_svg', output_dir, options,
+                    incremental=True)
+    napkin.generate('plantuml_png,plantuml_svg', output_dir, options,
+                    incremental=True)
+    assert len(stub_server.requests) == 2
+
+    # Another set of formats is generated again.
+    napkin.generate('plantuml_png', output_dir, options, incremental=True)
+    assert len(stub_server.requests) == 3
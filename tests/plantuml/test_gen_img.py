@@ -1,6 +1,8 @@
 import os
 import napkin
-from napkin.gen_plantuml_img import _encode_text_diagram
+import zlib
+import base64
+from napkin.gen_plantuml_img import _encode_text_diagram, encode_many
 
 DEFAULT_SERVER_URL = 'http://www.plantuml.com/plantuml'
 
@@ -14,6 +16,28 @@ Bob -> Alice : hello
     assert exp == act
 
 
+def _decode(encoded):
+    b64_encoded = encoded.translate(bytes.maketrans(
+        b'0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz-_',
+        b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/'))
+    return zlib.decompress(base64.b64decode(b64_encoded),
+                           -zlib.MAX_WBITS).decode('utf-8')
+
+
+def test_encode_compression_level():
+    text = '@startuml\n' + 'Bob -> Alice : hello\n' * 100 + '@enduml\n'
+    for level in (0, 1, 9):
+        assert _decode(_encode_text_diagram(text, level)) == text
+    assert (len(_encode_text_diagram(text, 9)) <
+            len(_encode_text_diagram(text, 0)))
+
+
+def test_encode_many():
+    texts = ['@startuml\nBob -> Alice : {}\n@enduml'.format(i)
+             for i in range(3)]
+    assert encode_many(texts) == [_encode_text_diagram(t) for t in texts]
+
+
 def test_png_generation(tmpdir):
     fname = os.path.join(str(tmpdir), 'sd')
 
@@ -0,0 +1,145 @@
+import os
+import sys
+import threading
+import pytest
+import napkin
+from napkin import gen_plantuml_img
+from napkin.local_renderer import LocalRenderer, RendererError
+
+# Fake renderer in pipe mode, which echoes the script as the image.
+FAKE_RENDERER = r'''
+import os
+import sys
+
+args = sys.argv[1:]
+delimiter = args[args.index('-pipedelimitor') + 1].encode()
+image_type = [a[2:] for a in args if a.startswith('-t')][0].encode()
+with open(os.path.join(os.path.dirname(__file__), 'started'), 'a') as f:
+    f.write('{}\n'.format(os.getpid()))
+
+out = sys.stdout.buffer
+lines = []
+for line in sys.stdin.buffer:
+    lines.append(line)
+    if line.startswith(b'@enduml'):
+        if b'crash' in b''.join(lines):
+            sys.exit(3)
+        out.write(image_type + b':' + b''.join(lines) + delimiter + b'\n')
+        out.flush()
+        lines = []
+'''
+
+
+@pytest.fixture
+def fake_command(tmpdir):
+    path = tmpdir.join('fake_plantuml.py')
+    path.write(FAKE_RENDERER)
+    return '"{}" {} -pipe -pipedelimitor {{delimiter}} -t{{type}}'.format(
+        sys.executable, path)
+
+
+def num_started(tmpdir):
+    started = tmpdir.join('started')
+    return len(started.readlines()) if started.exists() else 0
+
+
+SCRIPT = '@startuml\nBob -> Alice : hello\n@enduml\n'
+
+
+class TestLocalRenderer(object):
+    def test_render(self, tmpdir, fake_command):
+        renderer = LocalRenderer(fake_command)
+        try:
+            for _ in range(3):
+                assert renderer.render(SCRIPT, 'png') == b'png:' + (
+                    SCRIPT.encode())
+            assert renderer.render(SCRIPT, 'svg') == b'svg:' + (
+                SCRIPT.encode())
+        finally:
+            renderer.close()
+        # Warm workers are reused.
+        assert num_started(tmpdir) == 2
+
+    def test_concurrent_render(self, tmpdir, fake_command):
+        renderer = LocalRenderer(fake_command, num_workers=2)
+        results = []
+
+        def render(i):
+            script = SCRIPT.replace('hello', 'hello{}'.format(i))
+            results.append(renderer.render(script, 'png') ==
+                           b'png:' + script.encode())
+
+        threads = [threading.Thread(target=render, args=(i,))
+                   for i in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        renderer.close()
+        assert results == [True] * 10
+        assert num_started(tmpdir) <= 2
+
+    def test_worker_exit(self, tmpdir, fake_command):
+        renderer = LocalRenderer(fake_command, num_workers=1)
+        with pytest.raises(RendererError):
+            renderer.render(SCRIPT.replace('hello', 'crash'), 'png')
+        assert renderer.render(SCRIPT, 'png') == b'png:' + SCRIPT.encode()
+        renderer.close()
+        assert num_started(tmpdir) == 2
+
+
+@pytest.mark.parametrize('output_format', ['plantuml_png', 'plantuml_svg',
+                                           'plantuml_txt'])
+def test_generate(tmpdir, monkeypatch, fake_command, output_format):
+    monkeypatch.setattr(napkin, 'default_registry', napkin.Registry())
+
+    @napkin.seq_diagram('sd')
+    def f(c):
+        foo = c.object('foo')
+        with foo:
+            foo.func()
+
+    image_type = output_format.split('_')[1]
+    output_dir = str(tmpdir.join('out'))
+    napkin.generate(output_format, output_dir,
+                    {'renderer': 'local', 'local_command': fake_command})
+    with open(os.path.join(output_dir, 'sd.puml'), 'rb') as puml:
+        script = puml.read()
+    with open(os.path.join(output_dir, 'sd.' + image_type), 'rb') as image:
+        assert image.read() == image_type.encode() + b':' + script
+
+
+def test_render_in_memory(fake_command):
+    def f(c):
+        foo = c.object('foo')
+        with foo:
+            foo.func()
+
+    rendered = napkin.render(f, 'plantuml,plantuml_png,plantuml_txt',
+                             {'renderer': 'local',
+                              'local_command': fake_command})
+    script = rendered['plantuml'].encode()
+    assert rendered['plantuml_png'] == b'png:' + script
+    assert rendered['plantuml_txt'] == b'txt:' + script
+
+
+def test_plantuml_cli(tmpdir, monkeypatch, fake_command):
+    from napkin import plantuml_cli
+    puml = str(tmpdir.join('sd.puml'))
+    image = str(tmpdir.join('sd.png'))
+    with open(puml, 'wt') as f:
+        f.write(SCRIPT)
+    monkeypatch.setattr(sys, 'argv', [
+        'napkin_plantuml', '--renderer', 'local',
+        '--local-command', fake_command, puml, image])
+    plantuml_cli.main()
+    with open(image, 'rb') as f:
+        assert f.read() == b'png:' + SCRIPT.encode()
+
+
+def test_get_renderer_shared(fake_command):
+    options = {'renderer': 'local', 'local_command': fake_command}
+    assert (gen_plantuml_img.get_renderer(options) is
+            gen_plantuml_img.get_renderer(dict(options)))
+    assert isinstance(gen_plantuml_img.get_renderer({}),
+                      gen_plantuml_img.ServerRenderer)
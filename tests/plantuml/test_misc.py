@@ -1,3 +1,9 @@
+import io
+import pytest
+from napkin import gen_plantuml
+from napkin import sd
+
+
 class TestDelay:
     def test_without_text(self, check_puml):
         def f(c):
@@ -124,3 +130,56 @@ participant bar
 
 foo -> bar : func()
 """)
+
+
+class TestStreaming:
+    def test_object_defined_later(self):
+        def f(c):
+            foo = c.object('foo')
+            bar = c.object('bar')
+            with foo:
+                bar.func()
+                bar.func2()
+                baz = c.object('baz')
+                baz.func()
+
+        f_out = io.StringIO()
+        sink = gen_plantuml.ScriptSink(f_out)
+        f(sink.sd_context)
+        sink.close()
+        assert f_out.getvalue() == """@startuml
+participant foo
+participant bar
+
+foo -> bar : func()
+participant baz
+foo -> bar : func2()
+foo -> baz : func()
+@enduml
+"""
+
+    def test_generate_streaming(self, tmpdir):
+        def f(c):
+            foo = c.object('foo')
+            with foo:
+                foo.func()
+
+        puml_file = gen_plantuml.generate_streaming(
+            'sd', str(tmpdir), f, {})[0]
+        assert puml_file == str(tmpdir.join('sd.puml'))
+        assert gen_plantuml.generate_script(sd.parse(f)) == (
+            tmpdir.join('sd.puml').read())
+
+    def test_generate_streaming_interrupted(self, tmpdir):
+        def f(c):
+            foo = c.object('foo')
+            with foo:
+                foo.func()
+                raise KeyboardInterrupt()
+
+        tmpdir.join('sd.puml').write('old')
+        with pytest.raises(KeyboardInterrupt):
+            gen_plantuml.generate_streaming('sd', str(tmpdir), f, {})
+        # Not truncated.
+        assert tmpdir.listdir() == [tmpdir.join('sd.puml')]
+        assert tmpdir.join('sd.puml').read() == 'old'
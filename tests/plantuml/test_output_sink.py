@@ -0,0 +1,112 @@
+import os
+import stat
+import tarfile
+import zipfile
+import pytest
+import napkin
+from napkin import cli
+from napkin import output_sink
+
+
+def test_memory_sink():
+    sink = output_sink.MemorySink()
+    sink.write('a.png', b'image')
+    with sink.open('a.puml') as f:
+        f.write('script')
+    assert sink.files == {'a.png': b'image', 'a.puml': b'script'}
+    assert list(sink.files) == ['a.png', 'a.puml']
+
+
+def test_directory_sink(tmpdir):
+    output_dir = str(tmpdir)
+    sink = output_sink.DirectorySink(output_dir)
+    sink.write('a.png', b'image')
+    with sink.open('a.puml') as f:
+        f.write('script')
+        # Not visible until closed.
+        assert not os.path.exists(os.path.join(output_dir, 'a.puml'))
+    assert sorted(os.listdir(output_dir)) == ['a.png', 'a.puml']
+    assert sink.location('a.puml') == os.path.join(output_dir, 'a.puml')
+    with open(os.path.join(output_dir, 'a.puml')) as f:
+        assert f.read() == 'script'
+
+    # The same permissions as the files created by open().
+    umask = os.umask(0)
+    os.umask(umask)
+    mode = os.stat(os.path.join(output_dir, 'a.png')).st_mode
+    assert stat.S_IMODE(mode) == 0o666 & ~umask
+
+
+@pytest.mark.parametrize('bundle, read_names', [
+    ('out.zip', lambda path: zipfile.ZipFile(path).namelist()),
+    ('out.tar', lambda path: tarfile.open(path).getnames()),
+    ('out.tar.gz', lambda path: tarfile.open(path).getnames()),
+])
+def test_bundle(tmpdir, bundle, read_names):
+    path = str(tmpdir.join(bundle))
+    with output_sink.open_bundle(path) as sink:
+        sink.write('a.puml', 'script')
+        sink.write('a.png', b'image')
+        assert sink.location('a.png') == path + ':a.png'
+        # Not visible until closed.
+        assert not os.path.exists(path)
+    assert os.listdir(str(tmpdir)) == [bundle]
+    assert read_names(path) == ['a.puml', 'a.png']
+
+
+def test_bundle_aborted(tmpdir):
+    path = str(tmpdir.join('out.zip'))
+    with pytest.raises(RuntimeError):
+        with output_sink.open_bundle(path) as sink:
+            sink.write('a.puml', 'script')
+            raise RuntimeError()
+    assert not os.listdir(str(tmpdir))
+
+
+def test_unsupported_bundle():
+    with pytest.raises(ValueError):
+        output_sink.open_bundle('out.rar')
+
+
+@pytest.mark.parametrize('diagrams', [3], indirect=True)
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_generate_bundle(tmpdir, capsys, stub_server, diagrams, jobs):
+    path = str(tmpdir.join('out.zip'))
+    with output_sink.open_bundle(path) as sink:
+        napkin.generate('plantuml,plantuml_png', options={
+            'server_url': stub_server.url}, jobs=jobs, sink=sink)
+    assert os.listdir(str(tmpdir)) == ['out.zip']
+    with zipfile.ZipFile(path) as z:
+        assert z.namelist() == ['sd_0.puml', 'sd_0.png', 'sd_1.puml',
+                                'sd_1.png', 'sd_2.puml', 'sd_2.png']
+        assert z.read('sd_0.png').startswith(b'IMAGE:/plantuml/png/')
+    assert capsys.readouterr().out.splitlines()[0] == (
+        'File generated : {0}:sd_0.puml, {0}:sd_0.png'.format(path))
+
+
+def test_generate_bundle_incremental(diagrams):
+    with pytest.raises(ValueError):
+        napkin.generate(incremental=True,
+                        sink=output_sink.MemorySink())
+
+
+def test_cli_bundle(tmpdir, monkeypatch):
+    monkeypatch.setattr(napkin, 'default_registry', napkin.Registry())
+    src = tmpdir.join('src.py')
+    src.write("""import napkin
+
+@napkin.seq_diagram()
+def sd_simple(c):
+    foo = c.object('foo')
+    bar = c.object('bar')
+    with foo:
+        bar.func()
+""")
+    path = str(tmpdir.join('out.tgz'))
+    assert cli.main([str(src), '--bundle', path]) == 0
+    assert tarfile.open(path).getnames() == ['sd_simple.puml']
+
+    with pytest.raises(SystemExit):
+        cli.main([str(src), '--bundle', path, '--incremental'])
+    with pytest.raises(SystemExit):
+        cli.main([str(src), '--bundle', str(tmpdir.join('out.rar'))])
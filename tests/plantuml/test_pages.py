@@ -0,0 +1,157 @@
+import os
+from napkin import sd
+from napkin import gen_plantuml
+from napkin import gen_plantuml_img
+
+_HEADER = """@startuml
+participant foo
+participant bar
+participant baz
+
+"""
+
+
+def _pages(sd_func, **options):
+    return gen_plantuml.generate_pages(sd.parse(sd_func), options)
+
+
+def test_not_paged():
+    def f(c):
+        foo = c.object('foo')
+        bar = c.object('bar')
+        with foo:
+            bar.func()
+
+    context = sd.parse(f)
+    assert not gen_plantuml.is_paged({})
+    assert gen_plantuml.generate_pages(context) == [
+        gen_plantuml.generate_script(context)]
+
+
+def test_page_size_reopens_activations():
+    def f(c):
+        foo = c.object('foo')
+        bar = c.object('bar')
+        baz = c.object('baz')
+        with foo:
+            with bar.func():
+                baz.func2()
+                baz.func3()
+                c.ret()
+
+    assert _pages(f, page_size=3) == [_HEADER + """\
+foo -> bar : func()
+activate bar
+bar -> baz : func2()
+@enduml
+""", _HEADER + """\
+activate bar
+bar -> baz : func3()
+foo <-- bar
+deactivate bar
+@enduml
+"""]
+
+
+def test_page_size_reopens_fragments():
+    def f(c):
+        foo = c.object('foo')
+        bar = c.object('bar')
+        baz = c.object('baz')
+        with foo:
+            with c.loop('forever'):
+                with c.alt():
+                    with c.choice('a'):
+                        bar.func()
+                        baz.func()
+                    with c.choice('b'):
+                        bar.func2()
+
+    assert _pages(f, page_size=4) == [_HEADER + """\
+loop forever
+alt a
+foo -> bar : func()
+end
+end
+@enduml
+""", _HEADER + """\
+loop forever
+alt a
+foo -> baz : func()
+else b
+foo -> bar : func2()
+end
+end
+@enduml
+"""]
+
+
+def test_page_at_divide():
+    def f(c):
+        foo = c.object('foo')
+        bar = c.object('bar')
+        baz = c.object('baz')
+        with foo:
+            c.divide('first')
+            bar.func()
+            c.divide('second')
+            baz.func()
+
+    assert _pages(f, page_at_divide=True) == [_HEADER + """\
+== first ==
+foo -> bar : func()
+@enduml
+""", _HEADER + """\
+== second ==
+foo -> baz : func()
+@enduml
+"""]
+
+
+def _two_pages(c):
+    foo = c.object('foo')
+    bar = c.object('bar')
+    baz = c.object('baz')
+    with foo:
+        bar.func()
+        c.divide()
+        baz.func()
+
+
+def test_write_pages(tmpdir):
+    output_dir = str(tmpdir)
+    files = gen_plantuml.generate('sd', output_dir, sd.parse(_two_pages),
+                                  {'page_at_divide': True})
+    assert files == [os.path.join(output_dir, 'sd_1.puml'),
+                     os.path.join(output_dir, 'sd_2.puml')]
+
+
+def test_write_pages_newpage(tmpdir):
+    output_dir = str(tmpdir)
+    files = gen_plantuml.generate('sd', output_dir, sd.parse(_two_pages),
+                                  {'page_at_divide': True,
+                                   'page_mode': 'newpage'})
+    assert files == [os.path.join(output_dir, 'sd.puml')]
+    with open(files[0], 'rt') as f:
+        assert f.read() == _HEADER + """\
+foo -> bar : func()
+newpage
+====
+foo -> baz : func()
+@enduml
+"""
+
+
+def test_render_pages(tmpdir, stub_server):
+    output_dir = str(tmpdir)
+    files = gen_plantuml_img.generate(
+        'sd', output_dir, sd.parse(_two_pages),
+        {'page_at_divide': True, 'page_mode': 'newpage',
+         'server_url': stub_server.url}, 'png')
+    assert [os.path.basename(f) for f in files] == [
+        'sd.puml', 'sd_1.png', 'sd_2.png']
+    paths = sorted(path for _, path in stub_server.requests)
+    for image_path in files[1:]:
+        with open(image_path, 'rt') as f:
+            assert f.read()[len('IMAGE:'):] in paths
+    assert len(set(paths)) == 2
@@ -0,0 +1,52 @@
+import os
+import napkin
+from napkin.transport import HttpTransport
+
+
+def sd_simple(c):
+    foo = c.object('foo')
+    bar = c.object('bar')
+    with foo:
+        bar.func()
+        c.divide()
+        bar.func2()
+
+
+def test_render_script(monkeypatch, tmpdir):
+    monkeypatch.chdir(tmpdir)
+    assert napkin.render(sd_simple) == {'plantuml': """@startuml
+participant foo
+participant bar
+
+foo -> bar : func()
+====
+foo -> bar : func2()
+@enduml
+"""}
+    assert not os.listdir(str(tmpdir))
+
+
+def test_render_images(monkeypatch, tmpdir, stub_server):
+    monkeypatch.chdir(tmpdir)
+    rendered = napkin.render(sd_simple, 'plantuml_svg,plantuml_png',
+                             {'server_url': stub_server.url})
+    assert list(rendered) == ['plantuml_svg', 'plantuml_png']
+    assert rendered['plantuml_png'].startswith(b'IMAGE:/plantuml/png/')
+    assert rendered['plantuml_svg'].startswith(b'IMAGE:/plantuml/svg/')
+    assert not os.listdir(str(tmpdir))
+
+
+def test_render_pages(stub_server):
+    rendered = napkin.render(sd_simple, ['plantuml', 'plantuml_png'],
+                             {'server_url': stub_server.url,
+                              'http_method': 'post',
+                              'page_at_divide': True})
+    assert len(rendered['plantuml']) == 2
+    assert rendered['plantuml_png'] == [b'IMAGE:/plantuml/png'] * 2
+    assert stub_server.bodies == [p.encode() for p in rendered['plantuml']]
+
+
+def test_fetch_bytes(stub_server):
+    transport = HttpTransport()
+    assert transport.fetch(stub_server.url + '/png/abc') == \
+        b'IMAGE:/plantuml/png/abc'
@@ -0,0 +1,149 @@
+import os
+import time
+import pytest
+from napkin import gen_plantuml_img
+from napkin import util
+from napkin.render_cache import RenderCache
+
+SCRIPT = """@startuml
+Bob -> Alice : hello
+@enduml
+"""
+
+
+def write(path, contents):
+    with open(path, 'wb') as f:
+        f.write(contents)
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class TestRenderCache(object):
+    def test_miss_and_hit(self, tmpdir):
+        cache = RenderCache(str(tmpdir.join('cache')))
+        image = str(tmpdir.join('out.png'))
+        assert not cache.get(SCRIPT, 'png', image)
+
+        write(image, b'png image')
+        cache.put(SCRIPT, 'png', image)
+        os.remove(image)
+
+        assert cache.get(SCRIPT, 'png', image)
+        assert read(image) == b'png image'
+        assert not cache.get(SCRIPT, 'svg', image)
+        assert not cache.get(SCRIPT + ' ', 'png', image)
+
+    @pytest.mark.parametrize('link', [True, False])
+    def test_overwrite_does_not_change_entry(self, tmpdir, link):
+        cache = RenderCache(str(tmpdir.join('cache')), link=link)
+        image = str(tmpdir.join('out.png'))
+        write(image, b'png image')
+        cache.put(SCRIPT, 'png', image)
+        assert cache.get(SCRIPT, 'png', image)
+
+        with util.open_atomic(image) as f:
+            f.write(b"other")
+        assert cache.get(SCRIPT, 'png', image)
+        assert read(image) == b'png image'
+
+    def test_lru_eviction(self, tmpdir):
+        cache = RenderCache(str(tmpdir.join('cache')), max_size=20)
+        image = str(tmpdir.join('out.png'))
+        for i in range(3):
+            write(image, b'0123456789')
+            cache.put(str(i), 'png', image)
+            if i == 1:
+                # Make 0 more recently used than 1.
+                assert cache.get('0', 'png', image)
+
+        assert cache.get('0', 'png', image)
+        assert not cache.get('1', 'png', image)
+        assert cache.get('2', 'png', image)
+
+    def test_lru_eviction_of_loaded(self, tmpdir):
+        cache_dir = str(tmpdir.join('cache'))
+        cache = RenderCache(cache_dir)
+        now = time.time()
+        for i in range(3):
+            cache.store(str(i), 'png', b'0123456789')
+            # 1, 0 and 2 from the least recently used one.
+            mtime = now - (10, 20, 0)[i]
+            os.utime(cache._entry_path(str(i), 'png'), (mtime, mtime))
+
+        # Loaded in the order of mtime.
+        cache = RenderCache(cache_dir, max_size=25)
+        cache.store('3', 'png', b'01234')
+        assert cache.load('1', 'png') is None
+        cache.store('4', 'png', b'01234')
+        assert cache.load('0', 'png') is None
+        assert cache.load('2', 'png') == b'0123456789'
+
+    def test_age_limit(self, tmpdir):
+        cache = RenderCache(str(tmpdir.join('cache')), max_age=60)
+        image = str(tmpdir.join('out.png'))
+        write(image, b'png image')
+        cache.put(SCRIPT, 'png', image)
+
+        path = cache._entry_path(SCRIPT, 'png')
+        old = time.time() - 120
+        os.utime(path, (old, old))
+        assert not cache.get(SCRIPT, 'png', image)
+        assert not os.path.exists(path)
+
+    @pytest.mark.parametrize('link', [True, False])
+    def test_evicted_by_another_process(self, tmpdir, monkeypatch, link):
+        cache = RenderCache(str(tmpdir.join('cache')), link=link)
+        image = str(tmpdir.join('out.png'))
+        write(image, b'png image')
+        cache.put(SCRIPT, 'png', image)
+        path = cache._entry_path(SCRIPT, 'png')
+
+        # Removed right after stat.
+        stat = os.stat
+
+        def stat_and_remove(p, *args, **kwargs):
+            st = stat(p, *args, **kwargs)
+            if p == path:
+                os.remove(path)
+            return st
+        monkeypatch.setattr(os, 'stat', stat_and_remove)
+        assert not cache.get(SCRIPT, 'png', image)
+        monkeypatch.undo()
+
+        # Removed right after being copied.
+        write(image, b'png image')
+        cache.put(SCRIPT, 'png', image)
+        utime = os.utime
+
+        def remove_and_utime(p, *args, **kwargs):
+            if p == path:
+                os.remove(path)
+            return utime(p, *args, **kwargs)
+        monkeypatch.setattr(os, 'utime', remove_and_utime)
+        assert cache.get(SCRIPT, 'png', image)
+        assert read(image) == b'png image'
+        assert cache.load(SCRIPT, 'png') is None
+        assert path not in cache._entries
+
+
+def test_generate_image_from_cache(tmpdir, monkeypatch):
+    puml = str(tmpdir.join('sd.puml'))
+    image = str(tmpdir.join('sd.png'))
+    with open(puml, 'wt') as f:
+        f.write(SCRIPT)
+    cache = gen_plantuml_img.get_render_cache(
+        {'cache_dir': str(tmpdir.join('cache'))})
+    write(image, b'png image')
+    cache.put(SCRIPT, 'png', image)
+    os.remove(image)
+
+    def no_request(url, output_file_path):
+        raise AssertionError('server should not be asked')
+    monkeypatch.setattr(gen_plantuml_img.get_transport({}), 'fetch',
+                        no_request)
+
+    gen_plantuml_img.generate_image(puml, image, cache=cache)
+    assert read(image) == b'png image'
@@ -0,0 +1,164 @@
+import os
+import time
+import threading
+import pytest
+from napkin import gen_plantuml_img
+from napkin.server_pool import ServerPool
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def make_send(delays=None, failing=(), calls=None):
+    def send(server_url, output_file_path):
+        if calls is not None:
+            calls.append(server_url)
+        time.sleep((delays or {}).get(server_url, 0))
+        if server_url in failing:
+            raise IOError('failed')
+        if output_file_path is None:
+            return server_url.encode()
+        with open(output_file_path, 'wb') as f:
+            f.write(server_url.encode())
+        return len(server_url)
+    return send
+
+
+def test_prefers_faster_server(tmpdir):
+    pool = ServerPool(['a', 'b'], probe=None)
+    calls = []
+    send = make_send(delays={'a': 0.02}, calls=calls)
+    out = str(tmpdir.join('out.png'))
+    for _ in range(10):
+        pool.request(send, out)
+    assert calls[:2] == ['a', 'b']
+    assert calls[2:] == ['b'] * 8
+
+
+def test_failover_and_ejection(tmpdir):
+    probed = threading.Event()
+
+    def probe(url):
+        probed.set()
+        return True
+
+    pool = ServerPool(['a', 'b'], probe, max_failures=2, eject_time=0.1)
+    calls = []
+    send = make_send(failing={'a'}, calls=calls)
+    out = str(tmpdir.join('out.png'))
+    for _ in range(4):
+        assert pool.request(send, out) == 1
+        assert read(out) == b'b'
+    # 'a' is ejected after 2 failures.
+    assert calls.count('a') == 2
+    assert pool.servers[0].ejected_until is not None
+
+    # Probed once the ejection time passes and chosen again.
+    time.sleep(0.1)
+    pool.choose()
+    assert probed.wait(1)
+    for _ in range(10):
+        if pool.servers[0].ejected_until is None:
+            break
+        time.sleep(0.01)
+    assert pool.servers[0].ejected_until is None
+
+
+def test_failed_probe_doubles_ejection():
+    pool = ServerPool(['a', 'b'], lambda url: False, max_failures=1,
+                      eject_time=0.05)
+    a = pool.servers[0]
+    pool._record(pool.choose(exclude=[pool.servers[1]]), 0, False)
+    assert a.eject_time == 0.05
+    time.sleep(0.05)
+    pool.choose()
+    for _ in range(10):
+        if not a.probing:
+            break
+        time.sleep(0.01)
+    assert a.eject_time == 0.1
+
+
+def test_all_failed(tmpdir):
+    pool = ServerPool(['a', 'b'], probe=None)
+    with pytest.raises(IOError):
+        pool.request(make_send(failing={'a', 'b'}),
+                     str(tmpdir.join('out.png')))
+
+
+def test_hedge(tmpdir):
+    pool = ServerPool(['a', 'b'], probe=None, hedge_after=0.01)
+    # Measure 'a' as faster to be chosen first.
+    pool.servers[0].latency = 0.001
+    pool.servers[1].latency = 0.002
+    out = str(tmpdir.join('out.png'))
+    start = time.monotonic()
+    assert pool.request(make_send(delays={'a': 0.3}), out) == 1
+    assert time.monotonic() - start < 0.3
+    assert read(out) == b'b'
+
+    # The slower one does not overwrite and its file is removed.
+    time.sleep(0.4)
+    assert read(out) == b'b'
+    assert os.listdir(str(tmpdir)) == ['out.png']
+
+
+def test_hedge_in_memory():
+    pool = ServerPool(['a', 'b'], probe=None, hedge_after=0.01)
+    pool.servers[0].latency = 0.001
+    pool.servers[1].latency = 0.002
+    assert pool.request(make_send(delays={'a': 0.3})) == b'b'
+
+
+def test_renderer_spreads_over_servers(tmpdir, stub_server,
+                                       another_stub_server):
+    options = {'server_url': stub_server.url + ',' + another_stub_server.url}
+    renderer = gen_plantuml_img.get_renderer(options)
+    assert renderer.pool is gen_plantuml_img.get_server_pool(options)
+    for i in range(4):
+        out = str(tmpdir.join('{}.png'.format(i)))
+        renderer.render_to_file('@startuml\nA -> B\n@enduml\n', 'png', out)
+    assert stub_server.requests and another_stub_server.requests
+
+    # Make the failing server preferred until it is ejected.
+    failing, other = renderer.pool.servers
+    other.latency = 10.0
+    stub_server.num_failures = 100
+    stub_server.fail_status = 500
+    for i in range(3):
+        assert failing.ejected_until is None
+        out = str(tmpdir.join('{}.png'.format(i)))
+        renderer.render_to_file('@startuml\nA -> B\n@enduml\n', 'png', out)
+        assert read(out).startswith(b'IMAGE:')
+    assert failing.ejected_until is not None
+    # Failed over without retrying the same server.
+    assert stub_server.num_failures == 100 - 3
+
+    # Not asked once ejected.
+    num_requests = len(stub_server.requests)
+    for i in range(5):
+        out = str(tmpdir.join('{}.png'.format(i)))
+        renderer.render_to_file('@startuml\nA -> B\n@enduml\n', 'png', out)
+        assert read(out).startswith(b'IMAGE:')
+    assert len(stub_server.requests) == num_requests
+
+
+def test_generate_image_shares_pool(tmpdir, stub_server, another_stub_server):
+    server_url = stub_server.url + ',' + another_stub_server.url
+    puml = str(tmpdir.join('sd.puml'))
+    with open(puml, 'wt') as f:
+        f.write('@startuml\nA -> B\n@enduml\n')
+    pool = gen_plantuml_img.get_server_pool({'server_url': server_url})
+    failing, other = pool.servers
+    other.latency = 10.0
+    stub_server.num_failures = 100
+    stub_server.fail_status = 500
+    for i in range(2):
+        out = str(tmpdir.join('{}.png'.format(i)))
+        gen_plantuml_img.generate_image(puml, out, server_url)
+        assert read(out).startswith(b'IMAGE:')
+    # Not retried on the same server and the failures are kept in the pool.
+    assert len(stub_server.requests) == 2
+    assert failing.failures == 2
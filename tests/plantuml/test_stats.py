@@ -0,0 +1,69 @@
+import os
+import pytest
+import napkin
+from napkin import stats
+
+
+def test_render(monkeypatch, tmpdir, stub_server):
+    monkeypatch.setattr(napkin, 'default_registry', napkin.Registry())
+
+    @napkin.seq_diagram()
+    def sd_simple(c):
+        foo = c.object('foo')
+        bar = c.object('bar')
+        with foo:
+            bar.func()
+
+    output_dir = str(tmpdir)
+    options = {'server_url': stub_server.url,
+               'cache_dir': str(tmpdir.join('cache'))}
+    run_stats = stats.enable()
+    try:
+        napkin.generate('plantuml_png', output_dir, options)
+        os.remove(os.path.join(output_dir, 'sd_simple.png'))
+        napkin.generate('plantuml_png', output_dir, options)
+    finally:
+        stats.disable()
+
+    rendered, cached = run_stats.diagrams
+    assert sorted(rendered.phases) == [
+        'cache', 'encode', 'parse', 'render', 'script']
+    assert rendered.sizes['url_length'] == len(
+        'http://127.0.0.1:{}'.format(stub_server.server_port) +
+        stub_server.requests[0][1])
+    assert rendered.sizes['rendered_bytes'] == len(
+        'IMAGE:' + stub_server.requests[0][1])
+    assert sorted(cached.phases) == ['cache', 'parse', 'script']
+    assert cached.sizes['cached_images'] == 1
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_render_formats_and_pages(monkeypatch, tmpdir, stub_server, jobs):
+    monkeypatch.setattr(napkin, 'default_registry', napkin.Registry())
+    for name in ('sd_a', 'sd_b'):
+        @napkin.seq_diagram(name)
+        def f(c):
+            foo = c.object('foo')
+            bar = c.object('bar')
+            with foo:
+                bar.func()
+                c.divide()
+                bar.func2()
+
+    options = {'server_url': stub_server.url, 'page_at_divide': True}
+    run_stats = stats.enable()
+    try:
+        napkin.generate('plantuml_png,plantuml_svg', str(tmpdir), options,
+                        jobs=jobs)
+    finally:
+        stats.disable()
+
+    # Rendered by threads but recorded to the diagrams.
+    for diagram_stats in run_stats.diagrams:
+        assert diagram_stats.phases['encode'].count == 2
+        assert diagram_stats.phases['render'].count == 4
+        assert diagram_stats.sizes['rendered_bytes'] > 0
+    assert not run_stats.phases
+    assert not run_stats.sizes
+    assert run_stats.total_sizes()['rendered_bytes'] == sum(
+        len('IMAGE:' + path) for _, path in stub_server.requests)
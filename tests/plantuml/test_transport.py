@@ -0,0 +1,88 @@
+import pytest
+import requests
+from napkin import gen_plantuml_img
+from napkin.transport import HttpTransport
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class TestHttpTransport(object):
+    def test_keep_alive(self, tmpdir, stub_server):
+        transport = HttpTransport()
+        for i in range(3):
+            out = str(tmpdir.join('{}.png'.format(i)))
+            assert transport.fetch(stub_server.url + '/png/' + str(i),
+                                   out) == len('IMAGE:/plantuml/png/0')
+            assert read(out) == ('IMAGE:/plantuml/png/' + str(i)).encode()
+        assert len(stub_server.requests) == 3
+        assert len(stub_server.clients) == 1
+
+    def test_retry(self, tmpdir, stub_server):
+        stub_server.num_failures = 2
+        transport = HttpTransport(backoff_factor=0)
+        out = str(tmpdir.join('out.png'))
+        transport.fetch(stub_server.url + '/png/abc', out)
+        assert read(out) == b'IMAGE:/plantuml/png/abc'
+        assert len(stub_server.requests) == 3
+
+    def test_post(self, tmpdir, stub_server):
+        stub_server.num_failures = 1
+        transport = HttpTransport(backoff_factor=0)
+        out = str(tmpdir.join('out.png'))
+        assert transport.post(stub_server.url + '/png', b'@startuml',
+                              out) == len('IMAGE:/plantuml/png')
+        assert read(out) == b'IMAGE:/plantuml/png'
+        assert stub_server.requests == [('POST', '/plantuml/png')] * 2
+        assert stub_server.bodies == [b'@startuml'] * 2
+
+    def test_error(self, tmpdir, stub_server):
+        stub_server.num_failures = 1
+        stub_server.fail_status = 400
+        transport = HttpTransport()
+        out = str(tmpdir.join('out.png'))
+        with pytest.raises(requests.HTTPError):
+            transport.fetch(stub_server.url + '/png/abc', out)
+        assert not tmpdir.join('out.png').exists()
+
+
+def test_generate_image_with_shared_transport(tmpdir, stub_server):
+    puml = str(tmpdir.join('sd.puml'))
+    with open(puml, 'wt') as f:
+        f.write('@startuml\nBob -> Alice : hello\n@enduml\n')
+
+    transport = gen_plantuml_img.get_transport({})
+    assert transport is gen_plantuml_img.get_transport({})
+    for ext in ('png', 'svg', 'txt'):
+        image = str(tmpdir.join('sd.' + ext))
+        gen_plantuml_img.generate_image(puml, image, stub_server.url + '/',
+                                        transport=transport)
+        assert read(image).startswith(
+            'IMAGE:/plantuml/{}/'.format(ext).encode())
+    assert len(stub_server.clients) == 1
+
+
+@pytest.mark.parametrize('http_method, post_threshold, method', [
+    ('auto', 4096, 'GET'),
+    ('auto', 10, 'POST'),
+    ('get', 10, 'GET'),
+    ('post', 4096, 'POST'),
+])
+def test_http_method(tmpdir, stub_server, http_method, post_threshold,
+                     method):
+    script = '@startuml\nBob -> Alice : hello\n@enduml\n'
+    renderer = gen_plantuml_img.get_renderer({
+        'server_url': stub_server.url, 'http_method': http_method,
+        'post_threshold': post_threshold})
+    out = str(tmpdir.join('sd.png'))
+    renderer.render_to_file(script, 'png', out)
+    [(request_method, path)] = stub_server.requests
+    assert request_method == method
+    if method == 'POST':
+        assert path == '/plantuml/png'
+        assert stub_server.bodies == [script.encode()]
+    else:
+        assert path.startswith('/plantuml/png/')
+    assert read(out) == ('IMAGE:' + path).encode()
@@ -0,0 +1,80 @@
+import io
+import os
+import threading
+import pytest
+import napkin
+from napkin import client, daemon
+
+SCRIPT = """import napkin
+
+# Run in the current directory of the client.
+with open('runs', 'at') as f:
+    f.write('run\\n')
+
+
+@napkin.seq_diagram()
+def sd_simple(c):
+    foo = c.object('foo')
+    bar = c.object('bar')
+    with foo:
+        bar.func()
+"""
+
+
+@pytest.fixture
+def socket_path(tmpdir):
+    socket_path = str(tmpdir.join('napkin.sock'))
+    server = daemon.Daemon(socket_path)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield socket_path
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def run(argv, socket_path):
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    code = client.run(argv, socket_path, stdout, stderr)
+    return code, stdout.getvalue(), stderr.getvalue()
+
+
+class TestDaemon(object):
+    def test_generate(self, socket_path, tmpdir, monkeypatch):
+        monkeypatch.setattr(napkin, 'default_registry', napkin.Registry())
+        tmpdir.join('a.py').write(SCRIPT)
+        with tmpdir.as_cwd():
+            for _ in range(2):
+                code, out, err = run(['-o', 'out', 'a.py'], socket_path)
+                assert code == 0
+                assert out == ('Load file : a.py\n'
+                               'File generated : out/sd_simple.puml\n')
+
+        assert os.path.exists(str(tmpdir.join('out', 'sd_simple.puml')))
+        # Unchanged script is not run again.
+        assert tmpdir.join('runs').read() == 'run\n'
+        assert len(napkin.default_registry) == 0
+
+    def test_changed_script(self, socket_path, tmpdir):
+        script = tmpdir.join('a.py')
+        script.write(SCRIPT)
+        with tmpdir.as_cwd():
+            run(['-o', 'out', 'a.py'], socket_path)
+            script.write(SCRIPT + '\n')
+            run(['-o', 'out', 'a.py'], socket_path)
+        assert tmpdir.join('runs').read() == 'run\nrun\n'
+
+    def test_error(self, socket_path, tmpdir):
+        code, out, err = run(['--no-such-option'], socket_path)
+        assert code == 2
+        assert 'usage:' in err
+
+        code, out, err = run(['--watch', 'a.py'], socket_path)
+        assert code == 2
+        assert '--watch' in err
+
+
+def test_no_daemon(tmpdir):
+    with pytest.raises(FileNotFoundError):
+        client.run([], str(tmpdir.join('napkin.sock')))
@@ -0,0 +1,142 @@
+import os
+from napkin import discovery
+
+DIAGRAM = """import napkin
+
+
+@napkin.seq_diagram()
+def sd(c):
+    pass
+"""
+
+
+def write(path, contents=DIAGRAM):
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'wt') as f:
+        f.write(contents)
+
+
+def rel(paths, root):
+    return sorted(os.path.relpath(p, root) for p in paths)
+
+
+class TestCollect(object):
+    def test_default_ignores(self, tmpdir):
+        root = str(tmpdir)
+        for path in ('a.py', 'sub/b.py', 'sub/c.txt', '.git/d.py',
+                     'node_modules/pkg/e.py', 'env/lib/f.py',
+                     'x.egg-info/g.py'):
+            write(os.path.join(root, path))
+        write(os.path.join(root, 'env', 'pyvenv.cfg'), '')
+
+        assert rel(discovery.collect_py_files([root]), root) == [
+            'a.py', os.path.join('sub', 'b.py')]
+        assert len(discovery.collect_py_files(
+            [root], default_ignores=False)) == 6
+
+    def test_ignores(self, tmpdir):
+        root = str(tmpdir)
+        for path in ('a.py', 'sub/b.py', 'sub/c_test.py', 'other/sub/d.py'):
+            write(os.path.join(root, path))
+
+        assert rel(discovery.collect_py_files(
+            [root], ignores=['*_test.py', 'other/sub']), root) == [
+            'a.py', os.path.join('sub', 'b.py')]
+
+    def test_file_given(self, tmpdir):
+        path = str(tmpdir.join('.git', 'a.py'))
+        write(path)
+        assert discovery.collect_py_files([path]) == [path]
+
+
+class TestScan(object):
+    def test_scan(self, tmpdir):
+        paths = [str(tmpdir.join('{}.py'.format(i))) for i in range(20)]
+        for i, path in enumerate(paths):
+            write(path, DIAGRAM if i % 2 else 'import os\n')
+        assert discovery.scan(paths) == paths[1::2]
+
+    def test_index(self, tmpdir, monkeypatch):
+        index_file = str(tmpdir.join('index.json'))
+        a = str(tmpdir.join('a.py'))
+        b = str(tmpdir.join('b.py'))
+        write(a)
+        write(b, 'import os\n')
+        assert discovery.find_scripts(
+            [str(tmpdir)], index=discovery.ScanIndex(index_file)) == [a]
+
+        # Only the changed files are read.
+        read = []
+        has_marker = discovery._has_marker
+
+        def spy(path):
+            read.append(path)
+            return has_marker(path)
+        monkeypatch.setattr(discovery, '_has_marker', spy)
+
+        write(b)
+        assert sorted(discovery.find_scripts(
+            [str(tmpdir)], index=discovery.ScanIndex(index_file))) == [a, b]
+        assert read == [b]
+
+
+class TestFindDiagrams(object):
+    def test_names(self, tmpdir):
+        path = str(tmpdir.join('a.py'))
+        write(path, """import napkin
+from napkin import seq_diagram
+
+NAME = 'sd_variable'
+
+
+@napkin.seq_diagram()
+def sd_default(c):
+    pass
+
+
+@napkin.seq_diagram('sd_positional')
+def foo(c):
+    pass
+
+
+@seq_diagram(name='sd_keyword')
+def bar(c):
+    pass
+
+
+@napkin.seq_diagram(NAME)
+def baz(c):
+    pass
+
+
+@other.decorator()
+def not_diagram(c):
+    pass
+""")
+        assert discovery.find_diagrams(path) == [
+            'sd_default', 'sd_positional', 'sd_keyword', None]
+
+    def test_syntax_error(self, tmpdir):
+        path = str(tmpdir.join('a.py'))
+        write(path, DIAGRAM + 'def broken(:\n')
+        assert discovery.find_diagrams(path) == [None]
+
+    def test_index(self, tmpdir, monkeypatch):
+        index_file = str(tmpdir.join('index.json'))
+        a = str(tmpdir.join('a.py'))
+        write(a)
+        assert discovery.list_diagrams(
+            [a], discovery.ScanIndex(index_file)) == [(a, ['sd'])]
+
+        monkeypatch.setattr(discovery, 'find_diagrams', None)
+        assert discovery.list_diagrams(
+            [a], discovery.ScanIndex(index_file)) == [(a, ['sd'])]
+
+
+def test_is_selected():
+    assert discovery.is_selected('sd_foo')
+    assert discovery.is_selected('sd_foo', only=['sd_f*'])
+    assert not discovery.is_selected('sd_bar', only=['sd_f*'])
+    assert not discovery.is_selected('sd_foo', only=['sd_*'],
+                                     exclude=['*foo'])
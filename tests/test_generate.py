@@ -0,0 +1,102 @@
+import os
+import pytest
+import napkin
+from napkin import gen_plantuml
+
+
+class TestJobs(object):
+    def generate(self, output_dir, capsys, jobs):
+        napkin.generate(output_dir=output_dir, jobs=jobs)
+        contents = {}
+        for fname in sorted(os.listdir(output_dir)):
+            with open(os.path.join(output_dir, fname)) as f:
+                contents[fname] = f.read()
+        return capsys.readouterr().out.replace(output_dir, '<DIR>'), contents
+
+    @pytest.mark.parametrize('jobs', [2, 0])
+    def test_same_as_serial(self, diagrams, capsys, jobs):
+        serial = self.generate(os.path.join(diagrams, 'serial'), capsys, 1)
+        parallel = self.generate(os.path.join(diagrams, 'parallel'), capsys,
+                                 jobs)
+        assert serial == parallel
+        assert len(serial[1]) == 5
+        assert serial[0].splitlines()[0] == (
+            'File generated : ' + os.path.join('<DIR>', 'sd_0.puml'))
+
+
+class TestIncremental(object):
+    def test_skip_unchanged(self, diagrams, capsys):
+        napkin.generate(output_dir=diagrams, incremental=True)
+        assert capsys.readouterr().out.endswith(
+            'Generated: 5, Skipped: 0, Removed: 0\n')
+        puml = os.path.join(diagrams, 'sd_0.puml')
+        mtime = os.stat(puml).st_mtime_ns
+
+        napkin.generate(output_dir=diagrams, incremental=True)
+        out = capsys.readouterr().out
+        assert 'File unchanged : {}\n'.format(puml) in out
+        assert out.endswith('Generated: 0, Skipped: 5, Removed: 0\n')
+        assert os.stat(puml).st_mtime_ns == mtime
+
+    def test_changed_and_removed(self, diagrams, capsys):
+        napkin.generate(output_dir=diagrams, incremental=True)
+        capsys.readouterr()
+
+        napkin.default_registry.unregister('sd_0')
+
+        @napkin.seq_diagram('sd_1')
+        def f(c):
+            foo = c.object('foo')
+            with foo:
+                foo.changed()
+
+        napkin.generate(output_dir=diagrams, incremental=True)
+        out = capsys.readouterr().out
+        assert 'File generated : {}\n'.format(
+            os.path.join(diagrams, 'sd_1.puml')) in out
+        assert 'File removed : {}\n'.format(
+            os.path.join(diagrams, 'sd_0.puml')) in out
+        assert out.endswith('Generated: 1, Skipped: 3, Removed: 1\n')
+        assert not os.path.exists(os.path.join(diagrams, 'sd_0.puml'))
+
+    def test_options_change(self, diagrams, capsys):
+        napkin.generate(output_dir=diagrams, incremental=True)
+        napkin.generate(output_dir=diagrams, incremental=True,
+                        options={'server_url': 'http://localhost'})
+        assert capsys.readouterr().out.endswith(
+            'Generated: 5, Skipped: 0, Removed: 0\n')
+
+    @pytest.mark.parametrize('options, iter_name', [
+        ({}, '_iter_script'),
+        ({'page_size': 1}, '_iter_pages'),
+    ])
+    def test_script_generated_once(self, diagrams, monkeypatch, options,
+                                   iter_name):
+        calls = []
+        iter_script = getattr(gen_plantuml, iter_name)
+
+        def counted(*args):
+            calls.append(args)
+            return iter_script(*args)
+        monkeypatch.setattr(gen_plantuml, iter_name, counted)
+        napkin.generate(output_dir=diagrams, options=options,
+                        incremental=True)
+        assert len(calls) == 5
+        with open(os.path.join(diagrams, 'sd_0.puml')) as f:
+            assert f.read().startswith('@startuml\n')
+
+
+class TestSubset(object):
+    def test_generate(self, diagrams, capsys):
+        selected = list(napkin.default_registry)[1:3]
+        napkin.generate(output_dir=diagrams, diagrams=selected)
+        assert sorted(os.listdir(diagrams)) == ['sd_1.puml', 'sd_2.puml']
+
+    def test_incremental_keeps_others(self, diagrams, capsys):
+        napkin.generate(output_dir=diagrams, incremental=True)
+        capsys.readouterr()
+        napkin.generate(output_dir=diagrams, incremental=True,
+                        diagrams=list(napkin.default_registry)[:1])
+        assert capsys.readouterr().out.endswith(
+            'Generated: 0, Skipped: 1, Removed: 0\n')
+        assert os.path.exists(os.path.join(diagrams, 'sd_4.puml'))
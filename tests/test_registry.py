@@ -0,0 +1,83 @@
+import os
+import gc
+import weakref
+import napkin
+
+
+def define(registry, name, method='func'):
+    @napkin.seq_diagram(name, registry=registry)
+    def f(c):
+        foo = c.object('foo')
+        bar = c.object('bar')
+        with foo:
+            getattr(bar, method)()
+    if registry is None:
+        registry = napkin.default_registry
+    return registry.get(name)
+
+
+class TestRegistry(object):
+    def test_replace_same_name(self):
+        registry = napkin.Registry()
+        a = define(registry, 'sd_a')
+        define(registry, 'sd_b')
+        new_a = define(registry, 'sd_a', 'changed')
+        assert [d.name for d in registry] == ['sd_a', 'sd_b']
+        assert registry.get('sd_a') is new_a is not a
+
+    def test_unregister(self):
+        registry = napkin.Registry()
+        a = define(registry, 'sd_a')
+        b = define(registry, 'sd_b')
+        assert registry.unregister('sd_a') is a
+        assert 'sd_a' not in registry
+        assert registry.unregister('sd_a') is None
+
+        # Not the replaced one.
+        define(registry, 'sd_b', 'changed')
+        assert registry.unregister(b) is None
+        assert 'sd_b' in registry
+
+        registry.clear()
+        assert len(registry) == 0
+
+    def test_default_registry(self, monkeypatch):
+        monkeypatch.setattr(napkin, 'default_registry', napkin.Registry())
+        registry = napkin.Registry()
+        with napkin.registry_scope(registry):
+            define(None, 'sd_a')
+        define(None, 'sd_b')
+        assert [d.name for d in registry] == ['sd_a']
+        assert [d.name for d in napkin.default_registry] == ['sd_b']
+
+    def test_generate(self, monkeypatch, tmpdir):
+        monkeypatch.setattr(napkin, 'default_registry', napkin.Registry())
+        define(None, 'sd_default')
+        registry = napkin.Registry()
+        define(registry, 'sd_a')
+        output_dir = str(tmpdir)
+        napkin.generate(output_dir=output_dir, registry=registry)
+        assert os.listdir(output_dir) == ['sd_a.puml']
+
+    def test_reload_keeps_memory_flat(self, tmpdir):
+        registry = napkin.Registry()
+        output_dir = str(tmpdir)
+        refs = []
+        for i in range(1000):
+            # As running a script again, which makes a new module globals.
+            module_globals = {'napkin': napkin, 'registry': registry}
+            exec("""@napkin.seq_diagram('sd', registry=registry)
+def f(c):
+    foo = c.object('foo')
+    bar = c.object('bar')
+    with foo:
+        bar.func()
+""", module_globals)
+            refs.append(weakref.ref(registry.get('sd').sd_func))
+            if i % 100 == 0:
+                napkin.generate(output_dir=output_dir, registry=registry)
+        del module_globals
+        gc.collect()
+        assert len(registry) == 1
+        assert sum(ref() is not None for ref in refs) == 1
+        assert napkin._diagrams_to_generate == []
@@ -442,6 +442,30 @@ class TestNote(TestBase):
             sd_action.Return(sd.Params(('val',))),
         ])
 
+    def test_call_specific_entered(self):
+        c = sd.Context()
+
+        foo = c.object('foo')
+        bar = c.object('bar')
+        with foo:
+            with bar.func().note('before'):
+                pass
+            call = bar.func2()
+            with call:
+                # Too late as the call was already added.
+                with pytest.raises(sd.CallError):
+                    call.note('inside')
+            with pytest.raises(sd.CallError):
+                call.note('after')
+
+        self.check(c, [
+            sd_action.Call(foo, bar, 'func', sd.Params(),
+                           notes=['before', None]),
+            sd_action.ImplicitReturn(),
+            sd_action.Call(foo, bar, 'func2', sd.Params()),
+            sd_action.ImplicitReturn(),
+        ])
+
 
 class TestOutside(TestBase):
     def test_fail_as_callee(self):
@@ -452,3 +476,54 @@ class TestOutside(TestBase):
             with pytest.raises(sd.CallError,
                                match='Cannot be invoked to the outside'):
                 outside.func()
+
+
+class TestSink(TestBase):
+    def test_actions_to_sink(self):
+        actions = []
+        c = sd.Context(sink=actions)
+
+        foo = c.object('foo')
+        bar = c.object('bar')
+        with foo:
+            bar.func()
+
+        assert c._sequence is actions
+        self.check(c, [
+            sd_action.Call(foo, bar, 'func', sd.Params()),
+            sd_action.ImplicitReturn(),
+        ])
+
+    def test_empty_frag_with_sink(self):
+        class Sink:
+            def append(self, action):
+                pass
+
+        c = sd.Context(sink=Sink())
+        foo = c.object('foo')
+        with foo:
+            with pytest.raises(sd.FragError):
+                with c.opt():
+                    pass
+
+
+class TestRecording(object):
+    def test_method_reused(self):
+        c = sd.Context()
+        foo = c.object('foo')
+        assert foo.func is foo.func
+        assert foo.create_method('func') is foo.func
+        assert list(foo.methods) == ['func']
+
+    def test_object_reused(self):
+        c = sd.Context()
+        foo = c.object('foo')
+        assert c.object('foo') is foo
+
+    def test_no_params_shared(self):
+        c = sd.Context()
+        foo = c.object('foo')
+        bar = c.object('bar')
+        with foo:
+            assert bar.func().params is bar.func2().params
+            assert bar.func3(1).params == sd.Params((1,))
@@ -0,0 +1,45 @@
+import sys
+from napkin import sd
+from napkin import sd_action
+
+
+class TestAction(object):
+    def setup_method(self):
+        c = sd.Context()
+        self.foo = c.object('foo')
+        self.bar = c.object('bar')
+
+    def test_call_equality(self):
+        call = sd_action.Call(self.foo, self.bar, 'func', sd.Params((1,)))
+        assert call == sd_action.Call(self.foo, self.bar, 'func',
+                                      sd.Params((1,)))
+        assert call != sd_action.Call(self.foo, self.foo, 'func',
+                                      sd.Params((1,)))
+        assert call != sd_action.Call(self.foo, self.bar, 'func',
+                                      sd.Params((1,)), notes=['note', None])
+        assert call != sd_action.Return(sd.Params((1,)))
+
+    def test_hash(self):
+        actions = [
+            sd_action.Call(self.foo, self.bar, 'func', sd.Params(([1],))),
+            sd_action.Call(self.foo, self.bar, 'func', sd.Params(([1],))),
+            sd_action.ImplicitReturn(),
+            sd_action.ImplicitReturn(),
+            sd_action.Return(sd.Params(kargs={'a': 1})),
+            sd_action.Return(sd.Params(kargs={'a': 1})),
+            sd_action.FragBegin('opt', 'cond'),
+            sd_action.FragEnd('opt'),
+            sd_action.Note('text', obj=self.foo),
+            sd_action.Delay(None),
+            sd_action.Divide('text'),
+        ]
+        assert len(set(actions)) == 8
+
+    def test_compact(self):
+        assert not hasattr(sd_action.FragEnd('opt'), '__dict__')
+        assert sd_action.ImplicitReturn() is sd_action.ImplicitReturn()
+
+    def test_interned_names(self):
+        name = ''.join(['fu', 'nc'])
+        call = sd_action.Call(self.foo, self.bar, name, sd.Params())
+        assert call.method_name is sys.intern('func')
@@ -0,0 +1,92 @@
+import os
+import json
+import time
+import threading
+import pytest
+import napkin
+from napkin import stats
+
+
+@pytest.fixture
+def run_stats():
+    run_stats = stats.enable()
+    yield run_stats
+    stats.disable()
+
+
+def test_disabled(diagrams):
+    assert not stats.enabled()
+    with stats.diagram('sd') as diagram_stats:
+        with stats.phase('parse'):
+            pass
+    assert diagram_stats is None
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_generate(diagrams, run_stats, jobs):
+    napkin.generate(output_dir=diagrams, jobs=jobs)
+    assert [d.name for d in run_stats.diagrams] == [
+        'sd_{}'.format(i) for i in range(5)]
+    for d in run_stats.diagrams:
+        assert sorted(d.phases) == ['parse', 'script']
+        assert d.sizes['script_bytes'] == os.path.getsize(
+            os.path.join(diagrams, d.name + '.puml'))
+
+    phases = run_stats.total_phases()
+    assert phases['parse'].count == 5
+    assert phases['script'].wall > 0
+
+
+def test_incremental(diagrams, run_stats):
+    napkin.generate(output_dir=diagrams, incremental=True)
+    napkin.generate(output_dir=diagrams, incremental=True)
+    assert [sorted(d.phases) for d in run_stats.diagrams[5:]] == [
+        ['fingerprint', 'parse']] * 5
+
+
+def test_report(diagrams, run_stats, tmpdir):
+    with stats.phase('exec'):
+        pass
+    napkin.generate(output_dir=diagrams)
+    report = run_stats.report(num_slowest=2)
+    assert report.splitlines()[0].split() == [
+        'Phase', 'Count', 'Wall(s)', 'CPU(s)', 'Peak(MB)']
+    assert 'Diagrams: 5' in report
+    assert len(report.split('Slowest diagrams:\n')[1].splitlines()) == 2
+
+    path = str(tmpdir.join('stats.json'))
+    run_stats.save(path)
+    with open(path) as f:
+        saved = json.load(f)
+    assert saved['phases']['exec']['count'] == 1
+    assert saved['sizes']['script_bytes'] > 0
+    assert len(saved['diagrams']) == 5
+
+
+def test_concurrent_phases(run_stats):
+    started = threading.Barrier(2)
+
+    def render():
+        with stats.phase('render'):
+            started.wait()
+            data = bytearray(1024 * 1024)
+            time.sleep(0.1)
+            del data
+
+    with stats.diagram('sd') as diagram_stats:
+        with stats.phase('parse'):
+            data = bytearray(1024 * 1024)
+            del data
+        threads = [threading.Thread(target=stats.bind(render))
+                   for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert diagram_stats.phases['parse'].peak > 1000 * 1000
+    # Overlapped by the other thread, so not measured.
+    assert diagram_stats.phases['render'].count == 2
+    assert diagram_stats.phases['render'].peak == 0
+    # Not the sum of the phases.
+    assert 0.1 <= diagram_stats.wall < 0.2
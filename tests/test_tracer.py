@@ -0,0 +1,189 @@
+import sys
+import threading
+import pytest
+from napkin import tracer
+from napkin import gen_plantuml
+
+BACKENDS = ['profile'] + (['monitoring'] if hasattr(sys, 'monitoring') else [])
+
+
+class Repo(object):
+    def load(self, key):
+        return self._read(key)
+
+    def _read(self, key):
+        return len(key)
+
+
+class Service(object):
+    def __init__(self, repo):
+        self.repo = repo
+
+    def handle(self, key):
+        return helper(self.repo.load(key))
+
+
+class Untraced(object):
+    # Not traced though in the same module.
+    def run(self, service):
+        return service.handle('abc')
+
+
+def helper(value):
+    return value + 1
+
+
+def script(t):
+    return gen_plantuml._generate_script(t.to_context(), '').splitlines()
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request):
+    return request.param
+
+
+def test_trace(backend):
+    t = tracer.Tracer([Repo, Service, helper], backend=backend)
+    with t:
+        repo = Repo()
+        Untraced().run(Service(repo))
+
+    assert script(t) == [
+        '@startuml',
+        'participant "service:Service" as service',
+        'participant "repo:Repo" as repo',
+        'participant tests_test_tracer',
+        '',
+        '[-> service : __init__()',
+        '[-> service : handle()',
+        'activate service',
+        'service -> repo : load()',
+        'activate repo',
+        'repo -> repo : _read()',
+        'deactivate repo',
+        'service -> tests_test_tracer : helper()',
+        'deactivate service',
+        '@enduml']
+
+
+def test_create_and_instances(backend):
+    class Factory(object):
+        def make(self):
+            return [Service(Repo()), Service(Repo())]
+
+    t = tracer.Tracer([Factory, Service], backend=backend)
+    with t:
+        Factory().make()
+    lines = script(t)
+    assert 'create service' in lines
+    assert 'create service_2' in lines
+    assert 'participant "service_2:Service" as service_2' in lines
+
+
+def test_exception(backend):
+    t = tracer.Tracer([Repo, Service], backend=backend)
+    with t:
+        with pytest.raises(TypeError):
+            Service(Repo()).handle(None)
+        Service(Repo()).handle('a')
+    depths = [e[1] for e in t.events]
+    assert depths == [0, 0, 0, 1, 2, 2, 1, 0, 0, 0, 0, 1, 2, 2, 1, 0]
+
+
+def test_sample_and_depth(backend):
+    service = Service(Repo())
+    t = tracer.Tracer([Repo, Service], sample_every=3, max_depth=2,
+                      backend=backend)
+    with t:
+        for _ in range(6):
+            service.handle('a')
+    # 2 of 6 calls without _read().
+    assert [e[3] for e in t.events if e[0] == tracer._CALL] == [
+        'handle', 'load'] * 2
+
+
+def test_ring_buffer(backend):
+    service = Service(Repo())
+    t = tracer.Tracer([Repo, Service], max_events=7, backend=backend)
+    with t:
+        for _ in range(3):
+            service.handle('a')
+    # The oldest ones are dropped, so it starts with a return.
+    assert t.events[0] == (tracer._RETURN, 0)
+    assert script(t)[-8:] == [
+        '[-> service : handle()', 'activate service',
+        'service -> repo : load()', 'activate repo',
+        'repo -> repo : _read()', 'deactivate repo', 'deactivate service',
+        '@enduml']
+
+
+class Tree(object):
+    def top(self):
+        for _ in range(3):
+            self.mid()
+
+    def mid(self):
+        self.leaf()
+
+    def leaf(self):
+        pass
+
+
+def test_ring_buffer_mid_tree(backend):
+    t = tracer.Tracer([Tree], max_events=8, backend=backend)
+    with t:
+        Tree().top()
+    # Dropped in the middle of top(), so it starts with leaf() at depth 2.
+    assert t.events[0][:2] == (tracer._CALL, 2)
+    # The ones whose callers were dropped are called from the outside.
+    assert script(t)[3:] == [
+        '[-> tree : leaf()',
+        '[-> tree : mid()', 'activate tree',
+        'tree -> tree : leaf()', 'deactivate tree',
+        '@enduml']
+
+
+class Freed(object):
+    def f(self):
+        pass
+
+
+class Other(object):
+    def g(self):
+        pass
+
+
+def test_freed_instances(backend):
+    t = tracer.Tracer([Freed, Other], max_events=8, backend=backend)
+    with t:
+        for _ in range(3):
+            Freed().f()
+            Other().g()
+    # Not taken as the freed ones of the same id.
+    assert [e[2][0] for e in t.events if e[0] == tracer._CALL] == [
+        'freed_2', 'other_2', 'freed_3', 'other_3']
+    # Only the ones referred by the events are kept.
+    assert sorted(p for _, p, _ in t._instances.values()) == [
+        ('freed_2', 'Freed'), ('freed_3', 'Freed'), ('other_2', 'Other'),
+        ('other_3', 'Other')]
+
+
+def test_other_threads(backend):
+    service = Service(Repo())
+    t = tracer.Tracer([Repo, Service], backend=backend)
+    with t:
+        service.handle('a')
+        thread = threading.Thread(target=service.handle, args=('b',))
+        thread.start()
+        thread.join()
+    # Only the thread starting the tracer.
+    assert [e[:2] for e in t.events] == [
+        (tracer._CALL, 0), (tracer._CALL, 1), (tracer._CALL, 2),
+        (tracer._RETURN, 2), (tracer._RETURN, 1), (tracer._RETURN, 0)]
+
+
+def test_running_twice(backend):
+    t = tracer.Tracer([Repo], backend=backend)
+    with t:
+        with pytest.raises(tracer.TracerError):
+            t.start()
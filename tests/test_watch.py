@@ -0,0 +1,129 @@
+import os
+import errno
+import ctypes
+import threading
+import pytest
+import napkin
+from napkin import cli
+from napkin import watch
+
+SCRIPT = """import napkin
+
+
+@napkin.seq_diagram('{name}')
+def f(c):
+    foo = c.object('foo')
+    bar = c.object('bar')
+    with foo:
+        bar.{method}()
+"""
+
+
+def write(path, name, method='func', contents=None):
+    if contents is None:
+        contents = SCRIPT.format(name=name, method=method)
+    with open(path, 'wt') as f:
+        f.write(contents)
+    # Make the change visible even within the timestamp granularity.
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+
+@pytest.fixture
+def srcs(monkeypatch, tmpdir):
+    monkeypatch.setattr(napkin, 'default_registry', napkin.Registry())
+    src_dir = tmpdir.mkdir('src')
+    write(str(src_dir.join('a.py')), 'sd_a')
+    write(str(src_dir.join('b.py')), 'sd_b')
+    return str(src_dir)
+
+
+@pytest.fixture
+def w(srcs, tmpdir):
+    w = watch.Watch([srcs], cli._import_script,
+                    output_dir=str(tmpdir.join('out')))
+    yield w
+    w._waiter.close()
+
+
+class TestRefresh(object):
+    def test_only_changed(self, w, srcs, capsys):
+        assert len(w.refresh()) == 2
+        assert capsys.readouterr().out.endswith(
+            'Generated: 2, Skipped: 0, Removed: 0\n')
+        assert w.refresh() == []
+
+        write(os.path.join(srcs, 'a.py'), 'sd_a', method='changed')
+        assert w.refresh() == [os.path.join(srcs, 'a.py')]
+        out = capsys.readouterr().out
+        assert 'sd_b' not in out
+        assert out.endswith('Generated: 1, Skipped: 0, Removed: 0\n')
+        assert len(w.registry) == 2
+
+    def test_same_script_skipped(self, w, srcs, capsys):
+        w.refresh()
+        write(os.path.join(srcs, 'a.py'), None,
+              contents=SCRIPT.format(name='sd_a', method='func') + '\n\n')
+        w.refresh()
+        assert capsys.readouterr().out.endswith(
+            'Generated: 0, Skipped: 1, Removed: 0\n')
+
+    def test_removed(self, w, srcs, capsys):
+        w.refresh()
+        write(os.path.join(srcs, 'a.py'), 'sd_renamed')
+        os.remove(os.path.join(srcs, 'b.py'))
+        w.refresh()
+        assert sorted(os.listdir(w.output_dir)) == [
+            '.napkin_manifest.json', 'sd_renamed.puml']
+        assert [d.name for d in w.registry] == [
+            'sd_renamed']
+
+    def test_error_keeps_diagrams(self, w, srcs, capsys):
+        w.refresh()
+        write(os.path.join(srcs, 'a.py'), None,
+              contents=SCRIPT.format(name='sd_a', method='func') + 'error\n')
+        w.refresh()
+        assert 'NameError' in capsys.readouterr().err
+        assert sorted(d.name for d in w.registry) == [
+            'sd_a', 'sd_b']
+        assert os.path.exists(os.path.join(w.output_dir, 'sd_a.puml'))
+
+
+@pytest.mark.parametrize('polling', [False, True])
+def test_wait_for_change(w, srcs, polling):
+    if polling:
+        w._waiter = watch._PollingWaiter(0.02)
+    w.debounce = 0.05
+    w.refresh()
+    path = os.path.join(srcs, 'a.py')
+    timer = threading.Timer(0.1, write, (path, 'sd_a', 'changed'))
+    timer.start()
+    w._wait_for_change()
+    timer.join()
+    assert w._snapshot() != w._files
+
+
+def test_polling_fallback(monkeypatch):
+    def unavailable():
+        raise OSError('not available')
+    monkeypatch.setattr(watch, '_InotifyWaiter', unavailable)
+    waiter = watch._make_waiter(0.01)
+    assert isinstance(waiter, watch._PollingWaiter)
+    assert not waiter.wait()
+
+
+def test_inotify_watch_failure(w, srcs, capsys):
+    if not isinstance(w._waiter, watch._InotifyWaiter):
+        pytest.skip('inotify not available')
+    with pytest.raises(OSError):
+        w._waiter.watch([os.path.join(srcs, 'a.py', 'not_dir')])
+
+    def add_watch(fd, path, mask):
+        ctypes.set_errno(errno.ENOSPC)
+        return -1
+    w._waiter._add_watch = add_watch
+    w.poll_interval = 0.01
+    w.refresh()
+    assert 'polling instead' in capsys.readouterr().err
+    assert isinstance(w._waiter, watch._PollingWaiter)
+    assert len(w.registry) == 2